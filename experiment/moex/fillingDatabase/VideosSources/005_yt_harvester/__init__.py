@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from config import get_path
+
+API_URL = 'https://www.googleapis.com/youtube/v3/'
+# Стоимость вызовов в единицах квоты
+# https://developers.google.com/youtube/v3/determine_quota_cost
+QUOTA_COST = {'search': 100, 'channels': 1, 'playlistItems': 1, 'videos': 1}
+# Максимум id и элементов на страницу у YouTube Data API
+MAX_RESULTS = 50
+WORKERS = 8
+
+# Финансовые каналы, которые мы смотрим
+CHANNELS = [
+    'UCQfwKTJdCmiA6cXAY0PNRJw',
+    'UCf6kozNejHoQuFhBDB8cfxA',
+]
+
+
+class YouTubeClient:
+    """
+    Клиент YouTube Data API: считает квоту и кэширует ответы по ETag
+    """
+
+    def __init__(self, api_key, base_url=API_URL, cache_path=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.cache_path = cache_path
+        self.cache = {}
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, encoding='utf-8') as f:
+                self.cache = json.load(f)
+        self.quota = {}
+        self.calls = 0
+        self.not_modified = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _session(self):
+        # requests.Session не потокобезопасна, у каждого потока своя
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def get(self, method, **params):
+        """
+        Вызов метода API
+        :param method: channels, playlistItems, videos, search
+        :param params: параметры запроса без key
+        :return: dict ответа
+        """
+        key = method + '?' + '&'.join('%s=%s' % item for item in sorted(params.items()))
+        cached = self.cache.get(key)
+        headers = {'If-None-Match': cached['etag']} if cached else {}
+        r = self._session().get(self.base_url + method, params=dict(params, key=self.api_key), headers=headers)
+        with self.lock:
+            # Квота списывается и за ответ 304
+            self.quota[method] = self.quota.get(method, 0) + QUOTA_COST.get(method, 1)
+            self.calls += 1
+            if r.status_code == 304:
+                self.not_modified += 1
+                return cached['body']
+        r.raise_for_status()
+        body = r.json()
+        if body.get('etag'):
+            with self.lock:
+                self.cache[key] = {'etag': body['etag'], 'body': body}
+        return body
+
+    def quota_used(self):
+        return sum(self.quota.values())
+
+    def save_cache(self):
+        if not self.cache_path:
+            return
+        tmp = self.cache_path + '.tmp'
+        with self.lock, open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.cache, f, ensure_ascii=False)
+        os.replace(tmp, self.cache_path)
+
+
+def batches(items, size=MAX_RESULTS):
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def uploads_playlists(client, channel_ids):
+    """
+    Плейлисты загрузок каналов, по 50 каналов за вызов (1 единица вместо 100 у search)
+    :param client:
+    :param channel_ids:
+    :return: {канал: плейлист загрузок}
+    """
+    playlists = {}
+    for batch in batches(channel_ids):
+        r = client.get('channels', part='contentDetails', id=','.join(batch), maxResults=MAX_RESULTS)
+        for item in r.get('items', []):
+            playlists[item['id']] = item['contentDetails']['relatedPlaylists']['uploads']
+    return playlists
+
+
+def channel_video_ids(client, playlist_id, known=frozenset()):
+    """
+    Листаю плейлист загрузок по nextPageToken.
+    Загрузки идут от новых к старым, поэтому на первой уже известной странице останавливаюсь.
+    :param client:
+    :param playlist_id:
+    :param known: id уже собранных видео
+    :return: список новых id
+    """
+    ids, token = [], None
+    while True:
+        params = {'part': 'contentDetails', 'playlistId': playlist_id, 'maxResults': MAX_RESULTS}
+        if token:
+            params['pageToken'] = token
+        r = client.get('playlistItems', **params)
+        page = [item['contentDetails']['videoId'] for item in r.get('items', [])]
+        fresh = [video_id for video_id in page if video_id not in known]
+        ids.extend(fresh)
+        token = r.get('nextPageToken')
+        if not token or len(fresh) < len(page):
+            return ids
+
+
+def video_details(client, video_ids):
+    """
+    Подробности видео, по 50 id за вызов
+    :return: список элементов videos.list
+    """
+    items = []
+    for batch in batches(video_ids):
+        r = client.get('videos', part='snippet,statistics,contentDetails', id=','.join(batch),
+                       maxResults=MAX_RESULTS)
+        items.extend(r.get('items', []))
+    return items
+
+
+def known_videos(out_path):
+    if not os.path.exists(out_path):
+        return set()
+    with open(out_path, encoding='utf-8') as f:
+        return {json.loads(line)['id'] for line in f if line.strip()}
+
+
+def harvest(client, channel_ids, out_path, workers=WORKERS):
+    """
+    Собираю новые видео каналов: каналы обрабатываются параллельно, подробности запрашиваются пачками по 50.
+    Видео канала дописываются в out_path (JSON Lines) только все вместе: channel_video_ids останавливается
+    на первой известной странице, и после сбоя на середине канала (например, кончилась квота)
+    более старые видео иначе не собрались бы никогда
+    :param client: YouTubeClient
+    :param channel_ids:
+    :param out_path:
+    :param workers: потоков
+    :return: число новых видео
+    """
+    known = known_videos(out_path)
+    playlists = uploads_playlists(client, channel_ids)
+    written = 0
+    write_lock = threading.Lock()
+
+    def collect(playlist):
+        nonlocal written
+        items = video_details(client, channel_video_ids(client, playlist, known))
+        with write_lock, open(out_path, 'a', encoding='utf-8') as f:
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+            written += len(items)
+
+    with ThreadPoolExecutor(workers) as pool:
+        futures = [pool.submit(collect, playlist) for playlist in playlists.values()]
+    client.save_cache()
+    # Ошибка канала поднимается после того, как остальные каналы записаны
+    for future in futures:
+        future.result()
+    return written
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    print('YouTube API Собираю видео финансовых каналов')
+    if '--stub' in argv:
+        from .stub import serve
+
+        server = serve()
+        client = YouTubeClient('stub', 'http://127.0.0.1:%s/youtube/v3/' % server.server_port,
+                               get_path('data', 'yt_cache_stub.json'))
+        channels = list(server.channels)
+        out_path = get_path('data', 'videos_stub.jsonl')
+    else:
+        from creds import yt_api_key
+
+        server = None
+        client = YouTubeClient(yt_api_key, cache_path=get_path('data', 'yt_cache.json'))
+        channels = CHANNELS
+        out_path = get_path('data', 'videos.jsonl')
+    try:
+        written = harvest(client, channels, out_path)
+    except requests.RequestException as e:
+        logging.exception(e)
+        written = 0
+    finally:
+        if server:
+            server.shutdown()
+    print('Новых видео: %s, вызовов: %s (304: %s), квота: %s %s' % (
+        written, client.calls, client.not_modified, client.quota_used(), client.quota))
+
+
+if __name__ == '__main__':
+    main()
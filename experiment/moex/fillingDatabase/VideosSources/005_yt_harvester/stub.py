@@ -0,0 +1,94 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Локальная заглушка YouTube Data API: channels, playlistItems и videos с ETag
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = parse.urlparse(self.path)
+        method = url.path.rsplit('/', 1)[-1]
+        params = {k: v[0] for k, v in parse.parse_qs(url.query).items()}
+        handler = getattr(self.server, 'api_' + method, None)
+        if handler is None:
+            self.send_error(404)
+            return
+        with self.server.lock:
+            self.server.hits[method] = self.server.hits.get(method, 0) + 1
+        body = handler(params)
+        if body is None:
+            # Так YouTube отвечает на исчерпанную квоту
+            self.send_error(403, 'quotaExceeded')
+            return
+        body['etag'] = hashlib.md5(json.dumps(body, sort_keys=True).encode()).hexdigest()
+        if self.headers.get('If-None-Match') == body['etag']:
+            self.send_response(304)
+            self.end_headers()
+            return
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, channels=20, videos=230, port=0):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.lock = threading.Lock()
+        self.hits = {}
+        # Сколько ещё вызовов videos отвечать, None - без ограничения
+        self.videos_quota = None
+        # Видео каждого канала от новых к старым
+        self.channels = {'UC%04d' % c: ['v%04d_%05d' % (c, v) for v in range(videos, 0, -1)] for c in range(channels)}
+
+    def add_video(self, channel):
+        uploads = self.channels[channel]
+        uploads.insert(0, '%s_%05d' % (uploads[-1].rsplit('_', 1)[0], len(uploads) + 1))
+
+    def api_channels(self, params):
+        ids = params['id'].split(',')
+        assert len(ids) <= 50
+        return {'items': [{'id': c, 'contentDetails': {'relatedPlaylists': {'uploads': 'UU' + c[2:]}}}
+                          for c in ids if c in self.channels]}
+
+    def api_playlistItems(self, params):
+        uploads = self.channels['UC' + params['playlistId'][2:]]
+        size = min(int(params.get('maxResults', 5)), 50)
+        start = int(params.get('pageToken', 0))
+        body = {'items': [{'contentDetails': {'videoId': v}} for v in uploads[start:start + size]]}
+        if start + size < len(uploads):
+            body['nextPageToken'] = str(start + size)
+        return body
+
+    def api_videos(self, params):
+        ids = params['id'].split(',')
+        assert len(ids) <= 50
+        with self.lock:
+            if self.videos_quota is not None:
+                if self.videos_quota <= 0:
+                    return None
+                self.videos_quota -= 1
+        return {'items': [{'id': v, 'snippet': {'title': 'Видео %s' % v}, 'statistics': {'viewCount': '0'}}
+                          for v in ids]}
+
+
+def serve(channels=20, videos=230, port=0):
+    """
+    Запускаю заглушку в фоновом потоке
+    :return: StubServer, адрес в server_port, остановка через shutdown()
+    """
+    server = StubServer(channels, videos, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,49 @@
+import json
+import os
+import tempfile
+import unittest
+
+import requests
+
+from . import YouTubeClient, harvest
+from .stub import serve
+
+
+class HarvestTests(unittest.TestCase):
+    """
+    Запуск из VideosSources: python -m unittest 005_yt_harvester.tests
+    """
+
+    def setUp(self):
+        self.server = serve(channels=3, videos=120)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:%s/youtube/v3/' % self.server.server_port
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.out_path = os.path.join(tmp.name, 'videos.jsonl')
+
+    def harvest(self):
+        return harvest(YouTubeClient('stub', self.url), list(self.server.channels), self.out_path, workers=2)
+
+    def ids(self):
+        with open(self.out_path, encoding='utf-8') as f:
+            return [json.loads(line)['id'] for line in f]
+
+    def test_only_new_videos(self):
+        self.assertEqual(self.harvest(), 360)
+        self.assertEqual(self.harvest(), 0)
+        self.server.add_video('UC0001')
+        self.assertEqual(self.harvest(), 1)
+        self.assertEqual(sorted(self.ids()), sorted(v for uploads in self.server.channels.values() for v in uploads))
+
+    def test_resume_after_quota(self):
+        # Каналу нужно 3 вызова videos: квоты хватит на один канал и часть второго
+        self.server.videos_quota = 5
+        with self.assertRaises(requests.HTTPError):
+            self.harvest()
+        self.assertEqual(len(self.ids()), 120)
+        self.server.videos_quota = None
+        self.assertEqual(self.harvest(), 240)
+        ids = self.ids()
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(len(ids), 360)
@@ -1,3 +1,227 @@
-from django.contrib import admin
+import datetime as dt
 
-# Register your models here.
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min, OuterRef, Q, Subquery
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from .models import Price, PriceAlert, Share
+
+# Больше строк не считаю: COUNT(*) по всей таблице котировок слишком дорог
+COUNT_LIMIT = 10000
+CURSOR_VAR = 'cursor'
+SHARE_VAR = 'share__id__exact'
+
+
+def estimated_count(queryset, limit=COUNT_LIMIT):
+    """
+    Оценка числа строк: для всей таблицы в PostgreSQL - статистика планировщика,
+    иначе COUNT с ограничением limit
+    :return: (число, точное ли)
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] > limit:
+            return int(row[0]), False
+    count = queryset.order_by()[:limit + 1].count()
+    return min(count, limit), count <= limit
+
+
+class EstimatedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        return estimated_count(self.object_list)[0]
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Список котировок страницами по ключу вместо OFFSET: следующая страница начинается после последней строки
+    текущей, поэтому глубина листания не влияет на скорость.
+    С фильтром по акции строки идут по убыванию даты по индексу (share, date), без фильтра - по убыванию id.
+    Иерархия дат показывается только вместе с фильтром по акции.
+    """
+
+    def __init__(self, request, model, *args, **kwargs):
+        # Остальные аргументы передаются как есть: их набор меняется между версиями Django (search_help_text в 4.0)
+        self.cursor = request.GET.get(CURSOR_VAR)
+        self.by_share = SHARE_VAR in request.GET
+        if not self.by_share:
+            if 'date_hierarchy' in kwargs:
+                kwargs['date_hierarchy'] = None
+            else:
+                # list_display, list_display_links, list_filter, date_hierarchy, ...
+                args = args[:3] + (None,) + args[4:]
+        super().__init__(request, model, *args, **kwargs)
+        # Ссылки фильтров и иерархии дат ведут на первую страницу
+        self.params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_ordering(self, request, queryset):
+        return ['-date', '-pk'] if self.by_share else ['-pk']
+
+    def _after_cursor(self, queryset):
+        try:
+            if self.by_share:
+                timestamp, pk = self.cursor.split('_')
+                date = dt.datetime.fromtimestamp(int(timestamp), dt.timezone.utc)
+                return queryset.filter(Q(date__lt=date) | Q(date=date, pk__lt=int(pk)))
+            return queryset.filter(pk__lt=int(self.cursor))
+        except (ValueError, OverflowError):
+            return queryset
+
+    def get_results(self, request):
+        # Прошлое закрытие для изменения - только для строк страницы, по индексу (share, date)
+        previous = Price.objects.filter(share=OuterRef('share'), date__lt=OuterRef('date')).order_by('-date')
+        queryset = self.queryset.annotate(previous=Subquery(previous.values('price')[:1]))
+        if self.cursor:
+            queryset = self._after_cursor(queryset)
+        rows = list(queryset[:self.list_per_page + 1])
+        self.result_list = rows[:self.list_per_page]
+        self.next_cursor = None
+        if len(rows) > self.list_per_page:
+            last = self.result_list[-1]
+            self.next_cursor = '%d_%d' % (last.date.timestamp(), last.pk) if self.by_share else str(last.pk)
+        self.result_count, self.exact_count = estimated_count(self.queryset)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = EstimatedCountPaginator(self.queryset, self.list_per_page)
+        self.first_page_url = self.get_query_string(remove=[CURSOR_VAR]) if self.cursor else None
+        self.next_page_url = self.get_query_string({CURSOR_VAR: self.next_cursor}) if self.next_cursor else None
+
+
+@admin.register(Share)
+class ShareAdmin(admin.ModelAdmin):
+    list_display = ('ticker', 'name', 'isin', 'currency', 'price_scale', 'prices')
+    search_fields = ('ticker', 'name', 'isin')
+    ordering = ('ticker',)
+    prepopulated_fields = {'slug': ('ticker',)}
+
+    @admin.display(description='Котировки')
+    def prices(self, obj):
+        url = reverse('admin:db_price_changelist') + '?%s=%s' % (SHARE_VAR, obj.pk)
+        return format_html('<a href="{}">свечи</a>', url)
+
+
+def _price_column(name, description):
+    # Цены хранятся в единицах 10^-price_scale акции
+    @admin.display(description=description)
+    def column(self, obj):
+        return getattr(obj, name) / 10 ** obj.share.price_scale
+    return column
+
+
+def refresh_rollups(share_id, first, last):
+    # rollups тянет numpy, в админке импортирую по требованию
+    from .rollups import refresh_rollups
+    refresh_rollups(share_id, first, last)
+
+
+def _refresh(bounds):
+    for row in bounds:
+        refresh_rollups(row['share_id'], row['first'], row['last'])
+
+
+@admin.register(Price)
+class PriceAdmin(admin.ModelAdmin):
+    list_display = ('share', 'date', 'open_price', 'high_price', 'low_price', 'close_price', 'volume', 'change')
+    list_select_related = ('share',)
+    # Фильтр строится по таблице акций, без DISTINCT по котировкам
+    list_filter = ('share',)
+    date_hierarchy = 'date'
+    autocomplete_fields = ('share',)
+    sortable_by = ()
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    list_per_page = 100
+    actions = ('delete_prices', 'refresh_price_rollups')
+
+    open_price = _price_column('open', 'open')
+    high_price = _price_column('high', 'high')
+    low_price = _price_column('low', 'low')
+    close_price = _price_column('price', 'close')
+
+    @admin.display(description='change, %')
+    def change(self, obj):
+        if not getattr(obj, 'previous', None):
+            return None
+        return round((obj.price / obj.previous - 1.0) * 100, 2)
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Стандартное удаление загружает каждый объект, здесь удаление одним запросом
+        actions.pop('delete_selected', None)
+        return actions
+
+    @staticmethod
+    def _bounds(queryset):
+        return list(queryset.order_by().values('share_id').annotate(first=Min('date'), last=Max('date')))
+
+    @admin.action(description='Удалить выбранные котировки одним запросом', permissions=['delete'])
+    def delete_prices(self, request, queryset):
+        bounds = self._bounds(queryset)
+        deleted, _ = queryset.order_by().delete()
+        _refresh(bounds)
+        self.message_user(request, 'Удалено свечей: %s' % deleted, messages.SUCCESS)
+
+    @admin.action(description='Пересчитать свёртки по выбранным котировкам', permissions=['change'])
+    def refresh_price_rollups(self, request, queryset):
+        bounds = self._bounds(queryset)
+        _refresh(bounds)
+        self.message_user(request, 'Свёртки пересчитаны по %s акциям' % len(bounds), messages.SUCCESS)
+
+    def save_model(self, request, obj, form, change):
+        previous = Price.objects.filter(pk=obj.pk).values('share_id', 'date').first() if change else None
+        super().save_model(request, obj, form, change)
+        refresh_rollups(obj.share_id, obj.date, obj.date)
+        if previous and (previous['share_id'], previous['date']) != (obj.share_id, obj.date):
+            refresh_rollups(previous['share_id'], previous['date'], previous['date'])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_rollups(obj.share_id, obj.date, obj.date)
+
+
+@admin.register(PriceAlert)
+class PriceAlertAdmin(admin.ModelAdmin):
+    list_display = ('share', 'kind', 'direction', 'threshold', 'indicator', 'window', 'level', 'user', 'active',
+                    'triggered_at', 'triggered_value')
+    list_select_related = ('share', 'user')
+    list_filter = ('active', 'kind')
+    autocomplete_fields = ('share',)
+    raw_id_fields = ('user',)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    actions = ('deactivate_alerts',)
+    readonly_fields = ('level', 'reference', 'triggered_at', 'triggered_value')
+    # Уровень попадает в индекс движка один раз при создании, поэтому условие потом не меняется
+    condition_fields = ('user', 'share', 'kind', 'direction', 'threshold', 'indicator', 'window')
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return self.readonly_fields
+        # Сработавшее или отключённое уведомление обратно не включается: его уже нет в индексе
+        return self.readonly_fields + self.condition_fields + (() if obj.active else ('active',))
+
+    @admin.action(description='Отключить выбранные уведомления', permissions=['change'])
+    def deactivate_alerts(self, request, queryset):
+        updated = queryset.filter(active=True).update(active=False)
+        self.message_user(request, 'Отключено уведомлений: %s' % updated, messages.SUCCESS)
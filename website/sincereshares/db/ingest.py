@@ -0,0 +1,96 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from .models import Price
+from .rollups import refresh_rollups
+from .signals import candles_ingested
+from .units import ensure_scale, from_units, to_units
+
+BATCH_SIZE = 5000
+# db.Price хранит дневные свечи
+CANDLE = dt.timedelta(days=1)
+
+
+def _announce(share_ids, times, ends, units, scales):
+    # Подписчики (уведомления о ценах) видят пачку только после фиксации транзакции
+    units = np.asarray(units, dtype=np.int64).reshape(-1, 4)
+    scale = np.asarray(scales, dtype=np.float64)
+    batch = {
+        'share_id': np.asarray(share_ids, dtype=np.int64),
+        'time': np.asarray(times, dtype='datetime64[s]'),
+        'end': np.asarray(ends, dtype='datetime64[s]'),
+        'high': from_units(units[:, 1], scale),
+        'low': from_units(units[:, 2], scale),
+        'close': from_units(units[:, 3], scale),
+    }
+    transaction.on_commit(lambda: candles_ingested.send(sender=Price, batch=batch))
+
+
+@transaction.atomic
+def ingest_candles(share, candles):
+    """
+    Записываю свечи ISS (begin, open, high, low, close, volume) в db.Price.
+    Свечи за тот же интервал заменяются, затем пересчитываются затронутые свёртки.
+    :param share: db.Share
+    :param candles: список словарей или DataFrame
+    :return: число записанных свечей
+    """
+    frame = pd.DataFrame(candles)
+    if frame.empty:
+        return 0
+    frame['begin'] = pd.to_datetime(frame['begin']).dt.tz_localize('UTC')
+    frame = frame.sort_values('begin').drop_duplicates('begin', keep='last')
+    first, last = frame['begin'].iloc[0].to_pydatetime(), frame['begin'].iloc[-1].to_pydatetime()
+
+    ohlc = frame[['open', 'high', 'low', 'close']].to_numpy(dtype=np.float64)
+    scale = ensure_scale(share.pk, ohlc, {share.pk: share.price_scale})
+    share.price_scale = scale
+    units = to_units(ohlc, scale).tolist()
+    volume = np.rint(frame['volume'].to_numpy(dtype=np.float64)).astype(np.int64).tolist()
+
+    Price.objects.filter(share=share, date__gte=first, date__lte=last).delete()
+    Price.objects.bulk_create(
+        (Price(share=share, date=begin, open=o, high=h, low=lo, price=c, volume=v)
+         for begin, (o, h, lo, c), v in zip(frame['begin'].dt.to_pydatetime(), units, volume)),
+        batch_size=BATCH_SIZE)
+    refresh_rollups(share.pk, first, last)
+    begin = frame['begin'].dt.tz_localize(None)
+    # ISS отдаёт и конец свечи, без него свеча длится сутки от начала
+    end = pd.to_datetime(frame['end']) if 'end' in frame else begin + CANDLE
+    _announce([share.pk] * len(frame), begin.to_numpy(), end.to_numpy(), units, scale)
+    return len(frame)
+
+
+@transaction.atomic
+def ingest_board_day(day, rows, shares, scales):
+    """
+    Записываю итоги дня по всем акциям режима торгов одной вставкой
+    :param day: date
+    :param rows: строки ISS history (SECID, OPEN, LOW, HIGH, CLOSE, VOLUME)
+    :param shares: {тикер: share_id}
+    :param scales: {share_id: price_scale}, обновляется при увеличении scale
+    :return: список share_id, по которым записаны свечи
+    """
+    begin = dt.datetime.combine(day, dt.time.min, tzinfo=dt.timezone.utc)
+    prices = []
+    for row in rows:
+        share_id = shares.get(row['SECID'])
+        # Бумаги без сделок в этот день в истории есть, свечей для них нет
+        if share_id is None or not row['VOLUME'] or row['CLOSE'] is None:
+            continue
+        ohlc = [row['OPEN'], row['HIGH'], row['LOW'], row['CLOSE']]
+        o, h, lo, c = to_units(ohlc, ensure_scale(share_id, ohlc, scales)).tolist()
+        prices.append(Price(share_id=share_id, date=begin, open=o, high=h, low=lo, price=c,
+                            volume=int(row['VOLUME'])))
+    written = [price.share_id for price in prices]
+    Price.objects.filter(share_id__in=written, date__gte=begin, date__lt=begin + CANDLE).delete()
+    Price.objects.bulk_create(prices, batch_size=BATCH_SIZE)
+    prices.sort(key=lambda price: price.share_id)
+    _announce([price.share_id for price in prices], [begin.replace(tzinfo=None)] * len(prices),
+              [(begin + CANDLE).replace(tzinfo=None)] * len(prices),
+              [(price.open, price.high, price.low, price.price) for price in prices],
+              [scales[price.share_id] for price in prices])
+    return written
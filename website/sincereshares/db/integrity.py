@@ -0,0 +1,142 @@
+import datetime as dt
+
+import numpy as np
+from django.db.models import Count, Max, Min
+
+from .loader import load_prices
+from .models import Price, Share
+
+# Сколько строк db.Price читается за один проход
+SCAN_ROWS = 500000
+# День считается торговым, если торговалась хотя бы такая доля акций, обращавшихся в этот день
+SESSION_QUORUM = 0.5
+
+GAP = 'gap'
+DUPLICATE = 'duplicate'
+OHLC = 'ohlc'
+ZERO_VOLUME = 'zero_volume'
+CHECKS = (GAP, DUPLICATE, OHLC, ZERO_VOLUME)
+
+
+def _bounds(shares):
+    # Первая и последняя свеча и число строк по каждой акции одним запросом
+    rows = (Price.objects.filter(share__in=shares).values('share_id')
+            .annotate(first=Min('date'), last=Max('date'), rows=Count('id')).order_by('share_id'))
+    return {row['share_id']: row for row in rows}
+
+
+def sessions(bounds):
+    """
+    Торговый календарь рынка по самим котировкам
+    :param bounds: результат _bounds по всем акциям
+    :return: datetime64[D] торговых дней
+    """
+    counts = Price.objects.values_list('date__date').annotate(n=Count('share_id', distinct=True)).order_by('date__date')
+    days = np.array([row[0] for row in counts], dtype='datetime64[D]')
+    traded = np.array([row[1] for row in counts], dtype=np.int64)
+    if not len(days):
+        return days
+    first = np.sort(np.array([b['first'].date() for b in bounds.values()], dtype='datetime64[D]'))
+    last = np.sort(np.array([b['last'].date() for b in bounds.values()], dtype='datetime64[D]'))
+    # Акции, уже начавшие и ещё не закончившие торговаться к каждому дню
+    listed = np.searchsorted(first, days, side='right') - np.searchsorted(last, days, side='left')
+    return days[traded >= SESSION_QUORUM * np.maximum(listed, 1)]
+
+
+def _groups(bounds, rows=SCAN_ROWS):
+    # Акции целиком, пачками не больше rows строк
+    group, size = [], 0
+    for share_id, row in bounds.items():
+        if group and size + row['rows'] > rows:
+            yield group
+            group, size = [], 0
+        group.append(share_id)
+        size += row['rows']
+    if group:
+        yield group
+
+
+def check_candles(columns):
+    """
+    Проверки свечей, отсортированных по (акция, время)
+    :param columns: результат load_prices с share_id
+    :return: словарь проверка -> булев массив по свечам
+    """
+    share, days = columns['share_id'], columns['time'].astype('datetime64[D]')
+    o, h, lo, c, v = (columns[name] for name in ('open', 'high', 'low', 'price', 'volume'))
+    same = np.r_[False, (share[1:] == share[:-1]) & (days[1:] == days[:-1])]
+    with np.errstate(invalid='ignore'):
+        ohlc = ~(np.isfinite(o) & np.isfinite(h) & np.isfinite(lo) & np.isfinite(c)) | (lo <= 0) | (h < lo) \
+            | (c > h) | (c < lo) | (o > h) | (o < lo)
+    return {
+        DUPLICATE: same,
+        OHLC: ohlc,
+        ZERO_VOLUME: ~(v > 0),
+    }
+
+
+def _intervals(positions, days):
+    """
+    Склеиваю подряд идущие по календарю дни в интервалы
+    :param positions: номера дней в торговом календаре, по возрастанию
+    :param days: дни, соответствующие positions
+    :return: список (начало, конец, число дней)
+    """
+    if not len(positions):
+        return []
+    starts = np.flatnonzero(np.r_[True, np.diff(positions) > 1])
+    ends = np.r_[starts[1:], len(positions)] - 1
+    return [(days[s].item(), days[e].item(), int(e - s + 1)) for s, e in zip(starts, ends)]
+
+
+def scan(shares=None, checks=CHECKS, rows=SCAN_ROWS):
+    """
+    Прохожу db.Price пачками акций в порядке индекса (share, date) и ищу испорченные интервалы
+    :param shares: акции (по умолчанию все)
+    :param checks: какие проверки выполнять
+    :param rows: строк на пачку, ограничивает память
+    :return: список (тикер, проверка, первый день, последний день, число дней)
+    """
+    everything = _bounds(Share.objects.all())
+    bounds = everything if shares is None else _bounds(shares)
+    calendar = sessions(everything)
+    tickers = dict(Share.objects.filter(pk__in=list(bounds)).values_list('pk', 'ticker'))
+    report = []
+    for group in _groups(bounds, rows):
+        columns = load_prices(Price.objects.filter(share_id__in=group), with_share=True)
+        found = check_candles(columns)
+        days = columns['time'].astype('datetime64[D]')
+        # Номер дня в торговом календаре, по нему склеиваются соседние плохие дни
+        positions = np.searchsorted(calendar, days)
+        segments = np.flatnonzero(np.r_[True, columns['share_id'][1:] != columns['share_id'][:-1]])
+        for start, end in zip(segments, np.r_[segments[1:], len(days)]):
+            share_id = int(columns['share_id'][start])
+            own = days[start:end]
+            for check in checks:
+                if check == GAP:
+                    window = calendar[(calendar >= own[0]) & (calendar <= own[-1])]
+                    missing = window[~np.isin(window, own)]
+                    intervals = _intervals(np.searchsorted(calendar, missing), missing)
+                else:
+                    bad = found[check][start:end]
+                    intervals = _intervals(positions[start:end][bad], own[bad])
+                report.extend((tickers[share_id], check) + interval for interval in intervals)
+    return report
+
+
+def refetch_ranges(report, margin=1):
+    """
+    Объединяю интервалы отчёта по акции в диапазоны для повторной загрузки
+    :param report: результат scan
+    :param margin: дней, на которые расширяется каждый интервал
+    :return: словарь тикер -> список (начало, конец)
+    """
+    pad = dt.timedelta(days=margin)
+    ranges = {}
+    for ticker, _, first, last, _ in sorted(report, key=lambda row: (row[0], row[2])):
+        merged = ranges.setdefault(ticker, [])
+        if merged and first - pad <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last + pad))
+        else:
+            merged.append((first - pad, last + pad))
+    return ranges
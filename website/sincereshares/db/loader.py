@@ -0,0 +1,91 @@
+import numpy as np
+from django.db import connection
+from django.db.models import BigIntegerField, Func
+
+from .models import Price, Share
+from .units import UNIT_COLUMNS, from_units
+
+# Строк на один fetchmany серверного курсора
+CHUNK_SIZE = 50000
+# Числовые колонки db.Price, которые читает загрузчик
+PRICE_COLUMNS = ('open', 'high', 'low', 'price', 'volume')
+
+
+class Epoch(Func):
+    """
+    Секунды с эпохи прямо в SQL: драйвер не создаёт datetime на каждую строку
+    """
+    output_field = BigIntegerField()
+
+    def as_sqlite(self, compiler, conn, **extra_context):
+        return self.as_sql(compiler, conn, template="CAST(strftime('%%%%s', %(expressions)s) AS INTEGER)",
+                           **extra_context)
+
+    def as_postgresql(self, compiler, conn, **extra_context):
+        return self.as_sql(compiler, conn, template='EXTRACT(EPOCH FROM %(expressions)s)::bigint',
+                           **extra_context)
+
+    def as_mysql(self, compiler, conn, **extra_context):
+        return self.as_sql(compiler, conn, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+def load_prices(queryset=None, columns=PRICE_COLUMNS, with_share=False, chunk_size=CHUNK_SIZE):
+    """
+    Читаю котировки в колонки NumPy без создания моделей и datetime.
+    Массивы выделяются заранее по COUNT и заполняются пачками из серверного курсора.
+    :param queryset: отфильтрованный Price.objects (по умолчанию вся таблица); подходит и PriceRollup
+    :param columns: числовые поля модели, цены db.Price переводятся из единиц цены в рубли
+    :param with_share: добавить колонку share_id
+    :param chunk_size:
+    :return: словарь 'time' (datetime64[s]), ['share_id'] и columns -> массивы, отсортированные по (акция, время)
+    """
+    if queryset is None:
+        queryset = Price.objects.all()
+    queryset = queryset.order_by('share_id', 'date')
+    scaled = [name for name in columns if name in UNIT_COLUMNS] if queryset.model is Price else []
+    fields = (['share_id'] if with_share or scaled else []) + list(columns)
+    qs = queryset.annotate(time=Epoch('date')).values_list(*fields, 'time')
+    # В SQL аннотации идут после полей модели
+    names = fields + ['time']
+
+    total = queryset.count()
+    arrays = {name: np.empty(total, dtype=np.int64 if name in ('time', 'share_id') else np.float64)
+              for name in names}
+    sql, params = qs.query.sql_with_params()
+    filled = 0
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            block = np.array(rows, dtype=np.float64)
+            end = filled + len(block)
+            if end > total:
+                # Строки дописали после COUNT
+                total = max(end, total * 2)
+                for name in names:
+                    arrays[name] = np.resize(arrays[name], total)
+            for i, name in enumerate(names):
+                arrays[name][filled:end] = block[:, i]
+            filled = end
+
+    result = {name: array[:filled] if filled < len(array) else array for name, array in arrays.items()}
+    result['time'] = result['time'].view('datetime64[s]')
+    if scaled:
+        _decode(result, scaled)
+        if not with_share:
+            del result['share_id']
+    return result
+
+
+def _decode(result, columns):
+    # Строки отсортированы по акции: масштаб применяется к непрерывным отрезкам
+    share_ids = result['share_id']
+    bounds = np.flatnonzero(np.diff(share_ids)) + 1
+    starts = np.r_[0, bounds] if len(share_ids) else np.array([], dtype=np.int64)
+    scales = dict(Share.objects.filter(pk__in=share_ids[starts].tolist()).values_list('pk', 'price_scale'))
+    for start, end in zip(starts, np.r_[bounds, len(share_ids)]):
+        scale = scales[int(share_ids[start])]
+        for name in columns:
+            result[name][start:end] = from_units(result[name][start:end], scale)
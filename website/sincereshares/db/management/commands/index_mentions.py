@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from db.mentions import MentionMatcher, index_videos, save_videos
+from db.models import Video
+
+
+class Command(BaseCommand):
+    help = 'Загружает видео из JSON Lines (videos.list) и строит индекс упоминаний акций'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Файлы videos.jsonl от 005_yt_harvester')
+        parser.add_argument('--rebuild', action='store_true', help='Переиндексировать все видео в базе')
+        parser.add_argument('--batch', type=int, default=5000, help='Видео на одну транзакцию')
+
+    def handle(self, *args, **options):
+        matcher = MentionMatcher.from_catalog()
+        mentions = 0
+        for path in options['paths']:
+            with open(path, encoding='utf-8') as f:
+                items = [json.loads(line) for line in f if line.strip()]
+            for i in range(0, len(items), options['batch']):
+                videos = save_videos(items[i:i + options['batch']])
+                mentions += index_videos(videos.values(), matcher)
+            self.stdout.write('%s: %s видео' % (path, len(items)))
+        if options['rebuild']:
+            ids = list(Video.objects.order_by('pk').values_list('pk', flat=True))
+            for i in range(0, len(ids), options['batch']):
+                mentions += index_videos(Video.objects.filter(pk__in=ids[i:i + options['batch']]), matcher)
+        self.stdout.write('Упоминаний записано: %s' % mentions)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from db.models import Share
+from db.rollups import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Сверяет свёртки котировок с db.Price и при --repair исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', help='Тикеры (по умолчанию все акции)')
+        parser.add_argument('--period', action='append', choices=['d', 'w', 'm'], help='Периоды свёрток')
+        parser.add_argument('--repair', action='store_true', help='Пересчитать расходящиеся куски')
+
+    def handle(self, *args, **options):
+        shares = Share.objects.all()
+        if options['tickers']:
+            shares = shares.filter(ticker__in=options['tickers'])
+        report = reconcile(shares, options['period'] or ['d', 'w', 'm'], options['repair'])
+        for ticker, period, start, mismatches in report:
+            self.stdout.write('%s %s %s: %s расхождений' % (ticker, period or '-', start or 'вне истории', mismatches))
+        self.stdout.write('Кусков с расхождениями: %s%s' % (len(report), ', исправлено' if options['repair'] and report else ''))
@@ -0,0 +1,184 @@
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import Share, ShareMention, Video
+
+# Короче тикеры совпадают с обычными словами (T, X5, MTS)
+MIN_TICKER = 4
+# Организационно-правовые формы и типы бумаг в названиях MOEX
+LEGAL_WORDS = {'пао', 'оао', 'зао', 'ао', 'ап', 'мкпао', 'нк', 'гк', 'plc', 'ltd', 'inc'}
+# Первое слово названия считается самостоятельным упоминанием, если оно не короче
+MIN_NAME_WORD = 5
+
+# Кириллица, похожая на латиницу, сводится к латинице и в тексте, и в шаблонах,
+# поэтому «SBЕR» с русской Е совпадает с SBER
+HOMOGLYPHS = str.maketrans('аеорсухкмтвнё', 'aeopcyxkmtbhe')
+# Грубый стеммер: отрезаю падежные окончания у русских слов от пяти букв.
+# Окончания снимаются, пока снимаются: иначе «Газпром» теряет «ом», а «Газпрома» - только «а»
+ENDINGS = re.compile(r'(?<=[а-яё]{4})(?:ами|ями|ого|ему|ом|ем|ой|ей|ов|ев|ах|ях|ам|ям|ью|ь|а|я|у|ю|е|ы|и)\b')
+TOKEN = re.compile(r'\w+')
+
+
+def tokens(text):
+    """
+    Нормализованные слова текста: нижний регистр, без окончаний, с латиницей вместо похожей кириллицы
+    :param text:
+    :return: список слов
+    """
+    text = text.lower()
+    while True:
+        stemmed = ENDINGS.sub('', text)
+        if stemmed == text:
+            return TOKEN.findall(text.translate(HOMOGLYPHS))
+        text = stemmed
+
+
+class MentionMatcher:
+    """
+    Автомат Ахо-Корасик над словами: все шаблоны ищутся за один проход по тексту
+    """
+
+    def __init__(self, patterns):
+        """
+        :param patterns: список (текст шаблона, share_id)
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+        for text, share_id in patterns:
+            words = tokens(text)
+            if not words:
+                continue
+            node = 0
+            for word in words:
+                if word not in self.goto[node]:
+                    self.goto[node][word] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                node = self.goto[node][word]
+            if (share_id, len(words)) not in self.out[node]:
+                self.out[node] += ((share_id, len(words)),)
+        self.vocabulary = {word for edges in self.goto for word in edges}
+        self._link()
+
+    def _link(self):
+        # Суффиксные ссылки обходом в ширину, выходы наследуются от узла по ссылке
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for word, child in self.goto[node].items():
+                queue.append(child)
+                link = self.fail[node]
+                while link and word not in self.goto[link]:
+                    link = self.fail[link]
+                self.fail[child] = self.goto[link].get(word, 0)
+                self.out[child] += tuple(o for o in self.out[self.fail[child]] if o not in self.out[child])
+
+    @classmethod
+    def from_catalog(cls, shares=None):
+        """
+        Шаблоны из справочника: тикер, ISIN, название без организационной формы и первое слово названия
+        :param shares: акции (по умолчанию все)
+        :return: MentionMatcher
+        """
+        if shares is None:
+            shares = Share.objects.all()
+        rows = list(shares.values_list('pk', 'ticker', 'isin', 'name'))
+        names = {}
+        for pk, ticker, isin, name in rows:
+            words = [word for word in re.findall(r'\w+', name) if word.lower() not in LEGAL_WORDS]
+            names[pk] = words
+        # Названия по первому слову: у обыкновенных и привилегированных акций эмитента оно общее
+        issuers = {}
+        for words in names.values():
+            if words:
+                issuers.setdefault(words[0].lower(), set()).add(' '.join(words).lower())
+        patterns = []
+        for pk, ticker, isin, name in rows:
+            if len(ticker) >= MIN_TICKER:
+                patterns.append((ticker, pk))
+            if isin:
+                patterns.append((isin, pk))
+            words = names[pk]
+            if words:
+                patterns.append((' '.join(words), pk))
+                # «Сбербанк» из «Сбербанк России», если слово не начинает названия разных эмитентов
+                if len(words) > 1 and len(words[0]) >= MIN_NAME_WORD and len(issuers[words[0].lower()]) == 1:
+                    patterns.append((words[0], pk))
+        return cls(patterns)
+
+    def find(self, text):
+        """
+        :param text:
+        :return: Counter share_id -> число упоминаний
+        """
+        found = Counter()
+        # Последнее слово, уже засчитанное акции: «Сбербанк России» не считается заодно и как «Сбербанк»
+        covered = {}
+        goto, fail, out, vocabulary = self.goto, self.fail, self.out, self.vocabulary
+        node = 0
+        for i, word in enumerate(tokens(text)):
+            if word not in vocabulary:
+                node = 0
+                continue
+            while node and word not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(word, 0)
+            for share_id, length in out[node]:
+                if i - length >= covered.get(share_id, -1):
+                    found[share_id] += 1
+                covered[share_id] = i
+        return found
+
+
+def save_videos(items):
+    """
+    Записываю элементы videos.list (как в выводе 005_yt_harvester), существующие видео обновляются
+    :param items: словари с id и snippet
+    :return: {video_id: Video}
+    """
+    items = {item['id']: item.get('snippet', {}) for item in items}
+    videos = Video.objects.in_bulk(list(items), field_name='video_id')
+    new, changed = [], []
+    for video_id, snippet in items.items():
+        video = videos.get(video_id) or Video(video_id=video_id)
+        video.channel_id = snippet.get('channelId', '')
+        video.title = snippet.get('title', '')[:255]
+        video.description = snippet.get('description', '')
+        video.published_at = parse_datetime(snippet['publishedAt']) if snippet.get('publishedAt') else None
+        (changed if video.pk else new).append(video)
+    Video.objects.bulk_create(new, batch_size=1000)
+    Video.objects.bulk_update(changed, ['channel_id', 'title', 'description', 'published_at'], batch_size=1000)
+    return Video.objects.in_bulk(list(items), field_name='video_id')
+
+
+@transaction.atomic
+def index_videos(videos, matcher=None):
+    """
+    Пересобираю упоминания акций для переданных видео
+    :param videos: Video
+    :param matcher: по умолчанию строится по справочнику
+    :return: число записанных упоминаний
+    """
+    matcher = matcher or MentionMatcher.from_catalog()
+    videos = list(videos)
+    mentions = []
+    for video in videos:
+        for share_id, count in matcher.find(video.title + '\n' + video.description).items():
+            mentions.append(ShareMention(share_id=share_id, video=video, count=count))
+    ShareMention.objects.filter(video__in=videos).delete()
+    ShareMention.objects.bulk_create(mentions, batch_size=5000)
+    return len(mentions)
+
+
+def videos_about(ticker):
+    """
+    Видео об акции по обратному индексу, сначала с наибольшим числом упоминаний
+    :param ticker:
+    :return: QuerySet Video
+    """
+    return (Video.objects.filter(sharemention__share__ticker=ticker)
+            .order_by('-sharemention__count', '-published_at'))
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0004_auto_20230508_1416'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdjustedPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField()),
+                ('price', models.FloatField()),
+                ('open', models.FloatField()),
+                ('high', models.FloatField()),
+                ('low', models.FloatField()),
+                ('factor', models.FloatField(default=1.0)),
+                ('share', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='db.share')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CorporateAction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('dividend', 'Дивиденд'), ('split', 'Сплит')], max_length=10)),
+                ('date', models.DateField()),
+                ('value', models.FloatField()),
+                ('ex_date', models.DateField(null=True)),
+                ('factor', models.FloatField(null=True)),
+                ('share', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='db.share')),
+            ],
+            options={
+                'unique_together': {('share', 'kind', 'date')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='adjustedprice',
+            index=models.Index(fields=['share', 'date'], name='db_adjusted_share_i_3f52a1_idx'),
+        ),
+    ]
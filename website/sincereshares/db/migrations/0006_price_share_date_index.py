@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0005_corporateaction_adjustedprice'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='price',
+            index=models.Index(fields=['share', 'date'], name='db_price_share_i_2e5298_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0006_price_share_date_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='price',
+            name='date',
+            field=models.DateTimeField(),
+        ),
+        migrations.CreateModel(
+            name='PriceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('d', 'День'), ('w', 'Неделя'), ('m', 'Месяц')], max_length=1)),
+                ('date', models.DateTimeField()),
+                ('price', models.FloatField()),
+                ('open', models.FloatField()),
+                ('high', models.FloatField()),
+                ('low', models.FloatField()),
+                ('volume', models.FloatField()),
+                ('candles', models.IntegerField()),
+                ('share', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='db.share')),
+            ],
+            options={
+                'unique_together': {('share', 'period', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0007_pricerollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pricerollup',
+            index=models.Index(fields=['period', 'date'], name='db_pricerol_period_7cff9b_idx'),
+        ),
+    ]
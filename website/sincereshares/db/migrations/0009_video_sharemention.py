@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0008_pricerollup_period_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Video',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('video_id', models.CharField(max_length=20, unique=True)),
+                ('channel_id', models.CharField(max_length=40)),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True)),
+                ('published_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShareMention',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField()),
+                ('share', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='db.share')),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='db.video')),
+            ],
+            options={
+                'unique_together': {('share', 'video')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0009_video_sharemention'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='share',
+            name='currency',
+            field=models.CharField(default='RUB', max_length=10),
+        ),
+        # Пустой scale - акция ещё не переведена на целые цены
+        migrations.AddField(
+            model_name='share',
+            name='price_scale',
+            field=models.SmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='price',
+            name='open_units',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='price',
+            name='high_units',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='price',
+            name='low_units',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='price',
+            name='price_units',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:20
+
+import numpy as np
+from django.db import migrations, transaction
+from django.db.models import BigIntegerField, F, Max, Min, Value
+from django.db.models.functions import Cast, Round
+
+# Строк db.Price на одну транзакцию
+BATCH_SIZE = 50000
+DEFAULT_SCALE = 2
+UNIT_FIELDS = {'open': 'open_units', 'high': 'high_units', 'low': 'low_units', 'price': 'price_units'}
+# Копия db.units на момент миграции: модуль импортирует db.models, а миграции работают с историческими моделями
+MAX_SCALE = 6
+TOLERANCE = 1e-6
+
+
+def decimals(values):
+    # Сколько знаков после запятой нужно, чтобы записать цены без потерь
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    for scale in range(MAX_SCALE):
+        scaled = values * 10.0 ** scale
+        if np.all(np.abs(scaled - np.rint(scaled)) <= TOLERANCE * np.maximum(np.abs(scaled), 1.0)):
+            return scale
+    return MAX_SCALE
+
+
+def detect_scales(Price, Share):
+    # Масштаб по фактическим знакам в истории акции; сохраняется сразу, повторный запуск акцию пропускает
+    for share in Share.objects.filter(price_scale__isnull=True):
+        # Акции без истории получают масштаб по умолчанию, при загрузке он увеличится при необходимости
+        scale = 0 if Price.objects.filter(share=share).exists() else DEFAULT_SCALE
+        rows = Price.objects.filter(share=share).values_list(*UNIT_FIELDS).order_by()
+        chunk = []
+        for row in rows.iterator(chunk_size=BATCH_SIZE):
+            chunk.append(row)
+            if len(chunk) == BATCH_SIZE:
+                scale = max(scale, decimals(chunk))
+                chunk = []
+            if scale == MAX_SCALE:
+                break
+        if chunk:
+            scale = max(scale, decimals(chunk))
+        Share.objects.filter(pk=share.pk).update(price_scale=scale)
+
+
+def backfill(apps, schema_editor):
+    """
+    Переношу цены в целые колонки пачками по id, каждая пачка в своей транзакции.
+    Переведённые строки не трогаются, поэтому прерванную миграцию можно просто запустить снова.
+    """
+    Price = apps.get_model('db', 'Price')
+    Share = apps.get_model('db', 'Share')
+    detect_scales(Price, Share)
+    by_scale = {}
+    for pk, scale in Share.objects.values_list('pk', 'price_scale'):
+        by_scale.setdefault(scale, []).append(pk)
+    bounds = Price.objects.filter(price_units__isnull=True).aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return
+    for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+        with transaction.atomic():
+            rows = Price.objects.filter(pk__gte=start, pk__lt=start + BATCH_SIZE, price_units__isnull=True)
+            for scale, share_ids in by_scale.items():
+                rows.filter(share_id__in=share_ids).update(**{
+                    units: Cast(Round(F(name) * Value(10.0 ** scale)), BigIntegerField())
+                    for name, units in UNIT_FIELDS.items()})
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('db', '0010_price_units'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:20
+
+import importlib
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Свечи, записанные старым кодом после 0011
+backfill = importlib.import_module('db.migrations.0011_backfill_price_units').backfill
+
+
+def copy_currency(apps, schema_editor):
+    # Валюта переезжает из котировок в акцию: берётся у последней свечи, у акций без истории остаётся RUB
+    Price = apps.get_model('db', 'Price')
+    Share = apps.get_model('db', 'Share')
+    last = Price.objects.filter(share=OuterRef('pk')).order_by('-date').values('currency')[:1]
+    Share.objects.update(currency=Coalesce(Subquery(last), F('currency')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0011_backfill_price_units'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RunPython(copy_currency, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='share',
+            name='price_scale',
+            field=models.SmallIntegerField(default=2),
+        ),
+        migrations.RemoveField(
+            model_name='price',
+            name='change',
+        ),
+        migrations.RemoveField(
+            model_name='price',
+            name='currency',
+        ),
+        migrations.RemoveField(
+            model_name='price',
+            name='open',
+        ),
+        migrations.RemoveField(
+            model_name='price',
+            name='high',
+        ),
+        migrations.RemoveField(
+            model_name='price',
+            name='low',
+        ),
+        migrations.RemoveField(
+            model_name='price',
+            name='price',
+        ),
+        migrations.RenameField(
+            model_name='price',
+            old_name='open_units',
+            new_name='open',
+        ),
+        migrations.RenameField(
+            model_name='price',
+            old_name='high_units',
+            new_name='high',
+        ),
+        migrations.RenameField(
+            model_name='price',
+            old_name='low_units',
+            new_name='low',
+        ),
+        migrations.RenameField(
+            model_name='price',
+            old_name='price_units',
+            new_name='price',
+        ),
+        migrations.AlterField(
+            model_name='price',
+            name='open',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='price',
+            name='high',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='price',
+            name='low',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='price',
+            name='price',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='price',
+            name='volume',
+            field=models.BigIntegerField(),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('db', '0012_price_units_swap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('price', 'Цена'), ('change', 'Изменение от цены при создании, %'), ('indicator', 'Индикатор')], default='price', max_length=10)),
+                ('direction', models.CharField(choices=[('above', 'Не ниже'), ('below', 'Не выше')], default='above', max_length=5)),
+                ('threshold', models.FloatField()),
+                ('indicator', models.CharField(blank=True, choices=[('rsi', 'RSI'), ('sma', 'SMA'), ('ema', 'EMA'), ('change', 'Изменение за окно, %')], max_length=10)),
+                ('window', models.SmallIntegerField(blank=True, null=True)),
+                ('reference', models.FloatField(blank=True, null=True)),
+                ('level', models.FloatField(editable=False)),
+                ('active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('triggered_at', models.DateTimeField(blank=True, null=True)),
+                ('triggered_value', models.FloatField(blank=True, null=True)),
+                ('share', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='db.share')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pricealert',
+            index=models.Index(condition=models.Q(('active', True)), fields=['share'], name='db_alert_active_share'),
+        ),
+    ]
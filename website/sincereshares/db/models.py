@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
 
 # Create your models here.
@@ -9,16 +11,156 @@ class Share(models.Model):
     name = models.CharField(max_length=255)
     slug = models.SlugField(unique=True, max_length=255)
     isin = models.CharField(unique=True, max_length=12)
+    currency = models.CharField(max_length=10, default='RUB')
+    # Знаков после запятой в ценах: котировки хранятся целыми в единицах 10^-price_scale
+    price_scale = models.SmallIntegerField(default=2)
 
-# Котировки
+    def __str__(self):
+        return self.ticker
+
+# Котировки: цены в единицах 10^-share.price_scale (db.units), изменение к прошлому закрытию считается при чтении
 class Price(models.Model):
     share = models.ForeignKey(Share, on_delete=models.CASCADE)
-    date = models.DateTimeField(auto_now_add=True)
+    date = models.DateTimeField()
+    price = models.BigIntegerField()
+    volume = models.BigIntegerField()
+    open = models.BigIntegerField()
+    high = models.BigIntegerField()
+    low = models.BigIntegerField()
+
+    class Meta:
+        # Все чтения истории идут диапазоном дат по одной акции
+        indexes = [models.Index(fields=['share', 'date'])]
+
+
+# Корпоративные действия: дивиденды и сплиты
+class CorporateAction(models.Model):
+    DIVIDEND = 'dividend'
+    SPLIT = 'split'
+    KINDS = [(DIVIDEND, 'Дивиденд'), (SPLIT, 'Сплит')]
+
+    share = models.ForeignKey(Share, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KINDS)
+    # Дата закрытия реестра для дивиденда, дата начала торгов после сплита
+    date = models.DateField()
+    # Дивиденд на акцию или отношение before/after для сплита
+    value = models.FloatField()
+    # Заполняются, когда действие применено к скорректированным котировкам
+    ex_date = models.DateField(null=True)
+    factor = models.FloatField(null=True)
+
+    class Meta:
+        unique_together = [('share', 'kind', 'date')]
+
+# Котировки, скорректированные на дивиденды и сплиты
+class AdjustedPrice(models.Model):
+    share = models.ForeignKey(Share, on_delete=models.CASCADE)
+    date = models.DateTimeField()
+    price = models.FloatField()
+    open = models.FloatField()
+    high = models.FloatField()
+    low = models.FloatField()
+    # Накопленный множитель, на который умножены сырые цены
+    factor = models.FloatField(default=1.0)
+
+    class Meta:
+        indexes = [models.Index(fields=['share', 'date'])]
+
+# Уведомления о ценах: срабатывают один раз, проверяются при загрузке каждой пачки свечей (moexplot.alerts)
+class PriceAlert(models.Model):
+    PRICE = 'price'
+    CHANGE = 'change'
+    INDICATOR = 'indicator'
+    KINDS = [(PRICE, 'Цена'), (CHANGE, 'Изменение от цены при создании, %'), (INDICATOR, 'Индикатор')]
+    ABOVE = 'above'
+    BELOW = 'below'
+    DIRECTIONS = [(ABOVE, 'Не ниже'), (BELOW, 'Не выше')]
+    # Индикаторы по закрытиям, как в скринере
+    INDICATORS = [('rsi', 'RSI'), ('sma', 'SMA'), ('ema', 'EMA'), ('change', 'Изменение за окно, %')]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
+    share = models.ForeignKey(Share, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KINDS, default=PRICE)
+    # Для изменения направление задаётся знаком порога
+    direction = models.CharField(max_length=5, choices=DIRECTIONS, default=ABOVE)
+    # Цена, процент изменения или значение индикатора
+    threshold = models.FloatField()
+    indicator = models.CharField(max_length=10, choices=INDICATORS, blank=True)
+    window = models.SmallIntegerField(null=True, blank=True)
+    # Цена закрытия при создании, от неё считается изменение
+    reference = models.FloatField(null=True, blank=True)
+    # Уровень, с которым сравнивается диапазон пачки: цена для цены и изменения, значение для индикатора
+    level = models.FloatField(editable=False)
+    active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Свеча, на которой уровень достигнут, и значение high, low или индикатора на ней
+    triggered_at = models.DateTimeField(null=True, blank=True)
+    triggered_value = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['share'], condition=models.Q(active=True), name='db_alert_active_share')]
+
+    def clean(self):
+        if self.kind == self.INDICATOR and (not self.indicator or not self.window or self.window < 1):
+            raise ValidationError('Для индикатора нужны индикатор и окно')
+        if self.kind == self.CHANGE and not self.threshold:
+            raise ValidationError('Изменение 0% сработает сразу')
+        if self.kind == self.CHANGE and self.reference is None and self.share_id and self._last_close() is None:
+            raise ValidationError('Нет котировок, от которых считать изменение')
+
+    def _last_close(self):
+        units = Price.objects.filter(share_id=self.share_id).order_by('-date').values_list('price', flat=True).first()
+        return None if units is None else units / 10 ** self.share.price_scale
+
+    def save(self, *args, **kwargs):
+        if self.kind != self.INDICATOR:
+            self.indicator, self.window = '', None
+        if self.kind == self.CHANGE:
+            if self.reference is None:
+                self.reference = self._last_close()
+            self.level = self.reference * (1 + self.threshold / 100)
+            self.direction = self.ABOVE if self.threshold > 0 else self.BELOW
+        else:
+            self.level = self.threshold
+        super().save(*args, **kwargs)
+
+# Свёртки котировок по дням, неделям и месяцам, обновляются при загрузке свечей
+class PriceRollup(models.Model):
+    DAY = 'd'
+    WEEK = 'w'
+    MONTH = 'm'
+    PERIODS = [(DAY, 'День'), (WEEK, 'Неделя'), (MONTH, 'Месяц')]
+
+    share = models.ForeignKey(Share, on_delete=models.CASCADE)
+    period = models.CharField(max_length=1, choices=PERIODS)
+    # Начало периода
+    date = models.DateTimeField()
     price = models.FloatField()
-    volume = models.FloatField()
-    change = models.FloatField()
     open = models.FloatField()
     high = models.FloatField()
     low = models.FloatField()
-    currency = models.CharField(max_length=10)
+    volume = models.FloatField()
+    candles = models.IntegerField()
+
+    class Meta:
+        unique_together = [('share', 'period', 'date')]
+        # Срезы по всему рынку за последние периоды
+        indexes = [models.Index(fields=['period', 'date'])]
+
+# Видео YouTube финансовых каналов
+class Video(models.Model):
+    video_id = models.CharField(unique=True, max_length=20)
+    channel_id = models.CharField(max_length=40)
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    published_at = models.DateTimeField(null=True)
+
+# Обратный индекс упоминаний: акция -> видео
+class ShareMention(models.Model):
+    share = models.ForeignKey(Share, on_delete=models.CASCADE)
+    video = models.ForeignKey(Video, on_delete=models.CASCADE)
+    # Сколько раз акция упомянута в заголовке и описании
+    count = models.IntegerField()
 
+    class Meta:
+        unique_together = [('share', 'video')]
@@ -0,0 +1,162 @@
+import datetime as dt
+
+import numpy as np
+from django.db import transaction
+
+from .loader import load_prices
+from .models import Price, PriceRollup, Share
+
+ROLLUP_COLUMNS = ('open', 'high', 'low', 'price', 'volume')
+# Длина куска истории при сверке
+RECONCILE_SPAN = dt.timedelta(days=366)
+
+
+def bucket_keys(times, period):
+    """
+    Начало периода для каждой свечи
+    :param times: datetime64
+    :param period: PriceRollup.DAY / WEEK / MONTH
+    :return: datetime64[D]
+    """
+    days = np.asarray(times).astype('datetime64[D]')
+    if period == PriceRollup.DAY:
+        return days
+    if period == PriceRollup.WEEK:
+        # 1970-01-01 - четверг, (день + 3) % 7 даёт номер дня недели с понедельника
+        return days - (days.astype(np.int64) + 3) % 7
+    if period == PriceRollup.MONTH:
+        return days.astype('datetime64[M]').astype('datetime64[D]')
+    raise ValueError('Неизвестный период %s' % period)
+
+
+def bucket_start(value, period):
+    """
+    Начало периода, в который попадает момент value (aware datetime)
+    :param value:
+    :param period:
+    :return: aware datetime
+    """
+    day = bucket_keys(np.datetime64(value.astimezone(dt.timezone.utc).replace(tzinfo=None), 's'), period)
+    return dt.datetime.combine(day.item(), dt.time.min, tzinfo=dt.timezone.utc)
+
+
+def bucket_end(value, period):
+    # Начало следующего периода
+    start = bucket_start(value, period)
+    if period == PriceRollup.DAY:
+        return start + dt.timedelta(days=1)
+    if period == PriceRollup.WEEK:
+        return start + dt.timedelta(weeks=1)
+    return (start + dt.timedelta(days=32)).replace(day=1)
+
+
+def aggregate(columns, period):
+    """
+    Свёртка отсортированных по времени свечей одной акции
+    :param columns: результат load_prices
+    :param period:
+    :return: словарь колонок свёртки: date, open, high, low, price, volume, candles
+    """
+    keys = bucket_keys(columns['time'], period)
+    if len(keys) == 0:
+        return {name: np.empty(0) for name in ('date', 'candles') + ROLLUP_COLUMNS}
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+    return {
+        'date': keys[starts],
+        'open': columns['open'][starts],
+        'high': np.maximum.reduceat(columns['high'], starts),
+        'low': np.minimum.reduceat(columns['low'], starts),
+        'price': columns['price'][ends],
+        'volume': np.add.reduceat(columns['volume'], starts),
+        'candles': ends - starts + 1,
+    }
+
+
+def _rollup_objects(share_id, period, rollup):
+    for i, day in enumerate(rollup['date'].tolist()):
+        yield PriceRollup(share_id=share_id, period=period,
+                          date=dt.datetime.combine(day, dt.time.min, tzinfo=dt.timezone.utc),
+                          candles=int(rollup['candles'][i]),
+                          **{name: float(rollup[name][i]) for name in ROLLUP_COLUMNS})
+
+
+def _prices(share_id, start, end):
+    return load_prices(Price.objects.filter(share_id=share_id, date__gte=start, date__lt=end), ROLLUP_COLUMNS)
+
+
+@transaction.atomic
+def refresh_rollups(share_id, first, last, periods=(PriceRollup.DAY, PriceRollup.WEEK, PriceRollup.MONTH)):
+    """
+    Пересчитываю только периоды, которых касаются свечи с first по last
+    :param share_id:
+    :param first: время первой изменённой свечи
+    :param last: время последней изменённой свечи
+    :param periods:
+    :return: число записанных свёрток
+    """
+    written = 0
+    for period in periods:
+        start, end = bucket_start(first, period), bucket_end(last, period)
+        rollup = aggregate(_prices(share_id, start, end), period)
+        PriceRollup.objects.filter(share_id=share_id, period=period, date__gte=start, date__lt=end).delete()
+        written += len(PriceRollup.objects.bulk_create(_rollup_objects(share_id, period, rollup)))
+    return written
+
+
+def _stored(share_id, period, start, end):
+    rows = (PriceRollup.objects.filter(share_id=share_id, period=period, date__gte=start, date__lt=end)
+            .order_by('date').values_list('date', 'candles', *ROLLUP_COLUMNS))
+    return {row[0].date(): row[1:] for row in rows}
+
+
+def _chunks(first, last, period):
+    # Границы кусков выровнены по началу периода, чтобы период не разрезался между кусками
+    start = bucket_start(first, period)
+    while start <= last:
+        end = max(bucket_start(start + RECONCILE_SPAN, period), bucket_end(start, period))
+        yield start, end
+        start = end
+
+
+def reconcile(shares=None, periods=(PriceRollup.DAY, PriceRollup.WEEK, PriceRollup.MONTH), repair=False):
+    """
+    Сверяю свёртки с db.Price кусками по году на акцию
+    :param shares: акции (по умолчанию все)
+    :param periods:
+    :param repair: перезаписать расходящиеся куски
+    :return: список (тикер, период, начало куска, число расхождений)
+    """
+    if shares is None:
+        shares = Share.objects.all()
+    report = []
+    for share in shares:
+        bounds = Price.objects.filter(share=share).order_by('date').values_list('date', flat=True)
+        first, last = bounds.first(), bounds.last()
+        if first is None:
+            if PriceRollup.objects.filter(share=share).exists():
+                report.append((share.ticker, None, None, PriceRollup.objects.filter(share=share).count()))
+                if repair:
+                    PriceRollup.objects.filter(share=share).delete()
+            continue
+        for period in periods:
+            # Свёртки вне истории котировок
+            stale = (PriceRollup.objects.filter(share=share, period=period)
+                     .exclude(date__gte=bucket_start(first, period), date__lt=bucket_end(last, period)))
+            if stale.exists():
+                report.append((share.ticker, period, None, stale.count()))
+                if repair:
+                    stale.delete()
+            for start, end in _chunks(first, last, period):
+                expected = aggregate(_prices(share.pk, start, end), period)
+                stored = _stored(share.pk, period, start, end)
+                mismatches = len(set(stored) - set(expected['date'].tolist()))
+                for i, day in enumerate(expected['date'].tolist()):
+                    row = (int(expected['candles'][i]),) + tuple(float(expected[name][i]) for name in ROLLUP_COLUMNS)
+                    if day not in stored or not np.allclose(stored[day], row, rtol=1e-9, atol=0):
+                        mismatches += 1
+                if mismatches:
+                    report.append((share.ticker, period, start.date(), mismatches))
+                    if repair:
+                        refresh_rollups(share.pk, start, end - dt.timedelta(microseconds=1), [period])
+    return report
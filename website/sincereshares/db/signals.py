@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Пачка свечей записана в db.Price и транзакция зафиксирована.
+# batch: словарь массивов share_id, time и end - начало и конец свечи (datetime64[s]), high, low, close в рублях,
+# отсортированных по (акция, время)
+candles_ingested = Signal()
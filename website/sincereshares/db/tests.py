@@ -1,3 +1,288 @@
-from django.test import TestCase
+import datetime as dt
 
-# Create your tests here.
+import numpy as np
+from django.test import TestCase, TransactionTestCase
+
+from .models import Price, Share
+
+
+def make_share(ticker, scale=2, **fields):
+    fields = dict({'name': ticker, 'slug': ticker.lower(), 'isin': 'RU' + ticker.rjust(10, '0')}, **fields)
+    return Share.objects.create(ticker=ticker, price_scale=scale, **fields)
+
+
+def add_prices(share, start, closes, scale=None):
+    """
+    Дневные свечи подряд по календарным дням, цены в единицах акции
+    """
+    scale = share.price_scale if scale is None else scale
+    Price.objects.bulk_create(
+        Price(share=share, date=dt.datetime.combine(start + dt.timedelta(days=i), dt.time.min, tzinfo=dt.timezone.utc),
+              open=round(c * 10 ** scale), high=round(c * 1.01 * 10 ** scale), low=round(c * 0.99 * 10 ** scale),
+              price=round(c * 10 ** scale), volume=10 + i)
+        for i, c in enumerate(closes))
+
+
+class LoadPricesTests(TestCase):
+
+    def test_decodes_each_share_with_its_scale(self):
+        from .loader import load_prices
+
+        share = make_share('AAA', scale=2)
+        other = make_share('BBB', scale=4)
+        add_prices(other, dt.date(2024, 1, 1), [0.1234, 0.1235])
+        add_prices(share, dt.date(2024, 1, 1), [101.5, 102.25, 103.0])
+        data = load_prices(with_share=True)
+        np.testing.assert_array_equal(data['share_id'], [share.pk] * 3 + [other.pk] * 2)
+        np.testing.assert_allclose(data['price'], [101.5, 102.25, 103.0, 0.1234, 0.1235])
+        self.assertEqual(data['time'][1], np.datetime64('2024-01-02T00:00:00'))
+        np.testing.assert_allclose(data['volume'], [10, 11, 12, 10, 11])
+
+    def test_small_chunks_and_filters(self):
+        from .loader import load_prices
+
+        share = make_share('AAA')
+        add_prices(share, dt.date(2024, 1, 1), [float(i) for i in range(1, 11)])
+        data = load_prices(Price.objects.filter(date__gte=dt.datetime(2024, 1, 5, tzinfo=dt.timezone.utc)),
+                           columns=('price',), chunk_size=3)
+        np.testing.assert_allclose(data['price'], range(5, 11))
+        self.assertNotIn('share_id', data)
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        self.share = make_share('AAA')
+        # 2024-01-01 - понедельник, две с половиной недели
+        add_prices(self.share, dt.date(2024, 1, 1), [float(c) for c in range(100, 118)])
+
+    def _refresh(self):
+        from .rollups import refresh_rollups
+
+        refresh_rollups(self.share.pk, dt.datetime(2024, 1, 1, tzinfo=dt.timezone.utc),
+                        dt.datetime(2024, 1, 18, tzinfo=dt.timezone.utc))
+
+    def test_bucket_keys(self):
+        from .models import PriceRollup
+        from .rollups import bucket_keys
+
+        times = np.array(['2024-01-03T10:00', '2024-01-07T23:00', '2024-02-29T00:00'], dtype='datetime64[s]')
+        np.testing.assert_array_equal(bucket_keys(times, PriceRollup.WEEK).astype(str),
+                                      ['2024-01-01', '2024-01-01', '2024-02-26'])
+        np.testing.assert_array_equal(bucket_keys(times, PriceRollup.MONTH).astype(str),
+                                      ['2024-01-01', '2024-01-01', '2024-02-01'])
+
+    def test_weekly_rollup(self):
+        from .models import PriceRollup
+
+        self._refresh()
+        weeks = list(PriceRollup.objects.filter(share=self.share, period=PriceRollup.WEEK).order_by('date')
+                     .values_list('date', 'open', 'high', 'low', 'price', 'volume', 'candles'))
+        self.assertEqual([w[0].date() for w in weeks], [dt.date(2024, 1, 1), dt.date(2024, 1, 8), dt.date(2024, 1, 15)])
+        self.assertEqual(weeks[1][1:], (107.0, 114.13, 105.93, 113.0, sum(range(17, 24)), 7))
+        self.assertEqual(weeks[2][-1], 4)
+
+    def test_incremental_refresh_and_reconcile(self):
+        from .models import PriceRollup
+        from .rollups import reconcile, refresh_rollups
+
+        self._refresh()
+        add_prices(self.share, dt.date(2024, 1, 19), [200.0])
+        day = dt.datetime(2024, 1, 19, tzinfo=dt.timezone.utc)
+        refresh_rollups(self.share.pk, day, day)
+        week = PriceRollup.objects.get(share=self.share, period=PriceRollup.WEEK, date=day - dt.timedelta(days=4))
+        self.assertEqual((week.price, week.candles), (200.0, 5))
+        self.assertEqual(reconcile([self.share]), [])
+
+        PriceRollup.objects.filter(period=PriceRollup.MONTH).update(price=1.0)
+        self.assertEqual(reconcile([self.share], repair=True), [('AAA', PriceRollup.MONTH, dt.date(2024, 1, 1), 1)])
+        self.assertEqual(reconcile([self.share]), [])
+
+
+class IntegrityScanTests(TestCase):
+
+    def setUp(self):
+        self.share = make_share('AAA')
+        self.other = make_share('BBB')
+        start = dt.date(2024, 1, 1)
+        add_prices(self.share, start, [100.0 + i for i in range(10)])
+        add_prices(self.other, start, [50.0 + i for i in range(10)])
+
+    def _day(self, day):
+        return dt.datetime(2024, 1, day, tzinfo=dt.timezone.utc)
+
+    def test_clean_history(self):
+        from .integrity import scan
+
+        self.assertEqual(scan(), [])
+
+    def test_finds_broken_intervals(self):
+        from .integrity import DUPLICATE, GAP, OHLC, ZERO_VOLUME, refetch_ranges, scan
+
+        Price.objects.filter(share=self.other, date__in=[self._day(4), self._day(5)]).delete()
+        Price.objects.filter(share=self.share, date=self._day(3)).update(high=1)
+        Price.objects.filter(share=self.share, date=self._day(9)).update(volume=0)
+        Price.objects.create(share=self.share, date=self._day(7) + dt.timedelta(hours=10), open=10600, high=10700,
+                             low=10500, price=10600, volume=5)
+        report = scan()
+        self.assertCountEqual(report, [
+            ('AAA', OHLC, dt.date(2024, 1, 3), dt.date(2024, 1, 3), 1),
+            ('AAA', DUPLICATE, dt.date(2024, 1, 7), dt.date(2024, 1, 7), 1),
+            ('AAA', ZERO_VOLUME, dt.date(2024, 1, 9), dt.date(2024, 1, 9), 1),
+            ('BBB', GAP, dt.date(2024, 1, 4), dt.date(2024, 1, 5), 2),
+        ])
+        self.assertEqual(scan(shares=[self.other], checks=(OHLC,)), [])
+        self.assertEqual(refetch_ranges(report, margin=1), {
+            'AAA': [(dt.date(2024, 1, 2), dt.date(2024, 1, 4)), (dt.date(2024, 1, 6), dt.date(2024, 1, 10))],
+            'BBB': [(dt.date(2024, 1, 3), dt.date(2024, 1, 6))],
+        })
+
+    def test_small_scan_batches(self):
+        from .integrity import GAP, scan
+
+        Price.objects.filter(share=self.share, date=self._day(6)).delete()
+        self.assertEqual(scan(rows=5), [('AAA', GAP, dt.date(2024, 1, 6), dt.date(2024, 1, 6), 1)])
+
+
+class MentionTests(TestCase):
+
+    def test_case_forms_share_a_stem(self):
+        from .mentions import tokens
+
+        for forms in (('Газпром', 'Газпрома', 'Газпрому', 'Газпромом', 'Газпроме'),
+                      ('Сбербанк', 'Сбербанка', 'Сбербанком'),
+                      ('Роснефть', 'Роснефти', 'Роснефтью'),
+                      ('Алроса', 'Алросы', 'Алросой', 'Алросу'),
+                      ('Северсталь', 'Северстали', 'Северсталью')):
+            self.assertEqual(len({tuple(tokens(form)) for form in forms}), 1, forms)
+        self.assertEqual(tokens('SBЕR'), tokens('SBER'))
+
+    def test_inflected_names_are_found(self):
+        from .mentions import MentionMatcher, index_videos, save_videos, videos_about
+
+        gazp = make_share('GAZP', name='Газпром ПАО')
+        sber = make_share('SBER', name='Сбербанк России ПАО')
+        rosn = make_share('ROSN', name='НК Роснефть')
+        matcher = MentionMatcher.from_catalog()
+        self.assertEqual(matcher.find('Акции Газпрома падают'), {gazp.pk: 1})
+        self.assertEqual(matcher.find('Сбербанком России и Газпромом, а ещё про Роснефть и Роснефти'),
+                         {sber.pk: 1, gazp.pk: 1, rosn.pk: 2})
+        self.assertEqual(matcher.find('SBER и Сбербанку'), {sber.pk: 2})
+
+        videos = save_videos([{'id': 'v1', 'snippet': {'title': 'Разбор Газпрома', 'description': 'GAZP, Газпрому'}},
+                              {'id': 'v2', 'snippet': {'title': 'Про Сбербанк', 'description': ''}}])
+        self.assertEqual(index_videos(videos.values(), matcher), 2)
+        self.assertEqual([v.video_id for v in videos_about('GAZP')], ['v1'])
+
+
+class IngestBoardDayTests(TestCase):
+
+    def test_day_of_a_board(self):
+        from .ingest import ingest_board_day
+        from .loader import load_prices
+        from .signals import candles_ingested
+
+        aaa, bbb, ccc = make_share('AAA'), make_share('BBB'), make_share('CCC')
+        day = dt.date(2024, 1, 2)
+        add_prices(bbb, day, [1.0])
+        batches = []
+
+        def receiver(sender, batch, **kwargs):
+            batches.append(batch)
+
+        candles_ingested.connect(receiver)
+        self.addCleanup(candles_ingested.disconnect, receiver)
+        rows = [{'SECID': 'BBB', 'OPEN': 12.3456, 'LOW': 12.3, 'HIGH': 12.5, 'CLOSE': 12.4, 'VOLUME': 7},
+                {'SECID': 'AAA', 'OPEN': 101.5, 'LOW': 100.0, 'HIGH': 102.0, 'CLOSE': 101.0, 'VOLUME': 5},
+                # Нет сделок и нет в справочнике
+                {'SECID': 'CCC', 'OPEN': None, 'LOW': None, 'HIGH': None, 'CLOSE': None, 'VOLUME': 0},
+                {'SECID': 'ZZZ', 'OPEN': 1, 'LOW': 1, 'HIGH': 1, 'CLOSE': 1, 'VOLUME': 1}]
+        scales = {share.pk: 2 for share in (aaa, bbb, ccc)}
+        shares = {'AAA': aaa.pk, 'BBB': bbb.pk, 'CCC': ccc.pk}
+        with self.captureOnCommitCallbacks(execute=True):
+            written = ingest_board_day(day, rows, shares, scales)
+        self.assertEqual(written, [bbb.pk, aaa.pk])
+        self.assertEqual(scales[bbb.pk], 4)
+        bbb.refresh_from_db()
+        self.assertEqual(bbb.price_scale, 4)
+
+        data = load_prices(with_share=True)
+        np.testing.assert_array_equal(data['share_id'], [aaa.pk, bbb.pk])
+        np.testing.assert_allclose(data['open'], [101.5, 12.3456])
+        np.testing.assert_allclose(data['price'], [101.0, 12.4])
+
+        [batch] = batches
+        np.testing.assert_array_equal(batch['share_id'], [aaa.pk, bbb.pk])
+        np.testing.assert_allclose(batch['high'], [102.0, 12.5])
+        self.assertEqual(batch['time'][0], np.datetime64('2024-01-02T00:00:00'))
+        self.assertEqual(batch['end'][0], np.datetime64('2024-01-03T00:00:00'))
+
+
+class PriceAdminTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.share = make_share('AAA')
+        add_prices(self.share, dt.date(2024, 1, 1), [100.0 + i for i in range(150)])
+        add_prices(make_share('BBB'), dt.date(2024, 1, 1), [10.0] * 10)
+
+    def test_keyset_pages(self):
+        url = '/admin/db/price/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        changelist = response.context['cl']
+        self.assertIsNone(changelist.date_hierarchy)
+        self.assertEqual(len(changelist.result_list), 100)
+        response = self.client.get(url + changelist.next_page_url)
+        self.assertEqual(len(response.context['cl'].result_list), 60)
+        self.assertIsNone(response.context['cl'].next_page_url)
+
+    def test_share_filter_with_date_hierarchy(self):
+        response = self.client.get('/admin/db/price/', {'share__id__exact': self.share.pk})
+        changelist = response.context['cl']
+        self.assertEqual(changelist.date_hierarchy, 'date')
+        self.assertEqual(changelist.result_list[0].date.date(), dt.date(2024, 5, 29))
+        self.assertAlmostEqual(changelist.model_admin.change(changelist.result_list[0]), 0.4, places=1)
+        response = self.client.get('/admin/db/price/' + changelist.next_page_url)
+        self.assertEqual([p.date.date() for p in response.context['cl'].result_list][-1], dt.date(2024, 1, 1))
+
+
+class UnitMigrationTests(TransactionTestCase):
+    before = [('db', '0009_video_sharemention')]
+    after = [('db', '0012_price_units_swap')]
+
+    def _migrate(self, targets):
+        from django.db import connection
+        from django.db.migrations.executor import MigrationExecutor
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        from django.db import connection
+        from django.db.migrations.executor import MigrationExecutor
+
+        self._migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('db'))
+
+    def test_prices_and_currency_move(self):
+        apps = self._migrate(self.before)
+        OldShare, OldPrice = apps.get_model('db', 'Share'), apps.get_model('db', 'Price')
+        usd = OldShare.objects.create(ticker='AAA', name='AAA', slug='aaa', isin='RU0000000AAA')
+        rub = OldShare.objects.create(ticker='BBB', name='BBB', slug='bbb', isin='RU0000000BBB')
+        OldShare.objects.create(ticker='CCC', name='CCC', slug='ccc', isin='RU0000000CCC')
+        rows = [(usd, 1, 10.5, 'RUB'), (usd, 2, 10.125, 'USD'), (rub, 1, 250.0, 'RUB')]
+        for share, day, close, currency in rows:
+            OldPrice.objects.create(share=share, date=dt.datetime(2024, 1, day, tzinfo=dt.timezone.utc), price=close,
+                                    open=close, high=close, low=close, volume=1, change=0, currency=currency)
+
+        apps = self._migrate(self.after)
+        Share, Price = apps.get_model('db', 'Share'), apps.get_model('db', 'Price')
+        self.assertEqual(dict(Share.objects.values_list('ticker', 'currency')),
+                         {'AAA': 'USD', 'BBB': 'RUB', 'CCC': 'RUB'})
+        self.assertEqual(dict(Share.objects.values_list('ticker', 'price_scale')), {'AAA': 3, 'BBB': 0, 'CCC': 2})
+        self.assertEqual(sorted(Price.objects.values_list('share__ticker', 'price')),
+                         [('AAA', 10125), ('AAA', 10500), ('BBB', 250)])
@@ -0,0 +1,56 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+
+from .models import Price, Share
+
+# Цены db.Price - целые числа в единицах 10^-scale, scale задаётся на акцию (Share.price_scale)
+UNIT_COLUMNS = ('open', 'high', 'low', 'price')
+# Больше знаков у котировок ISS не бывает, а 10^6 * цену ещё точно представляет float64
+MAX_SCALE = 6
+# Допуск при проверке, что цена укладывается в scale знаков
+TOLERANCE = 1e-6
+
+
+def decimals(values):
+    """
+    Сколько знаков после запятой нужно, чтобы записать цены без потерь
+    :param values: массив цен
+    :return: от 0 до MAX_SCALE
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    for scale in range(MAX_SCALE):
+        scaled = values * 10.0 ** scale
+        if np.all(np.abs(scaled - np.rint(scaled)) <= TOLERANCE * np.maximum(np.abs(scaled), 1.0)):
+            return scale
+    return MAX_SCALE
+
+
+def to_units(values, scale):
+    return np.rint(np.asarray(values, dtype=np.float64) * 10.0 ** scale).astype(np.int64)
+
+
+def from_units(values, scale):
+    # Деление, а не умножение на 10^-scale: 12345 / 100 даёт ровно 123.45
+    return np.asarray(values, dtype=np.float64) / 10.0 ** scale
+
+
+def ensure_scale(share_id, values, scales):
+    """
+    Проверяю, что цены укладываются в scale акции, иначе увеличиваю scale и пересчитываю её историю одним UPDATE
+    :param share_id:
+    :param values: новые цены акции
+    :param scales: {share_id: scale}, обновляется на месте
+    :return: scale для записи values
+    """
+    scale = scales[share_id]
+    needed = decimals(values)
+    if needed <= scale:
+        return scale
+    factor = 10 ** (needed - scale)
+    with transaction.atomic():
+        Price.objects.filter(share_id=share_id).update(**{name: F(name) * factor for name in UNIT_COLUMNS})
+        Share.objects.filter(pk=share_id).update(price_scale=needed)
+    scales[share_id] = needed
+    return needed
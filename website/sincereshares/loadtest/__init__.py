@@ -0,0 +1,7 @@
+"""
+Нагрузочный стенд: сайт под uvicorn с локальной SQLite и заглушкой ISS, без доступа в сеть.
+
+    python -m loadtest run --mix mixed --concurrency 32 --duration 30
+    python -m loadtest run --mix api --isolate
+    python -m loadtest compare data/loadtest/results/A.json data/loadtest/results/B.json
+"""
@@ -0,0 +1,154 @@
+import argparse
+import asyncio
+import datetime as dt
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from . import iss_stub
+from .stand import SITE_DIR, ResourceSampler, Server, prepare_database, setup_django
+from .traffic import ENDPOINTS, MIXES, drive, summarize
+
+RESULTS_DIR = SITE_DIR / 'data' / 'loadtest' / 'results'
+COLUMNS = ('requests', 'rps', 'p50', 'p95', 'p99', 'errors', 'server_ms', 'db_ms', 'queries', 'bytes', 'cpu_ms', 'rss_mb')
+
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=SITE_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _phase(server, mix, tickers, options, seed):
+    with ResourceSampler(server.process.pid) as sampler:
+        records = asyncio.run(drive(server.url, mix, tickers, options.concurrency, options.duration, seed))
+    summary = summarize(records, sampler.wall_seconds)
+    total = summary['total']
+    total['cpu_ms'] = sampler.cpu_seconds * 1000 / max(total['requests'], 1)
+    total['rss_mb'] = sampler.peak_rss / 2 ** 20
+    total['cpu_util'] = sampler.cpu_seconds / sampler.wall_seconds
+    return summary
+
+
+def run(options):
+    root = Path(options.root)
+    setup_django(root)
+    prepare_database(root, options.shares, options.years)
+    from db.models import Share
+
+    tickers = list(Share.objects.order_by('ticker').values_list('ticker', flat=True))
+    mix = MIXES[options.mix]
+    stub = iss_stub.serve(delay=options.iss_delay / 1000)
+    server = Server(root, stub.url, options.workers)
+    try:
+        if options.warmup:
+            asyncio.run(drive(server.url, mix, tickers, options.concurrency, options.warmup, options.seed + 1))
+        if options.isolate:
+            # Каждый endpoint отдельно: процессорное время и память сервера относятся к нему целиком
+            endpoints = {}
+            for name in mix:
+                summary = _phase(server, {name: 1}, tickers, options, options.seed)
+                endpoints[name] = dict(summary[name], cpu_ms=summary['total']['cpu_ms'],
+                                       rss_mb=summary['total']['rss_mb'])
+        else:
+            endpoints = _phase(server, mix, tickers, options, options.seed)
+    finally:
+        server.stop()
+        stub.shutdown()
+
+    result = {
+        'started': dt.datetime.now().isoformat(timespec='seconds'),
+        'commit': _git('rev-parse', '--short', 'HEAD'),
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no', '.')),
+        'label': options.label,
+        'config': {name: getattr(options, name) for name in
+                   ('mix', 'concurrency', 'duration', 'warmup', 'workers', 'shares', 'years', 'iss_delay', 'seed',
+                    'isolate')},
+        'endpoints': endpoints,
+        # Обращений сайта к ISS за прогон, включая прогрев
+        'iss_requests': iss_stub.Handler.requests,
+    }
+    results_dir = Path(options.results)
+    results_dir.mkdir(parents=True, exist_ok=True)
+    path = results_dir / ('%s-%s-%s-c%d.json' % (dt.datetime.now().strftime('%Y%m%d-%H%M%S'), result['commit'] or 'nogit',
+                                                 options.mix, options.concurrency))
+    path.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+    print_table(endpoints)
+    print('Результат: %s' % path)
+
+
+def _cell(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return '%.1f' % value if abs(value) >= 1 or value == 0 else '%.3f' % value
+    return str(value)
+
+
+def print_table(endpoints):
+    header = ['endpoint'] + list(COLUMNS)
+    rows = [[name] + [_cell(metrics.get(column)) for column in COLUMNS] for name, metrics in endpoints.items()]
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print('  '.join(cell.rjust(width) if i else cell.ljust(width) for i, (cell, width) in enumerate(zip(row, widths))))
+
+
+def compare(options):
+    """
+    Пропускная способность и p95 по endpoint для нескольких сохранённых прогонов, изменение к первому
+    """
+    runs = [json.loads(Path(path).read_text()) for path in options.files]
+    names = []
+    for result in runs:
+        names.extend(name for name in result['endpoints'] if name not in names)
+    print('runs: ' + ', '.join('%s@%s%s' % (r['label'] or r['config']['mix'], r['commit'], '+' if r['dirty'] else '')
+                               for r in runs))
+    for metric in ('rps', 'p95', 'errors'):
+        print('\n' + metric)
+        for name in names:
+            values = [r['endpoints'].get(name, {}).get(metric) for r in runs]
+            base = values[0]
+            cells = []
+            for value in values:
+                delta = '' if not base or value is None or value is base else ' (%+.0f%%)' % ((value / base - 1) * 100)
+                cells.append(_cell(value) + delta)
+            print('  %-12s ' % name + '  '.join('%-18s' % cell for cell in cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m loadtest', description='Нагрузочный стенд сайта')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Запустить стенд и прогнать смесь трафика')
+    run_parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+    run_parser.add_argument('--concurrency', type=int, default=16, help='Одновременных клиентов')
+    run_parser.add_argument('--duration', type=float, default=30, help='Секунд измерения')
+    run_parser.add_argument('--warmup', type=float, default=5, help='Секунд прогрева без учёта')
+    run_parser.add_argument('--workers', type=int, default=1, help='Воркеров uvicorn')
+    run_parser.add_argument('--shares', type=int, default=50, help='Акций в базе стенда')
+    run_parser.add_argument('--years', type=int, default=3, help='Лет истории в базе стенда')
+    run_parser.add_argument('--iss-delay', type=float, default=50, help='Задержка заглушки ISS, мс')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--isolate', action='store_true',
+                            help='Прогнать endpoint по очереди, чтобы отнести к ним ресурсы сервера')
+    run_parser.add_argument('--root', default=str(SITE_DIR / 'data' / 'loadtest' / 'stand'), help='Каталог стенда')
+    run_parser.add_argument('--results', default=str(RESULTS_DIR))
+    run_parser.add_argument('--label', help='Подпись прогона в сравнении')
+
+    compare_parser = commands.add_parser('compare', help='Сравнить сохранённые прогоны')
+    compare_parser.add_argument('files', nargs='+')
+
+    options = parser.parse_args(argv)
+    if options.command == 'run':
+        unknown = set(MIXES[options.mix]) - set(ENDPOINTS)
+        if unknown:
+            parser.error('Нет endpoint: %s' % ', '.join(unknown))
+        run(options)
+    else:
+        compare(options)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import datetime as dt
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+
+import numpy as np
+
+
+def candles(ticker, start, end):
+    """
+    Детерминированные дневные свечи: одни и те же для тикера и периода в любом прогоне
+    """
+    first = dt.date.fromisoformat(start.replace('.', '-')[:10])
+    last = dt.date.fromisoformat(end.replace('.', '-')[:10])
+    days = [first + dt.timedelta(days=i) for i in range((last - first).days + 1)]
+    days = [day for day in days if day.weekday() < 5]
+    rng = np.random.default_rng(sum(map(ord, ticker)) + first.toordinal())
+    close = np.round(100 * np.exp(np.cumsum(rng.standard_normal(len(days)) * 0.015)), 2)
+    rows = []
+    for day, c in zip(days, close.tolist()):
+        rows.append({'begin': '%s 00:00:00' % day, 'end': '%s 23:59:59' % day, 'open': round(c * 0.995, 2),
+                     'high': round(c * 1.01, 2), 'low': round(c * 0.985, 2), 'close': c,
+                     'volume': int(rng.integers(10 ** 5, 10 ** 7)), 'value': 0.0})
+    return rows
+
+
+def board_day(tickers, date):
+    """
+    Итоги дня по бумагам режима торгов, как history/engines/.../boards/<board>/securities.json
+    """
+    rows = []
+    for ticker in tickers:
+        for candle in candles(ticker, date, date):
+            rows.append({'TRADEDATE': date, 'SECID': ticker, 'OPEN': candle['open'], 'LOW': candle['low'],
+                         'HIGH': candle['high'], 'CLOSE': candle['close'], 'VOLUME': candle['volume']})
+    return rows
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Задержка ответа, имитирует сеть до ISS
+    delay = 0.05
+    requests = 0
+    # Бумаги режима торгов в истории по дням и размер страницы с history.cursor
+    board = ()
+    page_size = 100
+    # Сделки текущей сессии: тикер -> строки TRADENO, TRADETIME, SYSTIME, PRICE, QUANTITY, BUYSELL
+    trades = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = parse.urlparse(self.path)
+        query = dict(parse.parse_qsl(url.query))
+        type(self).requests += 1
+        time.sleep(self.delay)
+        data = {}
+        if url.path.endswith('/candles.json'):
+            ticker = url.path.split('/')[-2]
+            # Всё отдаётся первой страницей, следующая пустая: клиенты ISS читают до пустого блока
+            data['candles'] = [] if int(query.get('start', 0)) else candles(ticker, query['from'], query['till'])
+        elif url.path.endswith('/trades.json'):
+            rows = self.trades.get(url.path.split('/')[-2], [])
+            after = int(query.get('tradeno', 0)) if query.get('next_trade') else 0
+            data['trades'] = [row for row in rows if row['TRADENO'] > after][:int(query.get('limit', 5000))]
+        elif '/boards/' in url.path and url.path.endswith('/securities.json'):
+            rows = board_day(self.board, query['date'])
+            start = int(query.get('start', 0))
+            data['history'] = rows[start:start + self.page_size]
+            data['history.cursor'] = [{'INDEX': start, 'TOTAL': len(rows), 'PAGESIZE': self.page_size}]
+        body = json.dumps([{'charsetinfo': {'name': 'utf-8'}}, data]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/iss/' % self.server_port
+
+
+def serve(port=0, delay=Handler.delay):
+    """
+    Заглушка ISS в фоновом потоке
+    :return: StubServer, адрес в .url
+    """
+    Handler.delay = delay
+    server = StubServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,64 @@
+import asyncio
+import contextvars
+import time
+
+from django.db.backends.signals import connection_created
+from django.utils.decorators import sync_and_async_middleware
+
+# Счётчики текущего запроса; contextvars доходят и до потока, где выполняется синхронное представление
+_request_stats = contextvars.ContextVar('loadtest_request_stats', default=None)
+
+
+def _count_queries(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if stats is not None:
+            stats['queries'] += 1
+            stats['db'] += time.perf_counter() - start
+
+
+def _install_wrapper(sender, connection, **kwargs):
+    # Объект соединения переживает переподключения между запросами, обёртка ставится один раз
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_queries)
+
+
+connection_created.connect(_install_wrapper)
+
+
+def _header(stats, start):
+    return 'app;dur=%.3f, db;dur=%.3f;desc="%d"' % ((time.perf_counter() - start) * 1000, stats['db'] * 1000,
+                                                    stats['queries'])
+
+
+@sync_and_async_middleware
+def server_timing(get_response):
+    """
+    Время обработки на сервере, время и число SQL-запросов в заголовке Server-Timing
+    """
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats = {'queries': 0, 'db': 0.0}
+            token = _request_stats.set(stats)
+            start = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _request_stats.reset(token)
+            response['Server-Timing'] = _header(stats, start)
+            return response
+    else:
+        def middleware(request):
+            stats = {'queries': 0, 'db': 0.0}
+            token = _request_stats.set(stats)
+            start = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _request_stats.reset(token)
+            response['Server-Timing'] = _header(stats, start)
+            return response
+    return middleware
@@ -0,0 +1,27 @@
+import os
+from pathlib import Path
+
+from sincereshares.settings import *  # noqa: F401,F403
+from sincereshares.settings import BASE_DIR, MIDDLEWARE
+
+# Настройки нагрузочного стенда: локальная SQLite вместо удалённой базы, каталоги данных внутри прогона
+RUN_ROOT = Path(os.environ.get('LOADTEST_ROOT', BASE_DIR / 'data' / 'loadtest' / 'stand'))
+
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': RUN_ROOT / 'db.sqlite3',
+    }
+}
+
+MIDDLEWARE = ['loadtest.middleware.server_timing'] + MIDDLEWARE
+
+SPARKLINE_ROOT = RUN_ROOT / 'sparklines'
+ARCHIVE_ROOT = RUN_ROOT / 'archive'
+TICK_ROOT = RUN_ROOT / 'ticks'
+SINGLEFLIGHT_ROOT = RUN_ROOT / 'singleflight'
+ASSET_ROOT = RUN_ROOT / 'assets'
+ALERT_ROOT = RUN_ROOT / 'alerts'
@@ -0,0 +1,170 @@
+import datetime as dt
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+from . import iss_stub
+
+SITE_DIR = Path(__file__).resolve().parent.parent
+SETTINGS_MODULE = 'loadtest.settings'
+# Секунд на запуск сервера до первого ответа
+STARTUP_TIMEOUT = 60
+SAMPLE_INTERVAL = 0.5
+
+
+def setup_django(root):
+    os.environ['LOADTEST_ROOT'] = str(root)
+    os.environ['DJANGO_SETTINGS_MODULE'] = SETTINGS_MODULE
+    import django
+
+    django.setup()
+
+
+def prepare_database(root, shares, years):
+    """
+    Локальная база стенда: миграции и синтетические котировки.
+    Готовая база с теми же параметрами переиспользуется, поэтому прогоны сравнимы.
+    :param root: каталог стенда
+    :param shares: число акций
+    :param years: лет дневной истории
+    """
+    from django.core.management import call_command
+    from django.db import transaction
+
+    marker = Path(root) / 'seed.json'
+    config = {'shares': shares, 'years': years}
+    if marker.exists() and json.loads(marker.read_text()) == config:
+        # Переиспользуемая база догоняет миграции текущего коммита
+        call_command('migrate', verbosity=0)
+        return
+    Path(root).mkdir(parents=True, exist_ok=True)
+    db = Path(root) / 'db.sqlite3'
+    if db.exists():
+        db.unlink()
+    call_command('migrate', verbosity=0)
+
+    from db.ingest import ingest_candles
+    from db.models import Share
+
+    end = dt.date(2026, 10, 16)
+    start = end.replace(year=end.year - years)
+    with transaction.atomic():
+        for i in range(shares):
+            ticker = 'L%03d' % i
+            share = Share.objects.create(ticker=ticker, name='Нагрузка %s' % i, slug=ticker.lower(),
+                                         isin='RU%010d' % i)
+            ingest_candles(share, iss_stub.candles(ticker, str(start), str(end)))
+    marker.write_text(json.dumps(config))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """
+    Сайт под uvicorn в отдельном процессе с заглушкой ISS и базой стенда
+    """
+
+    def __init__(self, root, iss_url, workers=1):
+        self.port = free_port()
+        self.url = 'http://127.0.0.1:%d' % self.port
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=SETTINGS_MODULE, LOADTEST_ROOT=str(root), ISS_URL=iss_url)
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'sincereshares.asgi:application', '--host', '127.0.0.1',
+             '--port', str(self.port), '--workers', str(workers), '--no-access-log', '--log-level', 'warning'],
+            cwd=SITE_DIR, env=env)
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            try:
+                httpx.get(self.url + '/api/market/', timeout=5)
+                break
+            except httpx.TransportError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError('Сервер стенда не запустился')
+                time.sleep(0.2)
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def _process_tree(pid):
+    # Процесс uvicorn и его воркеры по ppid из /proc
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open('/proc/%s/stat' % entry) as f:
+                    parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                pass
+    tree, frontier = {pid}, [pid]
+    while frontier:
+        frontier = [child for child, parent in parents.items() if parent in frontier and child not in tree]
+        tree.update(frontier)
+    return tree
+
+
+def _usage(pids):
+    ticks = os.sysconf('SC_CLK_TCK')
+    page = os.sysconf('SC_PAGE_SIZE')
+    cpu = rss = 0
+    for pid in pids:
+        try:
+            with open('/proc/%d/stat' % pid) as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open('/proc/%d/statm' % pid) as f:
+                rss += int(f.read().split()[1]) * page
+        except OSError:
+            continue
+        # utime и stime - 12-е и 13-е поля после имени процесса
+        cpu += (int(fields[11]) + int(fields[12])) / ticks
+    return cpu, rss
+
+
+class ResourceSampler:
+    """
+    Процессорное время и память процессов сервера по /proc, раз в SAMPLE_INTERVAL
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self.peak_rss = max(self.peak_rss, _usage(_process_tree(self.pid))[1])
+
+    def __enter__(self):
+        self.peak_rss = 0
+        self._cpu_start, _ = _usage(_process_tree(self.pid))
+        self._wall_start = time.perf_counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        cpu, rss = _usage(_process_tree(self.pid))
+        self.peak_rss = max(self.peak_rss, rss)
+        self.cpu_seconds = cpu - self._cpu_start
+        self.wall_seconds = time.perf_counter() - self._wall_start
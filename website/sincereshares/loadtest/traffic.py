@@ -0,0 +1,100 @@
+import asyncio
+import random
+import re
+import time
+
+import httpx
+import numpy as np
+
+SCREENS = ('rsi(14) < 40', 'close > sma(50)', 'change(20) > 5 and volume > sma(volume, 20)', 'close > max(60) * 0.95')
+
+# Запросы к сайту: имя -> функция (случайный генератор, тикеры) -> путь
+ENDPOINTS = {
+    'index': lambda rng, tickers: '/',
+    'shares': lambda rng, tickers: '/shares/',
+    'market': lambda rng, tickers: '/market/',
+    'api_market': lambda rng, tickers: '/api/market/',
+    'screener': lambda rng, tickers: '/api/screener/?' + _query(q=rng.choice(SCREENS)),
+    'portfolio': lambda rng, tickers: '/api/portfolio/?tickers=' + ','.join(rng.sample(tickers, 5)),
+    'risk': lambda rng, tickers: '/api/risk/?paths=20000&positions=' + ','.join(
+        '%s:%d' % (ticker, rng.randint(1, 100)) for ticker in rng.sample(tickers, 10)),
+}
+
+# Смеси трафика: доли запросов по ENDPOINTS
+MIXES = {
+    'chart': {'index': 1},
+    'browse': {'index': 3, 'shares': 2, 'market': 3, 'api_market': 2},
+    'api': {'api_market': 3, 'screener': 3, 'portfolio': 2, 'risk': 2},
+    'mixed': {'index': 2, 'shares': 1, 'market': 2, 'api_market': 2, 'screener': 2, 'portfolio': 1, 'risk': 1},
+}
+
+SERVER_TIMING = re.compile(r'(\w+);dur=([\d.]+)(?:;desc="(\d+)")?')
+
+
+def _query(**params):
+    return str(httpx.QueryParams(params))
+
+
+async def _worker(client, mix, tickers, seed, deadline, records):
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        path = ENDPOINTS[name](rng, tickers)
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            # Размер ответа по сети, после сжатия
+            status, size = response.status_code, response.num_bytes_downloaded
+            timing = {key: (float(dur), desc) for key, dur, desc in
+                      SERVER_TIMING.findall(response.headers.get('server-timing', ''))}
+        except httpx.HTTPError:
+            status, size, timing = 0, 0, {}
+        records.append((name, start, time.perf_counter() - start, status, size,
+                        timing.get('app', (np.nan, ''))[0], timing.get('db', (np.nan, ''))[0],
+                        int(timing.get('db', (0, '0'))[1] or 0)))
+
+
+async def drive(url, mix, tickers, concurrency, duration, seed=0):
+    """
+    Замкнутая нагрузка: concurrency клиентов шлют запросы один за другим до истечения duration секунд.
+    Каждый клиент выбирает запросы своим генератором от seed, поэтому последовательность воспроизводима.
+    :return: список (endpoint, начало, задержка, статус, байт, время на сервере мс, время SQL мс, запросов SQL)
+    """
+    records = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(_worker(client, mix, tickers, seed * 1000 + i, deadline, records)
+                               for i in range(concurrency)))
+    return records
+
+
+def summarize(records, duration):
+    """
+    Метрики по endpoint и итог по всем запросам
+    :return: {endpoint: {requests, rps, p50, p95, p99, errors, server_ms, db_ms, queries, bytes}}
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault(record[0], []).append(record)
+    groups['total'] = records
+    result = {}
+    for name, rows in groups.items():
+        latency = np.array([row[2] for row in rows]) * 1000
+        ok = np.array([200 <= row[3] < 400 for row in rows])
+        server, db, queries = (np.array([row[i] for row in rows], dtype=np.float64) for i in (5, 6, 7))
+        p50, p95, p99 = np.percentile(latency, [50, 95, 99]) if len(rows) else (np.nan,) * 3
+        result[name] = {
+            'requests': len(rows),
+            'rps': len(rows) / duration,
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+            'errors': float(1 - ok.mean()) if len(rows) else 0.0,
+            'server_ms': float(np.nanmean(server)) if np.isfinite(server).any() else None,
+            'db_ms': float(np.nanmean(db)) if np.isfinite(db).any() else None,
+            'queries': float(queries.mean()) if len(rows) else 0.0,
+            'bytes': float(np.mean([row[4] for row in rows])) if len(rows) else 0.0,
+        }
+    return result
@@ -0,0 +1,228 @@
+import datetime as dt
+import itertools
+import logging
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+
+from db.loader import load_prices
+from db.models import AdjustedPrice, CorporateAction, Price, Share
+from .moex import MoexAPI
+
+SECONDS_PER_DAY = 86400
+# Сдвиг номера акции в ключе (акция, день): дни с эпохи помещаются в 20 бит
+_KEY_SHIFT = 20
+# С 31.07.2023 MOEX перешла на T+1: до этого экс-дивидендный день был за торговый день до реестра
+T1_SINCE = dt.date(2023, 7, 31)
+BATCH_SIZE = 5000
+
+
+def _to_day(date):
+    return (date - dt.date(1970, 1, 1)).days
+
+
+def _from_day(day):
+    return dt.date(1970, 1, 1) + dt.timedelta(days=int(day))
+
+
+def cumulative_factors(row_share, row_time, close, act_share, act_day, act_kind, act_value):
+    """
+    Считаю множители корректировки сразу для всех акций
+    :param row_share: номера акций свечей, свечи отсортированы по (акция, время)
+    :param row_time: время свечей в секундах с эпохи
+    :param close: цены закрытия свечей
+    :param act_share: номера акций корпоративных действий
+    :param act_day: дата действия в днях с эпохи (реестр для дивиденда, торги после сплита)
+    :param act_kind: True для дивиденда, False для сплита
+    :param act_value: дивиденд на акцию или before/after для сплита
+    :return: (множители свечей, множители действий, экс-дни действий); nan и -1 у неприменимых действий
+    """
+    row_share = np.asarray(row_share, dtype=np.int64)
+    row_day = np.asarray(row_time, dtype=np.int64) // SECONDS_PER_DAY
+    close = np.asarray(close, dtype=np.float64)
+    act_share = np.asarray(act_share, dtype=np.int64)
+    act_day = np.asarray(act_day, dtype=np.int64)
+    act_kind = np.asarray(act_kind, dtype=bool)
+    act_value = np.asarray(act_value, dtype=np.float64)
+    n = len(row_day)
+    if n == 0:
+        return np.ones(0), np.full(len(act_day), np.nan), np.full(len(act_day), -1)
+
+    key = (row_share << _KEY_SHIFT) | row_day
+    act_base = act_share << _KEY_SHIFT
+    seg_start = np.searchsorted(row_share, act_share, 'left')
+    seg_end = np.searchsorted(row_share, act_share, 'right')
+
+    # Первая свеча в день действия или позже
+    first = np.searchsorted(key, act_base | act_day, 'left')
+    cut = first.copy()
+    valid = first < seg_end
+
+    # Дивиденды в режиме T+2: экс-дата на торговый день раньше закрытия реестра
+    t2 = act_kind & (act_day < _to_day(T1_SINCE))
+    has_prev = first > seg_start
+    shifted = t2 & has_prev
+    prev_day = row_day[first[shifted] - 1]
+    cut[shifted] = np.searchsorted(key, act_base[shifted] | prev_day, 'left')
+    valid = np.where(t2, has_prev, valid)
+
+    # Нужна цена закрытия накануне экс-даты
+    valid &= cut > seg_start
+    prev_close = np.where(valid, close[np.clip(cut - 1, 0, n - 1)], np.nan)
+    act_factor = np.where(act_kind, 1.0 - act_value / prev_close, act_value)
+    valid &= act_factor > 0
+    act_factor = np.where(valid, act_factor, np.nan)
+
+    # Множитель действия ложится на последнюю свечу до экс-даты и распространяется назад
+    delta = np.zeros(n + 1)
+    np.add.at(delta, cut[valid] - 1, np.log(act_factor[valid]))
+    suffix = np.cumsum(delta[::-1])[::-1]
+    row_end = np.searchsorted(row_share, row_share, 'right')
+    row_factor = np.exp(suffix[:n] - suffix[row_end])
+
+    ex_day = np.where(valid, row_day[np.clip(cut, 0, n - 1)], -1)
+    return row_factor, act_factor, ex_day
+
+
+def apply_factors(dates, ex_dates, factors):
+    """
+    Накопленный множитель для каждой даты по уже применённым действиям
+    :param dates: даты свечей (datetime64)
+    :param ex_dates: экс-даты действий (datetime64)
+    :param factors: множители действий
+    :return:
+    """
+    order = np.argsort(ex_dates)
+    ex_dates = np.asarray(ex_dates)[order]
+    # Произведение множителей всех действий с экс-датой позже свечи
+    suffix = np.append(np.cumprod(np.asarray(factors, dtype=np.float64)[order][::-1])[::-1], 1.0)
+    return suffix[np.searchsorted(ex_dates, dates, 'right')]
+
+
+def fetch_corporate_actions(shares=None):
+    """
+    Загружаю дивиденды и сплиты из ISS, уже известные действия пропускаются
+    :param shares:
+    :return: число новых действий
+    """
+    if shares is None:
+        shares = Share.objects.all()
+    by_ticker = {share.ticker: share for share in shares}
+    actions = []
+    for ticker, share in by_ticker.items():
+        for row in MoexAPI.dividends(ticker):
+            if row.get('value') is None or not row.get('registryclosedate'):
+                continue
+            actions.append(CorporateAction(share=share, kind=CorporateAction.DIVIDEND,
+                                           date=dt.date.fromisoformat(row['registryclosedate']),
+                                           value=row['value']))
+    for row in MoexAPI.splits():
+        share = by_ticker.get(row['secid'])
+        if share is None or not row.get('after'):
+            continue
+        actions.append(CorporateAction(share=share, kind=CorporateAction.SPLIT,
+                                       date=dt.date.fromisoformat(row['tradedate']),
+                                       value=row['before'] / row['after']))
+    before = CorporateAction.objects.count()
+    CorporateAction.objects.bulk_create(actions, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return CorporateAction.objects.count() - before
+
+
+def _bulk_create(objs):
+    # bulk_create сам превращает генератор в список, поэтому режу на пачки заранее
+    created = 0
+    objs = iter(objs)
+    while True:
+        batch = list(itertools.islice(objs, BATCH_SIZE))
+        if not batch:
+            return created
+        AdjustedPrice.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+        created += len(batch)
+
+
+def _load_prices(share_ids=None):
+    qs = Price.objects.all()
+    if share_ids is not None:
+        qs = qs.filter(share_id__in=share_ids)
+    columns = load_prices(qs, ('open', 'high', 'low', 'price'), with_share=True)
+    time = columns['time'].astype(np.int64)
+    ohlc = np.column_stack([columns['open'], columns['high'], columns['low'], columns['price']])
+    return columns['share_id'], time, ohlc, pd.to_datetime(time, unit='s', utc=True).to_pydatetime()
+
+
+def _action_arrays(actions):
+    return (np.array([a.share_id for a in actions], dtype=np.int64),
+            np.array([_to_day(a.date) for a in actions], dtype=np.int64),
+            np.array([a.kind == CorporateAction.DIVIDEND for a in actions], dtype=bool),
+            np.array([a.value for a in actions], dtype=np.float64))
+
+
+@transaction.atomic
+def rebuild_adjusted():
+    """
+    Полный пересчёт скорректированных котировок всего рынка за один векторный проход
+    :return: число записанных свечей
+    """
+    share, time, ohlc, dates = _load_prices()
+    actions = list(CorporateAction.objects.all())
+    row_factor, act_factor, ex_day = cumulative_factors(share, time, ohlc[:, 3], *_action_arrays(actions))
+    adjusted = ohlc * row_factor[:, None]
+
+    for action, factor, day in zip(actions, act_factor, ex_day):
+        applied = not np.isnan(factor)
+        action.factor = float(factor) if applied else None
+        action.ex_date = _from_day(day) if applied else None
+    CorporateAction.objects.bulk_update(actions, ['factor', 'ex_date'], batch_size=BATCH_SIZE)
+
+    AdjustedPrice.objects.all().delete()
+    return _bulk_create(
+        AdjustedPrice(share_id=s, date=d, open=o, high=h, low=lo, price=c, factor=f)
+        for s, d, (o, h, lo, c), f in zip(share.tolist(), dates, adjusted.tolist(), row_factor.tolist()))
+
+
+def _append_new_prices():
+    # Новые свечи позже всех применённых экс-дат, поэтому копируются с множителем 1
+    last = AdjustedPrice.objects.filter(share=OuterRef('share')).order_by('-date').values('date')[:1]
+    new = (Price.objects.annotate(last=Subquery(last))
+           .filter(Q(last__isnull=True) | Q(date__gt=F('last')))
+           .values_list('share_id', 'date', 'open', 'high', 'low', 'price', 'share__price_scale'))
+    return _bulk_create(AdjustedPrice(share_id=s, date=d, open=o / 10 ** sc, high=h / 10 ** sc, low=lo / 10 ** sc,
+                                      price=c / 10 ** sc)
+                        for s, d, o, h, lo, c, sc in new.iterator(chunk_size=BATCH_SIZE))
+
+
+def _apply_pending_actions():
+    pending = list(CorporateAction.objects.filter(factor__isnull=True))
+    if not pending:
+        return 0
+    share, time, ohlc, _ = _load_prices({a.share_id for a in pending})
+    _, act_factor, ex_day = cumulative_factors(share, time, ohlc[:, 3], *_action_arrays(pending))
+
+    applied = 0
+    for action, factor, day in zip(pending, act_factor, ex_day):
+        if np.isnan(factor):
+            # Экс-даты ещё нет в истории
+            continue
+        action.factor = float(factor)
+        action.ex_date = _from_day(day)
+        ex_start = dt.datetime.combine(action.ex_date, dt.time.min, tzinfo=dt.timezone.utc)
+        AdjustedPrice.objects.filter(share_id=action.share_id, date__lt=ex_start).update(
+            open=F('open') * factor, high=F('high') * factor, low=F('low') * factor,
+            price=F('price') * factor, factor=F('factor') * factor)
+        action.save(update_fields=['factor', 'ex_date'])
+        applied += 1
+    return applied
+
+
+@transaction.atomic
+def update_adjusted():
+    """
+    Инкрементальное обновление: дописываю новые свечи и применяю новые действия к истории
+    :return: (новых свечей, применённых действий)
+    """
+    appended = _append_new_prices()
+    applied = _apply_pending_actions()
+    logging.info('adjusted prices: %s new candles, %s actions applied', appended, applied)
+    return appended, applied
@@ -0,0 +1,324 @@
+import json
+import logging
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from db.loader import load_prices
+from db.models import Price, PriceAlert
+from .screener import FUNCTIONS, WARMUP
+
+# Уведомлений за один запрос при загрузке индекса
+LOAD_CHUNK = 100000
+# id в одном IN при подтверждении срабатываний, укладывается в лимит параметров SQLite
+CONFIRM_CHUNK = 900
+
+TRIGGER_FIELDS = ('id', 'user_id', 'share_id', 'share__ticker', 'kind', 'direction', 'threshold', 'level')
+Trigger = namedtuple('Trigger', 'alert_id user_id share_id ticker kind direction threshold level value time')
+
+
+class ThresholdBook:
+    """
+    Уровни уведомлений одной акции по одной величине (цена или индикатор), по возрастанию.
+    «Не ниже» срабатывают префиксом - все уровни до максимума пачки, «не выше» - суффиксом от минимума.
+    Граница ищется бинарным поиском, сработавшие отрезаются срезом: пачка стоит O(log n + k)
+    """
+
+    def __init__(self):
+        empty = (np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64), np.empty(0, dtype='datetime64[us]'))
+        self.sides = {PriceAlert.ABOVE: empty, PriceAlert.BELOW: empty}
+
+    def __len__(self):
+        return sum(len(ids) for _, ids, _ in self.sides.values())
+
+    def add(self, direction, levels, ids, created):
+        levels = np.asarray(levels, dtype=np.float64)
+        order = np.argsort(levels, kind='stable')
+        current, current_ids, current_created = self.sides[direction]
+        at = np.searchsorted(current, levels[order], side='right')
+        self.sides[direction] = (np.insert(current, at, levels[order]),
+                                 np.insert(current_ids, at, np.asarray(ids, dtype=np.int64)[order]),
+                                 np.insert(current_created, at, np.asarray(created, dtype='datetime64[us]')[order]))
+
+    def touches(self, direction, values, times, ends):
+        """
+        Уведомления стороны, уровень которых достигнут на свечах, закончившихся после их создания. Книга не меняется
+        :param direction: PriceAlert.ABOVE или BELOW
+        :param values: ряд пачки: high для «не ниже», low для «не выше»
+        :param times: начало свечей
+        :param ends: конец свечей
+        :return: (граница отрезка книги для discard, список (id, значение на свече касания, время свечи))
+        """
+        above = direction == PriceAlert.ABOVE
+        levels, ids, created = self.sides[direction]
+        # Накопленные максимум и минимум монотонны, первое касание уровня - тоже бинарный поиск
+        clean = np.where(np.isnan(values), -np.inf if above else np.inf, values)
+        running = (np.maximum if above else np.minimum).accumulate(clean)
+        if not len(running) or np.isinf(running[-1]):
+            return None, []
+        if above:
+            n = np.searchsorted(levels, running[-1], side='right')
+            part = slice(None, n)
+            first = np.searchsorted(running, levels[part], side='left')
+        else:
+            n = np.searchsorted(levels, running[-1], side='left')
+            part = slice(n, None)
+            first = np.searchsorted(-running, -levels[part], side='left')
+        # Свечи, закончившиеся до создания уведомления, не в счёт (догрузка истории, пачка с опозданием):
+        # для таких ищу первое касание после создания, обычно их единицы. Дневная свеча дня создания
+        # в счёт: время касания внутри дня неизвестно
+        for i in np.flatnonzero(ends[first] <= created[part]):
+            start = np.searchsorted(ends, created[part][i], side='right')
+            level = levels[part][i]
+            touch = np.flatnonzero(clean[start:] >= level if above else clean[start:] <= level)
+            first[i] = start + touch[0] if len(touch) else -1
+        hit = first >= 0
+        return n, list(zip(ids[part][hit].tolist(), values[first[hit]].tolist(), times[first[hit]].tolist()))
+
+    def discard(self, direction, n, taken):
+        """
+        Убираю из книги уведомления, снятые после touches
+        :param n: граница из touches, книга с тех пор не менялась
+        :param taken: id сработавших
+        """
+        levels, ids, created = self.sides[direction]
+        part = slice(None, n) if direction == PriceAlert.ABOVE else slice(n, None)
+        rest = slice(n, None) if direction == PriceAlert.ABOVE else slice(None, n)
+        keep = ~np.isin(ids[part], taken)
+        if not keep.any():
+            # Обычный случай - сработал весь отрезок: срез без копирования
+            self.sides[direction] = (levels[rest], ids[rest], created[rest])
+            return
+        arrays = ((levels[part][keep], levels[rest]), (ids[part][keep], ids[rest]),
+                  (created[part][keep], created[rest]))
+        if direction == PriceAlert.BELOW:
+            arrays = tuple(pair[::-1] for pair in arrays)
+        self.sides[direction] = tuple(np.concatenate(pair) for pair in arrays)
+
+    def crossings(self, high, low, times, ends):
+        """
+        Сработавшие уведомления по рядам пачки и свеча первого касания каждого уровня
+        :param high: ряд, с которым сравниваются «не ниже»
+        :param low: ряд для «не выше»
+        :param times: начало свечей
+        :param ends: конец свечей
+        :return: (список (id, значение на свече касания, время свечи), список (направление, граница, id) для discard)
+        """
+        result, taken = [], []
+        for direction, values in ((PriceAlert.ABOVE, high), (PriceAlert.BELOW, low)):
+            n, touched = self.touches(direction, values, times, ends)
+            if touched:
+                result.extend(touched)
+                taken.append((direction, n, [alert_id for alert_id, _, _ in touched]))
+        return result, taken
+
+
+class AlertIndex:
+    """
+    Активные уведомления в памяти процесса: акция -> величина -> ThresholdBook.
+    Величина None - цена (уведомления о цене и об изменении), иначе (индикатор, окно).
+    Новые уведомления дочитываются по id перед каждой пачкой; отменённые в другом процессе
+    отсеиваются при подтверждении срабатывания. Уведомление проверяется только по свечам,
+    закончившимся после его создания
+    """
+
+    def __init__(self):
+        self.books = {}
+        self.last_id = 0
+
+    def __len__(self):
+        return sum(len(book) for books in self.books.values() for book in books.values())
+
+    def refresh(self):
+        """
+        Добавляю уведомления, созданные после прошлой загрузки
+        :return: сколько добавлено
+        """
+        added = 0
+        while True:
+            rows = list(PriceAlert.objects.filter(active=True, id__gt=self.last_id).order_by('id').values_list(
+                'id', 'share_id', 'indicator', 'window', 'direction', 'level', 'created_at')[:LOAD_CHUNK])
+            if not rows:
+                return added
+            self.last_id = rows[-1][0]
+            added += len(rows)
+            groups = {}
+            for alert_id, share_id, indicator, window, direction, level, created in rows:
+                group = groups.setdefault((share_id, (indicator, window) if indicator else None, direction),
+                                          ([], [], []))
+                group[0].append(level)
+                group[1].append(alert_id)
+                group[2].append(timezone.make_naive(created, timezone.utc))
+            for (share_id, key, direction), (levels, ids, created) in groups.items():
+                self.books.setdefault(share_id, {}).setdefault(key, ThresholdBook()).add(direction, levels, ids,
+                                                                                         created)
+
+    def evaluate(self, batch):
+        """
+        Уведомления, которые сработали на пачке свечей. Индекс не меняется: снятые убирает discard
+        после подтверждения, чтобы сбой подтверждения их не терял
+        :param batch: пачка из db.signals.candles_ingested
+        :return: (список (id, значение, время свечи), снятия для discard)
+        """
+        share_ids = batch['share_id']
+        bounds = np.flatnonzero(np.diff(share_ids)) + 1
+        result, taken = [], []
+        for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(share_ids)]):
+            books = self.books.get(int(share_ids[start]))
+            if not books:
+                continue
+            times, ends = batch['time'][start:end], batch['end'][start:end]
+            indicators = [key for key in books if key is not None]
+            values = self._indicators(int(share_ids[start]), indicators, times) if indicators else {}
+            for key, book in books.items():
+                high, low = (batch['high'][start:end], batch['low'][start:end]) if key is None else (values[key],) * 2
+                found, book_taken = book.crossings(high, low, times, ends)
+                result.extend(found)
+                taken.extend((book,) + item for item in book_taken)
+        return result, taken
+
+    @staticmethod
+    def discard(taken):
+        """
+        Убираю из книг уведомления, найденные evaluate: сработавшие и уже неактивные в базе
+        :param taken: второй результат evaluate
+        """
+        for book, direction, n, ids in taken:
+            book.discard(direction, n, ids)
+
+    @staticmethod
+    def _indicators(share_id, keys, times):
+        """
+        Значения индикаторов на свечах пачки: история до пачки нужна для окна и разгона средних
+        :return: {(индикатор, окно): массив по times}
+        """
+        lookback = max(window * (WARMUP if name in ('ema', 'rsi') else 1) + 1 for name, window in keys)
+        history = Price.objects.filter(share_id=share_id, date__lt=_aware(times[0]))
+        start = history.order_by('-date').values_list('date', flat=True)[lookback - 1:lookback].first()
+        prices = Price.objects.filter(share_id=share_id, date__lte=_aware(times[-1]))
+        if start is not None:
+            prices = prices.filter(date__gte=start)
+        data = load_prices(prices, columns=('high', 'low', 'price'))
+        series = {'close': data['price'], 'high': data['high'], 'low': data['low']}
+        # Свечи пачки уже записаны в db.Price
+        position = np.searchsorted(data['time'], times)
+        result = {}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for name, window in keys:
+                fn, field = FUNCTIONS[name]
+                result[(name, window)] = fn(series[field][None, :], window)[0][position]
+        return result
+
+
+def _aware(time):
+    return timezone.make_aware(time.astype('datetime64[s]').item(), timezone.utc)
+
+
+def confirm(candidates):
+    """
+    Отмечаю уведомления сработавшими, если они ещё активны: их могли отменить
+    или уже отметить в другом процессе
+    :param candidates: список (id, значение, время свечи)
+    :return: список Trigger
+    """
+    found = {}
+    triggers = []
+    # Сработавшие на одной свече об один её high или low: одно UPDATE на группу, а не на строку
+    groups = {}
+    with transaction.atomic():
+        for i in range(0, len(candidates), CONFIRM_CHUNK):
+            chunk = candidates[i:i + CONFIRM_CHUNK]
+            rows = PriceAlert.objects.select_for_update(of=('self',)).filter(
+                id__in=[alert_id for alert_id, _, _ in chunk], active=True).values_list(*TRIGGER_FIELDS)
+            found.update((row[0], row) for row in rows)
+        for alert_id, value, time in candidates:
+            row = found.get(alert_id)
+            if row is None:
+                continue
+            time = timezone.make_aware(time, timezone.utc)
+            groups.setdefault((time, value), []).append(alert_id)
+            triggers.append(Trigger(*row, value, time))
+        for (time, value), ids in groups.items():
+            for i in range(0, len(ids), CONFIRM_CHUNK):
+                PriceAlert.objects.filter(id__in=ids[i:i + CONFIRM_CHUNK]).update(
+                    active=False, triggered_at=time, triggered_value=value)
+    return triggers
+
+
+class LogSink:
+    """
+    Срабатывания в журнал moexplot.alerts
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+    def __call__(self, triggers):
+        for trigger in triggers:
+            self.logger.info('alert %s: %s %s %s %s', trigger.alert_id, trigger.ticker, trigger.direction,
+                             trigger.level, trigger.value)
+
+
+class JsonlSink:
+    """
+    Срабатывания строками JSON в ALERT_ROOT/triggered.jsonl, файл читают доставщики уведомлений
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or Path(settings.ALERT_ROOT) / 'triggered.jsonl')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def __call__(self, triggers):
+        lines = ''.join(json.dumps(dict(trigger._asdict(), time=trigger.time.isoformat()), ensure_ascii=False) + '\n'
+                        for trigger in triggers)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+
+_index = None
+_sink = None
+_lock = threading.Lock()
+
+
+def alert_index():
+    """
+    Индекс процесса, при первом вызове загружает все активные уведомления
+    :return: AlertIndex
+    """
+    global _index
+    if _index is None:
+        _index = AlertIndex()
+    return _index
+
+
+def get_sink():
+    # Доставка подключается настройкой ALERT_SINK: путь к классу, экземпляр вызывается со списком Trigger
+    global _sink
+    if _sink is None:
+        _sink = import_string(settings.ALERT_SINK)()
+    return _sink
+
+
+def process_batch(batch):
+    """
+    Проверяю уведомления на записанной пачке свечей и отдаю сработавшие в доставку
+    :param batch: пачка из db.signals.candles_ingested
+    :return: список Trigger
+    """
+    with _lock:
+        index = alert_index()
+        index.refresh()
+        candidates, taken = index.evaluate(batch)
+        triggers = confirm(candidates) if candidates else []
+        # Только после подтверждения: если оно упало, уведомления остаются в индексе до следующей пачки
+        index.discard(taken)
+    if triggers:
+        get_sink()(triggers)
+    return triggers
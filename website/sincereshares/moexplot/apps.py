@@ -1,6 +1,24 @@
+import logging
+
 from django.apps import AppConfig
 
 
+def _check_alerts(sender, batch, **kwargs):
+    # Движок уведомлений тянет numpy, поэтому импортируется при первой пачке, а не при старте
+    from .alerts import process_batch
+
+    try:
+        process_batch(batch)
+    except Exception:
+        # Свечи уже записаны, сбой уведомлений не должен ломать загрузку
+        logging.getLogger(__name__).exception('price alerts failed')
+
+
 class MoexplotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'moexplot'
+
+    def ready(self):
+        from db.signals import candles_ingested
+
+        candles_ingested.connect(_check_alerts, dispatch_uid='moexplot.alerts')
@@ -0,0 +1,118 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from db.loader import load_prices
+from db.models import Price, Share
+
+ARCHIVE_COLUMNS = ('begin', 'open', 'high', 'low', 'close', 'volume')
+# Типы ключей секций: тикер вида 1234 не должен стать числом
+PARTITIONS = {'timeframe': 'INTEGER', 'ticker': 'VARCHAR', 'year': 'INTEGER'}
+
+
+def archive_root():
+    return Path(settings.ARCHIVE_ROOT)
+
+
+def partition_path(root, timeframe, ticker, year):
+    return Path(root) / ('timeframe=%s' % timeframe) / ('ticker=%s' % ticker) / ('year=%s' % year) / 'data.parquet'
+
+
+def _write(frame, path):
+    # Пишу во временный файл и подменяю, чтобы запрос не увидел половину файла
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    frame.to_parquet(tmp, index=False, compression='zstd', row_group_size=100000)
+    os.replace(tmp, path)
+
+
+def write_candles(ticker, timeframe, candles, root=None, merge=True):
+    """
+    Раскладываю свечи по файлам timeframe=/ticker=/year=
+    :param ticker:
+    :param timeframe: 1, 10, 60, 24 и т.д., как у ISS
+    :param candles: список словарей или DataFrame с колонками ARCHIVE_COLUMNS
+    :param root: корень архива (по умолчанию settings.ARCHIVE_ROOT)
+    :param merge: объединить с уже лежащими файлами за те же годы
+    :return: число записанных свечей
+    """
+    root = root or archive_root()
+    frame = pd.DataFrame(candles, columns=list(ARCHIVE_COLUMNS))
+    if frame.empty:
+        return 0
+    frame['begin'] = pd.to_datetime(frame['begin']).astype('datetime64[us]')
+    for name in ARCHIVE_COLUMNS[1:]:
+        frame[name] = frame[name].astype(np.float64)
+    for year, part in frame.groupby(frame['begin'].dt.year):
+        path = partition_path(root, timeframe, ticker, year)
+        if merge and path.exists():
+            part = pd.concat([pd.read_parquet(path, columns=list(ARCHIVE_COLUMNS)), part])
+        _write(part.sort_values('begin').drop_duplicates('begin', keep='last'), path)
+    return len(frame)
+
+
+def export_prices(shares=None, root=None):
+    """
+    Выгружаю дневные свечи db.Price в архив (timeframe=24), файлы акций перезаписываются целиком
+    :param shares: акции (по умолчанию все)
+    :param root:
+    :return: число выгруженных свечей
+    """
+    if shares is None:
+        shares = Share.objects.all()
+    written = 0
+    for share in shares:
+        columns = load_prices(Price.objects.filter(share=share))
+        frame = pd.DataFrame({
+            'begin': columns['time'],
+            'open': columns['open'],
+            'high': columns['high'],
+            'low': columns['low'],
+            'close': columns['price'],
+            'volume': columns['volume'],
+        })
+        written += write_candles(share.ticker, 24, frame, root, merge=False)
+    return written
+
+
+def connect(root=None, threads=None):
+    """
+    Соединение DuckDB с представлением candles над всем архивом.
+    Фильтры по timeframe, ticker и year отсекают файлы, остальные условия и выбор колонок
+    DuckDB передаёт в чтение Parquet.
+    :param root:
+    :param threads: по умолчанию все ядра
+    :return: duckdb.DuckDBPyConnection
+    """
+    import duckdb
+
+    root = Path(root or archive_root())
+    pattern = root / 'timeframe=*' / 'ticker=*' / 'year=*' / '*.parquet'
+    if not any(root.glob('timeframe=*/ticker=*/year=*/*.parquet')):
+        raise FileNotFoundError('Архив свечей пуст: %s' % root)
+    con = duckdb.connect(':memory:')
+    con.execute('SET threads TO %d' % (threads or os.cpu_count()))
+    hive_types = ', '.join("'%s': '%s'" % item for item in PARTITIONS.items())
+    con.execute("CREATE VIEW candles AS SELECT * FROM read_parquet('%s', hive_partitioning = true, "
+                "hive_types = {%s})" % (str(pattern).replace("'", "''"), hive_types))
+    return con
+
+
+def query(sql, params=None, root=None, threads=None):
+    """
+    Аналитический запрос к архиву, таблица candles:
+    begin, open, high, low, close, volume, timeframe, ticker, year
+    Например, средний объём 10-минутной свечи по часам за 2022 год:
+    SELECT hour(begin) AS hour, avg(volume) FROM candles WHERE timeframe = 10 AND year = 2022 GROUP BY 1 ORDER BY 1
+    :param sql:
+    :param params: параметры для плейсхолдеров ?
+    :return: DataFrame
+    """
+    con = connect(root, threads)
+    try:
+        return con.execute(sql, params or []).df()
+    finally:
+        con.close()
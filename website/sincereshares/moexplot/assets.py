@@ -0,0 +1,94 @@
+import gzip
+import hashlib
+import importlib.util
+import os
+import re
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    # Без пакета brotli отдаётся только gzip
+    brotli = None
+
+# Предпочитаемые сжатия: кодировка -> суффикс файла
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+CONTENT_TYPES = {'.js': 'application/javascript; charset=utf-8', '.css': 'text/css; charset=utf-8'}
+
+_names = {}
+_lock = threading.Lock()
+
+
+def asset_root():
+    return Path(settings.ASSET_ROOT)
+
+
+def plotly_source():
+    # Бандл, который идёт с пакетом plotly: версия совпадает с той, под которую строятся графики.
+    # Путь ищется без импорта plotly
+    package = importlib.util.find_spec('plotly').submodule_search_locations[0]
+    return Path(package) / 'package_data' / 'plotly.min.js'
+
+
+def _write(path, data):
+    tmp = path.with_name(path.name + '.%s.tmp' % os.getpid())
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def publish(source, stem):
+    """
+    Копия файла под именем с хешем содержимого и заранее сжатые варианты рядом с ней
+    :param source: исходный файл
+    :param stem: начало имени, например plotly
+    :return: имя опубликованного файла
+    """
+    data = Path(source).read_bytes()
+    suffix = ''.join(Path(source).suffixes)
+    name = '%s-%s%s' % (stem, hashlib.sha1(data).hexdigest()[:16], suffix)
+    root = asset_root()
+    root.mkdir(parents=True, exist_ok=True)
+    path = root / name
+    if not path.exists():
+        _write(path.with_name(name + '.gz'), gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            _write(path.with_name(name + '.br'), brotli.compress(data, quality=11))
+        # Основной файл последним: по нему видно, что сжатые варианты уже готовы
+        _write(path, data)
+    return name
+
+
+def plotly_name():
+    """
+    Имя опубликованного бандла plotly.js, при первом вызове в процессе публикует его
+    :return:
+    """
+    with _lock:
+        if 'plotly' not in _names:
+            _names['plotly'] = publish(plotly_source(), 'plotly')
+        return _names['plotly']
+
+
+def negotiate(name, accept_encoding):
+    """
+    Лучший из готовых вариантов файла для Accept-Encoding клиента
+    :param name: имя опубликованного файла
+    :param accept_encoding: заголовок запроса
+    :return: (путь, кодировка или None, Content-Type)
+    """
+    path = asset_root() / name
+    accepted = set()
+    for item in accept_encoding.lower().split(','):
+        encoding, _, params = item.partition(';')
+        # gzip;q=0 означает запрет
+        if not re.fullmatch(r'\s*q=0(\.0*)?\s*', params):
+            accepted.add(encoding.strip())
+    content_type = CONTENT_TYPES.get(path.suffix, 'application/octet-stream')
+    for encoding, suffix in ENCODINGS:
+        compressed = path.with_name(name + suffix)
+        if encoding in accepted and compressed.exists():
+            return compressed, encoding, content_type
+    return path, None, content_type
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+import weakref
+
+import httpx
+
+from .moex import history_key
+from .singleflight import SingleFlight
+
+# Параметры ответа ISS как у apimoex: расширенный json без метаданных
+BASE_QUERY = {'iss.json': 'extended', 'iss.meta': 'off'}
+# Пул соединений на один цикл событий
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+
+class AsyncMoexAPI:
+    """
+    Асинхронный клиент ISS с тем же интерфейсом, что moex.MoexAPI.
+    Соединения переиспользуются через общий httpx.AsyncClient своего цикла событий.
+    """
+    # Переопределяется переменной окружения, например для нагрузочного стенда с локальной заглушкой ISS
+    ISS_URL = os.environ.get('ISS_URL', 'https://iss.moex.com/iss/')
+    _clients = weakref.WeakKeyDictionary()
+    # Одинаковые одновременные загрузки свечей в цикле событий склеиваются в один запрос
+    history_flight = SingleFlight('history')
+
+    @classmethod
+    def client(cls):
+        loop = asyncio.get_running_loop()
+        client = cls._clients.get(loop)
+        if client is None or client.is_closed:
+            client = cls._clients[loop] = httpx.AsyncClient(limits=POOL_LIMITS, timeout=TIMEOUT)
+        return client
+
+    @classmethod
+    async def close(cls):
+        client = cls._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    @classmethod
+    async def _get(cls, url, arguments, start=0):
+        params = dict(BASE_QUERY, **arguments)
+        if start:
+            params['start'] = start
+        response = await cls.client().get(url, params=params)
+        response.raise_for_status()
+        # [charsetinfo, данные]
+        return response.json()[1]
+
+    @classmethod
+    async def _get_all(cls, url, arguments):
+        # Постраничная загрузка как в apimoex.ISSClient.get_all: по history.cursor или до пустого блока
+        result = {}
+        start = 0
+        while True:
+            data = await cls._get(url, arguments, start)
+            cursor = data.pop('history.cursor', None)
+            for key, value in data.items():
+                result.setdefault(key, []).extend(value)
+            if cursor:
+                start += cursor[0]['PAGESIZE']
+                if start >= cursor[0]['TOTAL']:
+                    return result
+            else:
+                block_size = len(next(iter(data.values()), []))
+                if not block_size:
+                    return result
+                start += block_size
+
+    @classmethod
+    async def download_history_data(cls, ticker, timeframe, start, end, columns, market='shares', engine='stock'):
+        key = history_key(ticker, timeframe, start, end, columns, market, engine)
+        return await cls.history_flight.ado(key, cls._download_history_data, ticker, timeframe, start, end, columns,
+                                            market, engine)
+
+    @classmethod
+    async def _download_history_data(cls, ticker, timeframe, start, end, columns, market='shares', engine='stock'):
+        url = cls.ISS_URL + 'engines/%s/markets/%s/securities/%s/candles.json' % (engine, market, ticker)
+        arguments = {'interval': timeframe, 'from': start, 'till': end, 'iss.only': 'candles,history.cursor',
+                     'candles.columns': ','.join(columns)}
+        try:
+            data = (await cls._get_all(url, arguments)).get('candles', [])
+        except Exception as e:
+            data = []
+            logging.exception(e)
+        return data
+
+    @classmethod
+    async def query(cls, request_url: str, arguments=None):
+        try:
+            response = await cls._get(cls.ISS_URL + request_url, arguments or {})
+        except Exception as e:
+            response = {}
+            logging.exception(e)
+        return response
+
+    @classmethod
+    async def query_all(cls, request_url: str, arguments=None):
+        try:
+            response = await cls._get_all(cls.ISS_URL + request_url, arguments or {})
+        except Exception as e:
+            response = {}
+            logging.exception(e)
+        return response
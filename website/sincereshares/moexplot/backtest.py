@@ -0,0 +1,165 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from . import shared
+from .matrix import MarketMatrix, ffill
+
+TRADING_DAYS = 252
+
+
+def rolling_mean(values, window):
+    """
+    Скользящее среднее вдоль оси времени, первые window - 1 значений nan
+    :param values: массив (акции x время)
+    :param window:
+    :return:
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.isfinite(values)
+    csum = np.cumsum(np.where(valid, values, 0.0), axis=-1)
+    count = np.cumsum(valid, axis=-1)
+    total = np.full_like(values, np.nan)
+    filled = np.zeros_like(count)
+    total[..., window - 1:] = csum[..., window - 1:]
+    total[..., window:] -= csum[..., :-window]
+    filled[..., window - 1:] = count[..., window - 1:]
+    filled[..., window:] -= count[..., :-window]
+    # Окна с пропусками не считаются
+    total[filled < window] = np.nan
+    return total / window
+
+
+def sma_crossover(close, fast, slow):
+    # В позиции, пока быстрая средняя выше медленной
+    with np.errstate(invalid='ignore'):
+        return equal_weight(rolling_mean(close, fast) > rolling_mean(close, slow))
+
+
+def momentum(close, lookback, top=10):
+    # Равные доли в top акциях с лучшей доходностью за lookback свечей
+    change = np.full_like(close, -np.inf)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        change[:, lookback:] = close[:, lookback:] / close[:, :-lookback] - 1.0
+    change[~np.isfinite(change)] = -np.inf
+    rank = np.argsort(np.argsort(-change, axis=0), axis=0)
+    return equal_weight((rank < top) & np.isfinite(change))
+
+
+def equal_weight(signals):
+    """
+    Перевожу булевы сигналы в равные веса среди отобранных акций на каждой свече
+    :param signals:
+    :return:
+    """
+    signals = np.asarray(signals, dtype=np.float64)
+    count = signals.sum(axis=0, keepdims=True)
+    return np.divide(signals, count, out=np.zeros_like(signals), where=count > 0)
+
+
+class BacktestResult:
+
+    def __init__(self, positions, trades, fill_prices, costs, returns, periods_per_year):
+        self.positions = positions
+        self.trades = trades
+        self.fill_prices = fill_prices
+        self.costs = costs
+        self.returns = returns
+        self.equity = np.cumprod(1.0 + returns)
+        self.periods_per_year = periods_per_year
+
+    def metrics(self):
+        periods = len(self.returns)
+        std = self.returns.std()
+        peak = np.maximum.accumulate(self.equity)
+        return {
+            'total_return': float(self.equity[-1] - 1.0),
+            'cagr': float(self.equity[-1] ** (self.periods_per_year / periods) - 1.0) if self.equity[-1] > 0 else -1.0,
+            'volatility': float(std * np.sqrt(self.periods_per_year)),
+            'sharpe': float(self.returns.mean() / std * np.sqrt(self.periods_per_year)) if std > 0 else 0.0,
+            'max_drawdown': float((self.equity / peak - 1.0).min()),
+            'turnover': float(np.abs(self.trades).sum() / periods * self.periods_per_year),
+            'trades': int(np.count_nonzero(self.trades)),
+            'costs': float(self.costs.sum()),
+        }
+
+
+def run_backtest(close, weights, commission=0.0005, lag=1, periods_per_year=TRADING_DAYS):
+    """
+    Бэктест по целевым весам для матрицы цен (акции x время)
+    :param close: цены закрытия, пропуски допустимы
+    :param weights: целевые веса, рассчитанные по закрытию той же свечи
+    :param commission: комиссия как доля от оборота
+    :param lag: через сколько свечей исполняется сигнал, не меньше 1
+    :param periods_per_year:
+    :return: BacktestResult
+    """
+    if lag < 1:
+        # Сигнал известен по закрытию свечи, исполнить его по закрытию предыдущей - заглядывание вперёд
+        raise ValueError('Задержка исполнения должна быть не меньше 1 свечи: %s' % lag)
+    close = ffill(np.asarray(close, dtype=np.float64))
+    weights = np.nan_to_num(np.asarray(weights, dtype=np.float64))
+
+    # Позиция на свече t набрана по закрытию t - 1 по сигналу t - lag
+    positions = np.zeros_like(weights)
+    positions[:, lag:] = weights[:, :-lag]
+    trades = np.diff(positions, axis=1, prepend=0.0)
+    fill_prices = np.full_like(close, np.nan)
+    fill_prices[:, 1:] = close[:, :-1]
+    fill_prices[trades == 0] = np.nan
+
+    asset_returns = np.zeros_like(close)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        asset_returns[:, 1:] = close[:, 1:] / close[:, :-1] - 1.0
+    asset_returns[~np.isfinite(asset_returns)] = 0.0
+
+    costs = np.abs(trades).sum(axis=0) * commission
+    returns = (positions * asset_returns).sum(axis=0) - costs
+    return BacktestResult(positions, trades, fill_prices, costs, returns, periods_per_year)
+
+
+def _run_chunk(strategy, param_sets, **options):
+    # Цены читаются из разделяемой памяти, общей для всех воркеров
+    close = shared.worker_matrix['close']
+    rows = []
+    for params in param_sets:
+        result = run_backtest(close, strategy(close, **params), **options)
+        rows.append(dict(params, **result.metrics()))
+    return rows
+
+
+def param_grid(**values):
+    """
+    Декартово произведение параметров: param_grid(fast=[5, 10], slow=[50, 100])
+    :param values:
+    :return: список словарей параметров
+    """
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+def sweep(close, strategy, param_sets, processes=None, chunk_size=None, **options):
+    """
+    Перебор параметров стратегии в пуле процессов
+    :param close: цены закрытия (акции x время)
+    :param strategy: функция уровня модуля strategy(close, **params) -> веса
+    :param param_sets: список словарей параметров, например из param_grid
+    :param processes: число процессов, по умолчанию все ядра
+    :param chunk_size: параметров на одну задачу
+    :param options: аргументы run_backtest
+    :return: DataFrame с параметрами и метриками
+    """
+    close = ffill(np.asarray(close, dtype=np.float64))
+    processes = processes or os.cpu_count()
+    if chunk_size is None:
+        chunk_size = max(1, len(param_sets) // (processes * 4))
+    chunks = [param_sets[i:i + chunk_size] for i in range(0, len(param_sets), chunk_size)]
+    matrix = MarketMatrix(range(close.shape[0]), np.arange(close.shape[1]), {'close': close})
+    with shared.SharedMatrix(matrix) as published, \
+            ProcessPoolExecutor(processes, initializer=shared.init_worker, initargs=(published.handle,)) as pool:
+        rows = pool.map(partial(_run_chunk, strategy, **options), chunks)
+        return pd.DataFrame(list(itertools.chain.from_iterable(rows)))
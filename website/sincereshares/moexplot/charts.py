@@ -0,0 +1,23 @@
+# Plotly тяжёлый (сотни модулей), поэтому импортируем его только при построении графика
+
+
+def candle_chart(data, without_slider=True):
+    import plotly.graph_objects as go
+
+    fig = go.Figure(data=[go.Candlestick(x=data['begin'],
+                                         open=data['open'],
+                                         high=data['high'],
+                                         low=data['low'],
+                                         close=data['close'])])
+    if without_slider:
+        fig.update_layout(xaxis_rangeslider_visible=False)
+    return fig
+
+
+def line_chart(data, column='close', with_slider=False):
+    import plotly.express as px
+
+    fig = px.line(data, x='begin', y=column)
+    if with_slider:
+        fig.update_xaxes(rangeslider_visible=True)
+    return fig
@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+
+from .matrix import MarketMatrix, ffill
+
+# Окно события и окно оценки рыночной модели в свечах относительно свечи события
+EVENT_WINDOW = (-5, 10)
+ESTIMATION_WINDOW = (-130, -11)
+# Меньше наблюдений в окне оценки - событие отбрасывается
+MIN_ESTIMATION = 60
+# Событий на один проход: ограничивает память под (события x окно)
+EVENT_CHUNK = 20000
+
+
+def candle_returns(close):
+    """
+    Доходности от последнего известного закрытия; nan, если на свече не было торгов
+    :param close: матрица закрытий (акции x время)
+    :return:
+    """
+    result = np.full_like(close, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result[:, 1:] = close[:, 1:] / ffill(close)[:, :-1] - 1.0
+    result[~np.isfinite(result)] = np.nan
+    return result
+
+
+def market_returns(returns):
+    # Равновзвешенный рынок по торговавшимся акциям
+    valid = np.isfinite(returns)
+    count = valid.sum(axis=0)
+    return np.divide(np.where(valid, returns, 0.0).sum(axis=0), count, out=np.full(returns.shape[1], np.nan),
+                     where=count > 0)
+
+
+def _gather(returns, market, share_idx, t0, window):
+    # Одна выборка (события x смещения) для доходностей акции и рынка, за краями истории nan
+    offsets = np.arange(window[0], window[1] + 1)
+    if not returns.shape[1]:
+        # Свечей нет совсем: все события за краями истории
+        empty = np.full((len(t0), len(offsets)), np.nan)
+        return empty, empty.copy()
+    idx = t0[:, None] + offsets[None, :]
+    inside = (idx >= 0) & (idx < returns.shape[1])
+    idx = np.clip(idx, 0, returns.shape[1] - 1)
+    r = np.where(inside, returns[share_idx[:, None], idx], np.nan)
+    m = np.where(inside, market[idx], np.nan)
+    return r, m
+
+
+class EventStudy:
+
+    def __init__(self, offsets, ar, valid, alpha, beta, sigma):
+        self.offsets = offsets
+        self.ar = ar
+        self.car = np.cumsum(ar, axis=1)
+        self.valid = valid
+        self.alpha = alpha
+        self.beta = beta
+        self.sigma = sigma
+
+    def summary(self):
+        """
+        Средние аномальные доходности по смещениям и t-статистика накопленной доходности
+        по разбросу между событиями
+        :return: DataFrame
+        """
+        car = self.car[self.valid]
+        n = len(car)
+        std = car.std(axis=0, ddof=1) if n > 1 else np.full(len(self.offsets), np.nan)
+        caar = car.mean(axis=0) if n else np.full(len(self.offsets), np.nan)
+        return pd.DataFrame({
+            'offset': self.offsets,
+            'aar': self.ar[self.valid].mean(axis=0) if n else np.nan,
+            'caar': caar,
+            't': np.divide(caar, std / np.sqrt(max(n, 1)), out=np.full_like(caar, np.nan), where=std > 0),
+            'positive': (car > 0).mean(axis=0) if n else np.nan,
+            'events': n,
+        })
+
+
+def event_study(matrix, share_idx, times, window=EVENT_WINDOW, estimation=ESTIMATION_WINDOW, market=None):
+    """
+    Аномальные доходности вокруг событий по рыночной модели r = alpha + beta * r_market.
+    Все события обрабатываются одной выборкой индексов из матрицы доходностей, без срезов по событиям.
+    :param matrix: MarketMatrix
+    :param share_idx: номер акции в matrix.tickers для каждого события
+    :param times: время событий (datetime64); событие относится к свече, в которую попадает
+    :param window: окно события (начало, конец) в свечах
+    :param estimation: окно оценки модели, должно заканчиваться до окна события
+    :param market: доходности рынка по свечам, по умолчанию равновзвешенные по матрице
+    :return: EventStudy
+    """
+    if estimation[1] >= window[0]:
+        raise ValueError('Окно оценки должно заканчиваться до окна события')
+    returns = candle_returns(matrix['close'])
+    market = market_returns(returns) if market is None else np.asarray(market, dtype=np.float64)
+    share_idx = np.asarray(share_idx, dtype=np.int64)
+    t0 = np.searchsorted(matrix.dates, np.asarray(times, dtype='datetime64[s]'), side='right') - 1
+    offsets = np.arange(window[0], window[1] + 1)
+
+    n_events = len(share_idx)
+    ar = np.zeros((n_events, len(offsets)))
+    alpha, beta, sigma = (np.full(n_events, np.nan) for _ in range(3))
+    observations = np.zeros(n_events, dtype=np.int64)
+    for start in range(0, n_events, EVENT_CHUNK):
+        part = slice(start, start + EVENT_CHUNK)
+        r, m = _gather(returns, market, share_idx[part], t0[part], estimation)
+        ok = np.isfinite(r) & np.isfinite(m)
+        n = observations[part] = ok.sum(axis=1)
+        r, m = np.where(ok, r, 0.0), np.where(ok, m, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_r, mean_m = r.sum(axis=1) / n, m.sum(axis=1) / n
+            dm = np.where(ok, m - mean_m[:, None], 0.0)
+            dr = np.where(ok, r - mean_r[:, None], 0.0)
+            b = (dm * dr).sum(axis=1) / (dm * dm).sum(axis=1)
+            a = mean_r - b * mean_m
+            resid = np.where(ok, dr - b[:, None] * dm, 0.0)
+            sigma[part] = np.sqrt((resid * resid).sum(axis=1) / (n - 2))
+        alpha[part], beta[part] = a, b
+
+        r, m = _gather(returns, market, share_idx[part], t0[part], window)
+        # Без торгов на свече цена не менялась, изменение попадёт в следующую торговую свечу
+        ar[part] = np.where(np.isfinite(r), r - (a[:, None] + b[:, None] * np.nan_to_num(m)), 0.0)
+
+    # Окно события целиком в истории и достаточно наблюдений для оценки модели
+    valid = (t0 >= 0) & (t0 + window[1] < returns.shape[1]) & np.isfinite(alpha) & np.isfinite(beta)
+    valid &= observations >= MIN_ESTIMATION
+    return EventStudy(offsets, ar, valid, alpha, beta, sigma)
+
+
+def mention_events(shares=None, start=None, end=None):
+    """
+    События - публикации видео с упоминанием акции (db.ShareMention)
+    :param shares: акции (по умолчанию все)
+    :return: (MarketMatrix, номера акций, время публикации)
+    """
+    from db.models import Share, ShareMention
+
+    if shares is None:
+        shares = Share.objects.all()
+    shares = list(shares)
+    matrix = MarketMatrix.from_db(shares, start, end)
+    rows = (ShareMention.objects.filter(share__in=shares, video__published_at__isnull=False)
+            .values_list('share_id', 'video__published_at'))
+    position = {share.pk: i for i, share in enumerate(shares)}
+    share_idx = np.array([position[share_id] for share_id, _ in rows], dtype=np.int64)
+    times = np.array([published.replace(tzinfo=None) for _, published in rows], dtype='datetime64[s]')
+    return matrix, share_idx, times
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from moexplot.adjustments import fetch_corporate_actions, rebuild_adjusted, update_adjusted
+
+
+class Command(BaseCommand):
+    help = 'Обновляет котировки, скорректированные на дивиденды и сплиты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fetch', action='store_true', help='Загрузить дивиденды и сплиты из ISS')
+        parser.add_argument('--rebuild', action='store_true', help='Пересчитать всю историю заново')
+
+    def handle(self, *args, **options):
+        if options['fetch']:
+            self.stdout.write('Новых корпоративных действий: %s' % fetch_corporate_actions())
+        if options['rebuild']:
+            self.stdout.write('Пересчитано свечей: %s' % rebuild_adjusted())
+        else:
+            appended, applied = update_adjusted()
+            self.stdout.write('Добавлено свечей: %s, применено действий: %s' % (appended, applied))
@@ -0,0 +1,44 @@
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from db.ingest import ingest_board_day
+from db.models import Share
+from db.rollups import refresh_rollups
+from moexplot.matrix import as_datetime
+from moexplot.moex import MoexAPI
+
+WORKERS = 4
+
+
+class Command(BaseCommand):
+    help = 'Загружает дневную историю всего режима торгов по датам: один постраничный запрос ISS на день'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=dt.date.fromisoformat, required=True)
+        parser.add_argument('--end', type=dt.date.fromisoformat, default=dt.date.today())
+        parser.add_argument('--board', default='TQBR')
+        parser.add_argument('--workers', type=int, default=WORKERS, help='Параллельных запросов к ISS')
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+        days = [start + dt.timedelta(days=i) for i in range((end - start).days + 1)]
+        shares = Share.objects.all()
+        tickers = dict(shares.values_list('ticker', 'pk'))
+        scales = dict(shares.values_list('pk', 'price_scale'))
+        touched = set()
+        candles = 0
+        with ThreadPoolExecutor(options['workers']) as pool:
+            # Запросы идут параллельно, запись - по порядку дней
+            for day, rows in zip(days, pool.map(lambda d: MoexAPI.board_history(d, options['board']), days)):
+                written = ingest_board_day(day, rows, tickers, scales)
+                touched.update(written)
+                candles += len(written)
+                if written:
+                    self.stdout.write('%s: %s акций' % (day, len(written)))
+        with transaction.atomic():
+            for share_id in touched:
+                refresh_rollups(share_id, as_datetime(start), as_datetime(end, end=True))
+        self.stdout.write('Свечей: %s, акций: %s' % (candles, len(touched)))
@@ -0,0 +1,25 @@
+import shutil
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from moexplot.assets import asset_root, brotli, plotly_name
+
+
+class Command(BaseCommand):
+    help = 'Публикует бандл plotly.js под именем с хешем вместе со сжатыми вариантами, чтобы не делать это в первом запросе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--copy-to', action='append', default=[], metavar='DIR',
+                            help='Положить копию plotly.min.js в каталог, например ../../experiment/plots')
+
+    def handle(self, *args, **options):
+        name = plotly_name()
+        for path in sorted(asset_root().glob(name + '*')):
+            self.stdout.write('%s %s КБ' % (path.name, path.stat().st_size // 1024))
+        if brotli is None:
+            self.stdout.write('Пакет brotli не установлен, варианта .br нет')
+        for directory in options['copy_to']:
+            target = Path(directory) / 'plotly.min.js'
+            shutil.copyfile(asset_root() / name, target)
+            self.stdout.write('Копия: %s' % target)
@@ -0,0 +1,30 @@
+import datetime as dt
+
+from django.core.management.base import BaseCommand
+
+from db.models import Share
+from moexplot.events import ESTIMATION_WINDOW, EVENT_WINDOW, event_study, mention_events
+
+
+class Command(BaseCommand):
+    help = 'Аномальные доходности акций вокруг публикации видео с их упоминанием'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', help='Тикеры (по умолчанию все акции)')
+        parser.add_argument('--before', type=int, default=-EVENT_WINDOW[0], help='Свечей до события')
+        parser.add_argument('--after', type=int, default=EVENT_WINDOW[1], help='Свечей после события')
+        parser.add_argument('--estimation', type=int, default=ESTIMATION_WINDOW[1] - ESTIMATION_WINDOW[0] + 1,
+                            help='Длина окна оценки рыночной модели')
+        parser.add_argument('--start', type=dt.date.fromisoformat)
+        parser.add_argument('--end', type=dt.date.fromisoformat)
+
+    def handle(self, *args, **options):
+        shares = Share.objects.all()
+        if options['tickers']:
+            shares = shares.filter(ticker__in=options['tickers'])
+        matrix, share_idx, times = mention_events(shares, options['start'], options['end'])
+        end = -options['before'] - 1
+        study = event_study(matrix, share_idx, times, (-options['before'], options['after']),
+                            (end - options['estimation'] + 1, end))
+        self.stdout.write('Событий: %s, учтено: %s' % (len(share_idx), study.valid.sum()))
+        self.stdout.write(study.summary().to_string(index=False))
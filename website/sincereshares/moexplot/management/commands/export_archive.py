@@ -0,0 +1,31 @@
+import datetime as dt
+
+from django.core.management.base import BaseCommand
+
+from db.models import Share
+from moexplot.archive import export_prices, write_candles
+from moexplot.moex import MoexAPI
+from moexplot.timeseries import FinTimeSeries
+
+
+class Command(BaseCommand):
+    help = 'Выгружает свечи в Parquet-архив для аналитических запросов (manage.py query_archive)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', help='Тикеры (по умолчанию все акции)')
+        parser.add_argument('--timeframe', type=int, default=24, help='Интервал свечей ISS')
+        parser.add_argument('--iss', action='store_true', help='Скачать из ISS, а не из db.Price')
+        parser.add_argument('--start', default='2010-01-01')
+        parser.add_argument('--end', default=str(dt.date.today()))
+
+    def handle(self, *args, **options):
+        shares = Share.objects.all()
+        if options['tickers']:
+            shares = shares.filter(ticker__in=options['tickers'])
+        if not options['iss'] and options['timeframe'] == 24:
+            self.stdout.write('Выгружено свечей: %s' % export_prices(shares))
+            return
+        for share in shares:
+            candles = MoexAPI.download_history_data(share.ticker, options['timeframe'], options['start'],
+                                                    options['end'], FinTimeSeries.STD_COLUMNS)
+            self.stdout.write('%s: %s свечей' % (share.ticker, write_candles(share.ticker, options['timeframe'], candles)))
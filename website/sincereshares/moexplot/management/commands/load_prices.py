@@ -0,0 +1,28 @@
+import datetime as dt
+
+from django.core.management.base import BaseCommand
+
+from db.ingest import ingest_candles
+from db.models import Price, Share
+from moexplot.moex import MoexAPI
+from moexplot.timeseries import FinTimeSeries
+
+
+class Command(BaseCommand):
+    help = 'Догружает дневные свечи из ISS в db.Price и обновляет свёртки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', help='Тикеры (по умолчанию все акции)')
+        parser.add_argument('--start', default='2010-01-01', help='Начало истории для новых акций')
+
+    def handle(self, *args, **options):
+        shares = Share.objects.all()
+        if options['tickers']:
+            shares = shares.filter(ticker__in=options['tickers'])
+        end = str(dt.date.today())
+        for share in shares:
+            last = Price.objects.filter(share=share).order_by('-date').values_list('date', flat=True).first()
+            # Последний день перезагружается: свеча могла быть незакрытой
+            start = str(last.date()) if last else options['start']
+            candles = MoexAPI.download_history_data(share.ticker, 24, start, end, FinTimeSeries.STD_COLUMNS)
+            self.stdout.write('%s: %s свечей' % (share.ticker, ingest_candles(share, candles)))
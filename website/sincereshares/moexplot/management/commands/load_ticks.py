@@ -0,0 +1,24 @@
+import datetime as dt
+
+from django.core.management.base import BaseCommand
+
+from db.models import Share
+from moexplot.ticks import compact, ingest_ticks, parts
+
+
+class Command(BaseCommand):
+    help = 'Догружает сделки текущей сессии из ISS в хранилище сделок и сжимает части прошлых дней'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', help='Тикеры (по умолчанию все акции)')
+        parser.add_argument('--no-compact', action='store_true', help='Не объединять части прошлых дней')
+
+    def handle(self, *args, **options):
+        tickers = options['tickers'] or list(Share.objects.values_list('ticker', flat=True))
+        for ticker in tickers:
+            self.stdout.write('%s: %s сделок' % (ticker, ingest_ticks(ticker)))
+            if options['no_compact']:
+                continue
+            days = sorted({path.parent.name[5:] for path in parts(ticker, end=dt.date.today() - dt.timedelta(days=1))})
+            for day in days:
+                compact(ticker, dt.date.fromisoformat(day))
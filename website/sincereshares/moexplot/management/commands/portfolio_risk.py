@@ -0,0 +1,34 @@
+import datetime as dt
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moexplot.risk import CONFIDENCE, HORIZON, MC_PATHS, portfolio_risk
+
+
+def position(value):
+    ticker, _, quantity = value.partition('=')
+    return ticker.upper(), float(quantity)
+
+
+class Command(BaseCommand):
+    help = 'Исторический и Монте-Карло VaR/CVaR портфеля акций по сохранённым котировкам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('positions', nargs='+', type=position, help='Позиции ТИКЕР=число акций, например SBER=100')
+        parser.add_argument('--date', type=dt.date.fromisoformat)
+        parser.add_argument('--confidence', type=float, default=CONFIDENCE)
+        parser.add_argument('--horizon', type=int, default=HORIZON, help='Горизонт в торговых днях')
+        parser.add_argument('--paths', type=int, default=MC_PATHS, help='Сценариев Монте-Карло')
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--processes', type=int, help='Процессов для симуляции, по умолчанию все ядра')
+
+    def handle(self, *args, **options):
+        try:
+            result = portfolio_risk(dict(options['positions']), options['date'], options['confidence'],
+                                    options['horizon'], options['paths'], options['seed'], options['processes'])
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write('Дата: %s, стоимость: %.2f, свечей истории: %s'
+                          % (result['date'], result['value'], result['observations']))
+        for method in ('historical', 'monte_carlo'):
+            self.stdout.write('%-12s VaR %.2f  CVaR %.2f' % (method, result[method + '_var'], result[method + '_cvar']))
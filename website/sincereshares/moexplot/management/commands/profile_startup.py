@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from moexplot.startup import measure_startup
+
+
+class Command(BaseCommand):
+    help = 'Профилирует импорт при старте: django.setup() + разрешение URL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=25, help='Сколько самых дорогих импортов показать')
+
+    def handle(self, *args, **options):
+        result = measure_startup()
+        self.stdout.write('django.setup() + resolve: %.3f s (процесс целиком %.3f s)'
+                          % (result['elapsed'], result['wall']))
+        if result['heavy']:
+            self.stdout.write(self.style.WARNING('Загружены тяжёлые модули: ' + ', '.join(result['heavy'])))
+
+        # Верхнеуровневые пакеты, отсортированные по cumulative времени
+        top_level = {}
+        for name, _, cumulative in result['imports']:
+            if not name.startswith(' '):
+                root = name.split('.')[0]
+                top_level[root] = max(top_level.get(root, 0), cumulative)
+        rows = sorted(top_level.items(), key=lambda r: r[1], reverse=True)[:options['top']]
+        self.stdout.write('%-40s %12s' % ('module', 'cumulative'))
+        for name, cumulative in rows:
+            self.stdout.write('%-40s %9.1f ms' % (name, cumulative / 1000))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from moexplot.archive import query
+
+
+class Command(BaseCommand):
+    help = 'Выполняет SQL над Parquet-архивом свечей, таблица candles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sql')
+        parser.add_argument('--threads', type=int, help='Потоков DuckDB (по умолчанию все ядра)')
+        parser.add_argument('--csv', help='Сохранить результат в CSV')
+
+    def handle(self, *args, **options):
+        result = query(options['sql'], threads=options['threads'])
+        if options['csv']:
+            result.to_csv(options['csv'], index=False)
+        self.stdout.write(result.to_string(index=False))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from moexplot.sparklines import SPARKLINE_DAYS, render_all
+
+
+class Command(BaseCommand):
+    help = 'Рисует спарклайны всех акций; картинки неизменившихся акций переиспользуются'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['png', 'svg'], default='png')
+        parser.add_argument('--processes', type=int, default=None, help='Процессов в пуле (по умолчанию все ядра)')
+        parser.add_argument('--days', type=int, default=SPARKLINE_DAYS, help='Глубина истории в днях')
+
+    def handle(self, *args, **options):
+        rendered, total = render_all(options['format'], options['processes'], options['days'])
+        self.stdout.write('Нарисовано %s из %s спарклайнов' % (rendered, total))
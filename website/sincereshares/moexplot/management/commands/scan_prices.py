@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from db.ingest import ingest_candles
+from db.integrity import CHECKS, SCAN_ROWS, refetch_ranges, scan
+from db.models import Share
+from moexplot.moex import MoexAPI
+from moexplot.timeseries import FinTimeSeries
+
+
+class Command(BaseCommand):
+    help = 'Проверяет историю db.Price на пропуски, дубли, неверные OHLC и нулевой объём'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', help='Тикеры (по умолчанию все акции)')
+        parser.add_argument('--check', action='append', choices=CHECKS, help='Проверки (по умолчанию все)')
+        parser.add_argument('--rows', type=int, default=SCAN_ROWS, help='Строк на один проход')
+        parser.add_argument('--refetch', action='store_true', help='Перезагрузить из ISS найденные интервалы')
+
+    def handle(self, *args, **options):
+        shares = None
+        if options['tickers']:
+            shares = Share.objects.filter(ticker__in=options['tickers'])
+        report = scan(shares, options['check'] or CHECKS, options['rows'])
+        for ticker, check, first, last, days in report:
+            self.stdout.write('%s %s %s..%s: %s дн.' % (ticker, check, first, last, days))
+        self.stdout.write('Плохих интервалов: %s' % len(report))
+        if not options['refetch']:
+            return
+        for ticker, ranges in refetch_ranges(report).items():
+            share = Share.objects.get(ticker=ticker)
+            for first, last in ranges:
+                candles = MoexAPI.download_history_data(ticker, 24, str(first), str(last), FinTimeSeries.STD_COLUMNS)
+                self.stdout.write('%s %s..%s: %s свечей' % (ticker, first, last, ingest_candles(share, candles)))
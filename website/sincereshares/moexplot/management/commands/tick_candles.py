@@ -0,0 +1,23 @@
+import datetime as dt
+
+from django.core.management.base import BaseCommand
+
+from moexplot.ticks import aggregate, read_ticks
+
+
+class Command(BaseCommand):
+    help = 'Строит свечи любого интервала с VWAP и числом сделок по хранилищу сделок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ticker')
+        parser.add_argument('--interval', default='5min', help="Например '30s', '5min', '1h'")
+        parser.add_argument('--start', type=dt.date.fromisoformat, default=dt.date.today())
+        parser.add_argument('--end', type=dt.date.fromisoformat)
+        parser.add_argument('--csv', help='Сохранить свечи в CSV')
+
+    def handle(self, *args, **options):
+        ticks = read_ticks(options['ticker'], options['start'], options['end'] or options['start'])
+        candles = aggregate(ticks, options['interval'])
+        if options['csv']:
+            candles.to_csv(options['csv'], index=False)
+        self.stdout.write(candles.to_string(index=False))
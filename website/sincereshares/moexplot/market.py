@@ -0,0 +1,77 @@
+import datetime as dt
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F, Max, Min, Window
+from django.db.models.functions import Lead, RowNumber
+from django.utils import timezone
+
+from db.models import PriceRollup, Share
+
+# Глубина поиска последней торговой сессии
+LAST_SESSION_LOOKBACK = dt.timedelta(days=14)
+YEAR_RANGE = dt.timedelta(weeks=52)
+
+
+def _overview_sql(now):
+    # Последний день и предыдущее закрытие по дневным свёрткам
+    by_share = {'partition_by': [F('share_id')], 'order_by': F('date').desc()}
+    last = (PriceRollup.objects.filter(period=PriceRollup.DAY, date__gte=now - LAST_SESSION_LOOKBACK)
+            .annotate(rn=Window(RowNumber(), **by_share), prev=Window(Lead('price'), **by_share))
+            .values('share_id', 'date', 'price', 'volume', 'rn', 'prev'))
+    # Диапазон за 52 недели по недельным свёрткам
+    year = (PriceRollup.objects.filter(period=PriceRollup.WEEK, date__gte=now - YEAR_RANGE)
+            .values('share_id').annotate(year_high=Max('high'), year_low=Min('low'))
+            .values('share_id', 'year_high', 'year_low'))
+    last_sql, last_params = last.query.sql_with_params()
+    year_sql, year_params = year.query.sql_with_params()
+    qn = connection.ops.quote_name
+    sql = ('SELECT s.{id}, s.{ticker}, s.{name}, l.{date}, l.{price}, l.{prev}, l.{volume}, y.{high}, y.{low} '
+           'FROM {share} s '
+           'LEFT JOIN ({last}) l ON l.{share_id} = s.{id} AND l.{rn} = 1 '
+           'LEFT JOIN ({year}) y ON y.{share_id} = s.{id} '
+           'ORDER BY s.{ticker}').format(
+        share=qn(Share._meta.db_table), last=last_sql, year=year_sql,
+        id=qn('id'), ticker=qn('ticker'), name=qn('name'), date=qn('date'), price=qn('price'), prev=qn('prev'),
+        volume=qn('volume'), high=qn('year_high'), low=qn('year_low'), share_id=qn('share_id'), rn=qn('rn'))
+    return sql, last_params + year_params
+
+
+def _query(now):
+    sql, params = _overview_sql(now)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    result = []
+    for pk, ticker, name, date, price, prev, volume, high, low in rows:
+        if isinstance(date, str):
+            # SQLite в сыром запросе отдаёт дату строкой
+            date = date[:10]
+        elif date is not None:
+            date = date.date().isoformat()
+        result.append({
+            'ticker': ticker,
+            'name': name,
+            'date': date,
+            'price': price,
+            'change': (price / prev - 1.0) * 100 if price is not None and prev else None,
+            'volume': volume,
+            'year_high': high,
+            'year_low': low,
+        })
+    return result
+
+
+def market_overview():
+    """
+    Последняя цена, изменение за день, объём и диапазон за 52 недели по всем акциям одним запросом.
+    Результат кэшируется до конца текущей минуты.
+    :return: список словарей по акциям, отсортированный по тикеру
+    """
+    now = timezone.now()
+    key = 'market-overview:%s' % now.strftime('%Y%m%d%H%M')
+    rows = cache.get(key)
+    if rows is None:
+        rows = _query(now)
+        cache.set(key, rows, 60 - now.second)
+    return rows
@@ -0,0 +1,134 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+# Поля db.Price, соответствующие FIELDS
+PRICE_FIELDS = ('open', 'high', 'low', 'price', 'volume')
+
+
+def as_datetime(value, end=False):
+    """
+    Привожу дату из запроса к aware datetime для фильтра по DateTimeField
+    :param value: date или datetime
+    :param end: для даты взять конец дня
+    :return:
+    """
+    from django.utils import timezone
+
+    if not isinstance(value, dt.datetime):
+        value = dt.datetime.combine(value, dt.time.max if end else dt.time.min)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def ffill(values):
+    """
+    Заполняю nan последним известным значением вдоль последней оси
+    :param values:
+    :return:
+    """
+    idx = np.where(np.isnan(values), 0, np.arange(values.shape[-1]))
+    np.maximum.accumulate(idx, axis=-1, out=idx)
+    return np.take_along_axis(values, idx, axis=-1)
+
+
+class MarketMatrix:
+    """
+    Котировки многих акций, выровненные по общей временной оси: поле -> массив (акции x время).
+    Отсутствующие свечи заполнены nan.
+    """
+
+    def __init__(self, tickers, dates, fields):
+        self.tickers = list(tickers)
+        self.dates = np.asarray(dates, dtype='datetime64[s]')
+        self.fields = fields
+
+    @classmethod
+    def from_columns(cls, tickers, ticker_idx, times, columns):
+        """
+        Собираю матрицу из длинных колонок (одна запись на свечу)
+        :param tickers: тикеры, на которые ссылается ticker_idx
+        :param ticker_idx: номер тикера для каждой свечи
+        :param times: время свечей (datetime64)
+        :param columns: поле -> значения для каждой свечи
+        :return:
+        """
+        dates, time_idx = np.unique(np.asarray(times, dtype='datetime64[s]'), return_inverse=True)
+        ticker_idx = np.asarray(ticker_idx)
+        fields = {}
+        for name, values in columns.items():
+            field = np.full((len(tickers), len(dates)), np.nan)
+            field[ticker_idx, time_idx] = values
+            fields[name] = field
+        return cls(tickers, dates, fields)
+
+    @classmethod
+    def from_series(cls, series):
+        """
+        Матрица из нескольких FinTimeSeries
+        :param series:
+        :return:
+        """
+        series = [ts for ts in series if not ts.is_empty()]
+        frame = pd.concat([ts.data.assign(_ticker=i) for i, ts in enumerate(series)], ignore_index=True)
+        return cls.from_columns([ts.ticker for ts in series], frame['_ticker'].to_numpy(),
+                                pd.to_datetime(frame['begin']).to_numpy(),
+                                {name: frame[name].to_numpy(dtype=np.float64) for name in FIELDS})
+
+    @classmethod
+    def from_db(cls, shares=None, start=None, end=None):
+        """
+        Матрица из сохранённых котировок db.Price
+        :param shares: акции (по умолчанию все)
+        :param start:
+        :param end:
+        :return:
+        """
+        from db.loader import load_prices
+        from db.models import Price, Share
+
+        if shares is None:
+            shares = Share.objects.all()
+        shares = list(shares)
+        qs = Price.objects.filter(share__in=shares)
+        if start is not None:
+            qs = qs.filter(date__gte=as_datetime(start))
+        if end is not None:
+            qs = qs.filter(date__lte=as_datetime(end, end=True))
+        columns = load_prices(qs, with_share=True)
+        pks = np.array([share.pk for share in shares], dtype=np.int64)
+        order = np.argsort(pks)
+        ticker_idx = order[np.searchsorted(pks, columns['share_id'], sorter=order)]
+        return cls.from_columns([share.ticker for share in shares], ticker_idx, columns['time'],
+                                {name: columns[column] for name, column in zip(FIELDS, PRICE_FIELDS)})
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    @property
+    def shape(self):
+        return len(self.tickers), len(self.dates)
+
+    def filled(self, field='close'):
+        """
+        Поле с пропусками, заполненными последним известным значением
+        :param field:
+        :return:
+        """
+        return ffill(self.fields[field])
+
+    def returns(self, field='close'):
+        """
+        Простые доходности от свечи к свече; первая колонка и пропуски равны 0
+        :param field:
+        :return:
+        """
+        prices = self.filled(field)
+        result = np.zeros_like(prices)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result[:, 1:] = prices[:, 1:] / prices[:, :-1] - 1.0
+        result[~np.isfinite(result)] = 0.0
+        return result
@@ -0,0 +1,14 @@
+from django.middleware.gzip import GZipMiddleware
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Сжатие gzip для страниц и JSON с данными графиков.
+    Админка не сжимается: в её формах CSRF-токен рядом с данными из запроса, это открывает BREACH.
+    Файлы (FileResponse) не трогаю: статика уже лежит сжатой, картинки не сжимаются
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or getattr(request.resolver_match, 'app_name', None) == 'admin':
+            return response
+        return super().process_response(request, response)
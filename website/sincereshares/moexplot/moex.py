@@ -0,0 +1,89 @@
+import logging
+import os
+
+import apimoex
+import requests
+
+from .singleflight import SingleFlight
+
+
+def history_key(ticker, timeframe, start, end, columns, market, engine):
+    return '|'.join(map(str, (ticker, timeframe, start, end, ','.join(columns), market, engine)))
+
+
+class MoexAPI:
+    # Переопределяется переменной окружения, например для нагрузочного стенда с локальной заглушкой ISS
+    ISS_URL = os.environ.get('ISS_URL', 'https://iss.moex.com/iss/')
+    # Одинаковые одновременные загрузки свечей идут в ISS одним запросом, статистика в history_flight.stats()
+    history_flight = SingleFlight('history')
+
+    @classmethod
+    def download_history_data(cls, ticker, timeframe, start, end, columns, market='shares', engine='stock'):
+        key = history_key(ticker, timeframe, start, end, columns, market, engine)
+        return cls.history_flight.do(key, cls._download_history_data, ticker, timeframe, start, end, columns,
+                                     market, engine)
+
+    @staticmethod
+    def _download_history_data(ticker, timeframe, start, end, columns, market='shares', engine='stock'):
+        with requests.Session() as session:
+            try:
+                data = apimoex.get_market_candles(session, ticker, timeframe, start, end,
+                                                  columns, market, engine)
+            except Exception as e:
+                data = []
+                logging.exception(e)
+        return data
+
+    @classmethod
+    def query(cls, request_url: str, arguments=None):
+        if arguments is None:
+            arguments = {}
+        with requests.Session() as session:
+            try:
+                iss = apimoex.ISSClient(session, cls.ISS_URL + request_url, arguments)
+                response = iss.get()
+            except Exception as e:
+                response = {}
+                logging.exception(e)
+        return response
+
+    @classmethod
+    def query_all(cls, request_url: str, arguments=None):
+        if arguments is None:
+            arguments = {}
+        with requests.Session() as session:
+            try:
+                iss = apimoex.ISSClient(session, cls.ISS_URL + request_url, arguments)
+                response = iss.get_all()
+            except Exception as e:
+                response = {}
+                logging.exception(e)
+        return response
+
+    @classmethod
+    def dividends(cls, secid):
+        # secid, isin, registryclosedate, value, currencyid
+        return cls.query('securities/%s/dividends.json' % secid).get('dividends', [])
+
+    @classmethod
+    def splits(cls, engine='stock'):
+        # tradedate, secid, before, after
+        return cls.query_all('statistics/engines/%s/splits.json' % engine).get('splits', [])
+
+    @classmethod
+    def board_history(cls, date, board='TQBR', market='shares', engine='stock'):
+        # Итоги дня по всем бумагам режима торгов одним постраничным ответом
+        # TRADEDATE, SECID, OPEN, LOW, HIGH, CLOSE, VOLUME
+        url = 'history/engines/%s/markets/%s/boards/%s/securities.json' % (engine, market, board)
+        arguments = {'date': str(date), 'history.columns': 'TRADEDATE,SECID,OPEN,LOW,HIGH,CLOSE,VOLUME'}
+        return cls.query_all(url, arguments).get('history', [])
+
+    @classmethod
+    def trades(cls, ticker, after=None, limit=5000, board='TQBR', market='shares', engine='stock'):
+        # Сделки текущей сессии после сделки с номером after, одна страница до limit сделок
+        # TRADENO, TRADETIME, SYSTIME, PRICE, QUANTITY, BUYSELL
+        url = 'engines/%s/markets/%s/boards/%s/securities/%s/trades.json' % (engine, market, board, ticker)
+        arguments = {'limit': limit, 'trades.columns': 'TRADENO,TRADETIME,SYSTIME,PRICE,QUANTITY,BUYSELL'}
+        if after is not None:
+            arguments.update(tradeno=after, next_trade=1)
+        return cls.query(url, arguments).get('trades', [])
@@ -0,0 +1,164 @@
+import numpy as np
+
+from .backtest import TRADING_DAYS
+
+# Итерации ускоренного проективного градиента на одно решение
+MAX_ITER = 300
+TOLERANCE = 1e-6
+# Шаги золотого сечения при поиске максимального Шарпа
+SHARPE_ITER = 12
+
+
+def estimate(returns, periods_per_year=TRADING_DAYS, shrinkage=0.1):
+    """
+    Ожидаемые доходности и ковариация по матрице доходностей (акции x время)
+    :param returns: простые доходности, nan для свечей без торгов
+    :param periods_per_year:
+    :param shrinkage: доля сжатия ковариации к диагонали, стабилизирует короткие истории
+    :return: (mu, cov) в годовом выражении
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    valid = np.isfinite(returns)
+    filled = np.where(valid, returns, 0.0)
+    count = np.maximum(valid.sum(axis=1), 1)
+    mu = filled.sum(axis=1) / count
+    centered = np.where(valid, returns - mu[:, None], 0.0)
+    # Попарная ковариация по общим свечам
+    pairs = np.maximum(valid.astype(np.float64) @ valid.T.astype(np.float64) - 1, 1)
+    cov = (centered @ centered.T) / pairs
+    cov = (1.0 - shrinkage) * cov + shrinkage * np.diag(np.diag(cov))
+    # Попарная оценка при разной длине истории может быть не положительно определённой
+    values, vectors = np.linalg.eigh(cov)
+    cov = (vectors * np.maximum(values, 1e-10)) @ vectors.T
+    return mu * periods_per_year, cov * periods_per_year
+
+
+def project(v, lower, upper):
+    """
+    Проекция строк v на множество {sum w = 1, lower <= w <= upper}.
+    sum(clip(v - tau)) кусочно-линейна по tau, поэтому сдвиг tau находится точно по отсортированным изломам.
+    :param v: массив (решения x акции)
+    :param lower:
+    :param upper:
+    :return:
+    """
+    k, n = v.shape
+    lower = np.broadcast_to(lower, (n,))
+    upper = np.broadcast_to(upper, (n,))
+    events = np.concatenate([v - upper, v - lower], axis=1)
+    order = np.argsort(events, axis=1)
+    events = np.take_along_axis(events, order, axis=1)
+    # Проходя v - upper, вес начинает убывать, проходя v - lower, упирается в нижнюю границу
+    slope = -np.cumsum(np.where(order < n, 1.0, -1.0), axis=1)
+    total = np.empty_like(events)
+    total[:, 0] = upper.sum()
+    total[:, 1:] = upper.sum() + np.cumsum(slope[:, :-1] * np.diff(events, axis=1), axis=1)
+    i = np.clip((total > 1.0).sum(axis=1), 1, 2 * n - 1)[:, None] - 1
+    base = np.take_along_axis(total, i, axis=1)
+    rate = np.take_along_axis(slope, i, axis=1)
+    tau = np.take_along_axis(events, i, axis=1) + (1.0 - base) / np.where(rate == 0, -1.0, rate)
+    return np.clip(v - tau, lower, upper)
+
+
+def solve(mu, cov, risk_aversion, lower=0.0, upper=1.0, start=None, step=None):
+    """
+    Пакетное решение max mu'w - gamma/2 w'Cw на ограниченном симплексе (FISTA)
+    :param mu:
+    :param cov:
+    :param risk_aversion: вектор gamma, по одному решению на значение; np.inf даёт минимум дисперсии
+    :param lower: нижняя граница веса
+    :param upper: верхняя граница веса
+    :param start: начальные веса (решения x акции) для тёплого старта
+    :param step: шаг градиента, по умолчанию 1 / max собственное число cov
+    :return: веса (решения x акции)
+    """
+    risk_aversion = np.atleast_1d(np.asarray(risk_aversion, dtype=np.float64))
+    n = len(mu)
+    # Минимум дисперсии: gamma -> inf, эквивалентно нулевому весу доходности
+    reward = np.where(np.isinf(risk_aversion), 0.0, 1.0 / np.where(np.isinf(risk_aversion), 1.0, risk_aversion))
+    if step is None:
+        step = gradient_step(cov)
+
+    if start is None:
+        start = np.full((len(risk_aversion), n), 1.0 / n)
+    w = project(np.array(start, dtype=np.float64), lower, upper)
+    y = w.copy()
+    t = 1.0
+    for _ in range(MAX_ITER):
+        # Градиент 0.5 w'Cw - mu'w / gamma
+        grad = y @ cov - reward[:, None] * mu[None, :]
+        w_next = project(y - step * grad, lower, upper)
+        t_next = (1.0 + np.sqrt(1.0 + 4.0 * t * t)) / 2
+        y = w_next + (t - 1.0) / t_next * (w_next - w)
+        done = np.abs(w_next - w).max() < TOLERANCE
+        w, t = w_next, t_next
+        if done:
+            break
+    return w
+
+
+def gradient_step(cov):
+    return 1.0 / max(np.linalg.eigvalsh(cov)[-1], 1e-12)
+
+
+def stats(weights, mu, cov, risk_free=0.0):
+    weights = np.atleast_2d(weights)
+    ret = weights @ mu
+    vol = np.sqrt(np.maximum(np.einsum('ij,jk,ik->i', weights, cov, weights), 0.0))
+    sharpe = np.divide(ret - risk_free, vol, out=np.zeros_like(ret), where=vol > 0)
+    return ret, vol, sharpe
+
+
+def min_variance(mu, cov, lower=0.0, upper=1.0):
+    return solve(mu, cov, [np.inf], lower, upper)[0]
+
+
+def mean_variance(mu, cov, risk_aversion, lower=0.0, upper=1.0):
+    return solve(mu, cov, [risk_aversion], lower, upper)[0]
+
+
+def efficient_frontier(mu, cov, points=30, lower=0.0, upper=1.0, batch=10):
+    """
+    Эффективная граница: от минимума дисперсии к максимальной доходности.
+    Решаю пачками по batch значений gamma, каждая пачка стартует с решений предыдущей.
+    :return: (gamma, веса (points x акции))
+    """
+    # gamma от почти чистой доходности до почти чистого риска
+    scale = np.abs(mu).max() / max(np.diag(cov).max(), 1e-12)
+    gammas = np.geomspace(1e4, 1e-2, points) * max(scale, 1e-6)
+    weights = np.empty((points, len(mu)))
+    step = gradient_step(cov)
+    previous = solve(mu, cov, [np.inf], lower, upper, step=step)
+    for i in range(0, points, batch):
+        part = gammas[i:i + batch]
+        weights[i:i + batch] = solve(mu, cov, part, lower, upper, np.repeat(previous[-1:], len(part), axis=0), step)
+        previous = weights[i:i + batch]
+    return gammas, weights
+
+
+def max_sharpe(mu, cov, risk_free=0.0, lower=0.0, upper=1.0, frontier=None):
+    """
+    Портфель с максимальным Шарпом: лучшая точка границы, уточнённая золотым сечением по log gamma
+    :return: веса
+    """
+    gammas, weights = frontier if frontier is not None else efficient_frontier(mu, cov, 30, lower, upper)
+    sharpe = stats(weights, mu, cov, risk_free)[2]
+    best = int(np.argmax(sharpe))
+    a = np.log(gammas[min(best + 1, len(gammas) - 1)])
+    b = np.log(gammas[max(best - 1, 0)])
+    start = np.repeat(weights[best:best + 1], 2, axis=0)
+    step = gradient_step(cov)
+    best_w, best_s = weights[best], sharpe[best]
+    ratio = (np.sqrt(5) - 1) / 2
+    for _ in range(SHARPE_ITER):
+        c = b - ratio * (b - a)
+        d = a + ratio * (b - a)
+        candidates = solve(mu, cov, np.exp([c, d]), lower, upper, start, step)
+        s = stats(candidates, mu, cov, risk_free)[2]
+        if s.max() > best_s:
+            best_w, best_s = candidates[int(np.argmax(s))], s.max()
+        if s[0] > s[1]:
+            b = d
+        else:
+            a = c
+    return best_w
@@ -0,0 +1,180 @@
+import datetime as dt
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .matrix import MarketMatrix
+
+CONFIDENCE = 0.99
+# Горизонт риска в торговых днях
+HORIZON = 1
+# Календарных дней истории для оценки: около трёх лет торгов
+HISTORY_DAYS = 3 * 365
+MC_PATHS = 100000
+# Ячеек (сценарии x акции) в одном блоке симуляции: ограничивает память блока ~32 МБ
+BLOCK_CELLS = 4000000
+# Меньше сценариев считается в текущем процессе: запуск пула дороже самой симуляции
+PARALLEL_PATHS = 200000
+
+
+def var_cvar(pnl, confidence=CONFIDENCE):
+    """
+    VaR и CVaR (expected shortfall) по сценариям прибыли и убытка
+    :param pnl: прибыль по сценариям, убыток отрицательный
+    :param confidence: уровень доверия, например 0.99
+    :return: (VaR, CVaR) как положительные суммы убытка
+    """
+    losses = -np.asarray(pnl, dtype=np.float64)
+    var = np.quantile(losses, confidence)
+    return float(var), float(losses[losses >= var].mean())
+
+
+def log_returns(matrix):
+    # Логарифмические доходности закрытий, без торгов доходность 0
+    return np.log1p(matrix.returns('close')[:, 1:])
+
+
+def horizon_returns(log_ret, horizon=HORIZON):
+    """
+    Перекрывающиеся доходности за horizon свечей по истории
+    :param log_ret: логарифмические доходности (акции x время)
+    :param horizon:
+    :return: простые доходности (акции x сценарии)
+    """
+    total = np.cumsum(log_ret, axis=1)
+    total = np.concatenate([np.zeros((len(log_ret), 1)), total], axis=1)
+    return np.expm1(total[:, horizon:] - total[:, :-horizon])
+
+
+def historical_var(log_ret, values, confidence=CONFIDENCE, horizon=HORIZON):
+    """
+    Историческое моделирование: нынешний портфель переоценивается по каждому прошлому окну horizon
+    :param log_ret: логарифмические доходности (акции x время)
+    :param values: стоимость позиций в рублях по акциям
+    :return: (VaR, CVaR)
+    """
+    return var_cvar(np.asarray(values, dtype=np.float64) @ horizon_returns(log_ret, horizon), confidence)
+
+
+def cholesky(cov):
+    """
+    Множитель Холецкого; вырожденную ковариацию (коллинеарные акции) сначала делаю положительно определённой
+    :param cov:
+    :return: нижнетреугольная L, L @ L.T = cov
+    """
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        values, vectors = np.linalg.eigh(cov)
+        floor = max(values.max(), 0.0) * 1e-10 + 1e-18
+        return np.linalg.cholesky((vectors * np.maximum(values, floor)) @ vectors.T)
+
+
+def simulate_pnl(mean, factor, values, paths, seed, block=None):
+    """
+    Сценарии прибыли портфеля: коррелированные нормальные лог-доходности mean + z @ factor.T, блоками
+    :param mean: средняя лог-доходность за горизонт по акциям
+    :param factor: множитель Холецкого ковариации за горизонт
+    :param values: стоимость позиций
+    :param paths: число сценариев
+    :param seed: SeedSequence или число
+    :param block: сценариев в блоке, по умолчанию по BLOCK_CELLS
+    :return: прибыль по сценариям
+    """
+    rng = np.random.default_rng(seed)
+    n = len(values)
+    block = block or max(1, BLOCK_CELLS // n)
+    pnl = np.empty(paths)
+    z = np.empty((min(block, paths), n))
+    for start in range(0, paths, block):
+        size = min(block, paths - start)
+        part = z[:size]
+        rng.standard_normal(out=part)
+        returns = part @ factor.T
+        returns += mean
+        np.expm1(returns, out=returns)
+        pnl[start:start + size] = returns @ values
+    return pnl
+
+
+# Параметры модели в процессе-воркере: передаются один раз при старте пула
+_worker_model = None
+
+
+def _init_worker(mean, factor, values):
+    global _worker_model
+    _worker_model = mean, factor, values
+
+
+def _simulate_task(task):
+    paths, seed = task
+    return simulate_pnl(*_worker_model, paths, seed)
+
+
+def monte_carlo_var(log_ret, values, confidence=CONFIDENCE, horizon=HORIZON, paths=MC_PATHS, seed=None,
+                    processes=None):
+    """
+    Монте-Карло: многомерное нормальное распределение лог-доходностей с ковариацией по истории.
+    Сценарии делятся на задачи с независимыми потоками случайных чисел из одного SeedSequence,
+    поэтому при заданном seed результат не зависит от числа процессов.
+    :param log_ret: логарифмические доходности (акции x время)
+    :param values: стоимость позиций в рублях по акциям
+    :param paths: число сценариев
+    :param seed: для воспроизводимости
+    :param processes: процессов в пуле, по умолчанию все ядра
+    :return: (VaR, CVaR)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    mean = log_ret.mean(axis=1) * horizon
+    factor = cholesky(np.atleast_2d(np.cov(log_ret)) * horizon)
+    # Задачи по BLOCK_CELLS * 4 ячеек: на каждый процесс приходится несколько задач
+    task_paths = max(1, BLOCK_CELLS * 4 // len(values))
+    sizes = [min(task_paths, paths - start) for start in range(0, paths, task_paths)]
+    tasks = list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+    processes = min(processes or os.cpu_count(), len(tasks))
+    if processes <= 1 or paths < PARALLEL_PATHS:
+        pnl = [simulate_pnl(mean, factor, values, size, task_seed) for size, task_seed in tasks]
+    else:
+        with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(mean, factor, values)) as pool:
+            pnl = list(pool.map(_simulate_task, tasks))
+    return var_cvar(np.concatenate(pnl), confidence)
+
+
+def portfolio_risk(positions, date=None, confidence=CONFIDENCE, horizon=HORIZON, paths=MC_PATHS, seed=None,
+                   processes=None, history_days=HISTORY_DAYS):
+    """
+    Риск портфеля акций из db.Share по сохранённым котировкам
+    :param positions: {тикер: число акций}, короткие позиции отрицательные
+    :param date: дата оценки, по умолчанию сегодня
+    :return: словарь стоимости портфеля, исторических и Монте-Карло VaR/CVaR
+    """
+    from db.models import Share
+
+    date = date or dt.date.today()
+    shares = list(Share.objects.filter(ticker__in=positions).order_by('ticker'))
+    missing = set(positions) - {share.ticker for share in shares}
+    if missing:
+        raise ValueError('Неизвестные тикеры: %s' % ', '.join(sorted(missing)))
+    matrix = MarketMatrix.from_db(shares, date - dt.timedelta(days=history_days), date)
+    traded = np.isfinite(matrix['close'])
+    if len(shares) != len(matrix.tickers) or not matrix.shape[1] or not traded.any(axis=1).all():
+        raise ValueError('Нет истории котировок по части акций')
+    # Общая история с начала торгов самой молодой акцией: до него её доходности были бы нулями
+    first = traded.argmax(axis=1).max()
+    log_ret = log_returns(matrix)[:, first:]
+    if log_ret.shape[1] < horizon + 1:
+        raise ValueError('Слишком короткая общая история котировок')
+    values = matrix.filled('close')[:, -1] * np.array([positions[t] for t in matrix.tickers], dtype=np.float64)
+    historical = historical_var(log_ret, values, confidence, horizon)
+    monte_carlo = monte_carlo_var(log_ret, values, confidence, horizon, paths, seed, processes)
+    return {
+        'date': str(matrix.dates[-1].astype('datetime64[D]')),
+        'value': float(values.sum()),
+        'positions': dict(zip(matrix.tickers, values.tolist())),
+        'historical_var': historical[0],
+        'historical_cvar': historical[1],
+        'monte_carlo_var': monte_carlo[0],
+        'monte_carlo_cvar': monte_carlo[1],
+        'observations': log_ret.shape[1],
+    }
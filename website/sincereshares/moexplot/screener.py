@@ -0,0 +1,256 @@
+import ast
+import datetime as dt
+from functools import lru_cache, reduce
+
+import numpy as np
+
+from .backtest import rolling_mean
+from .matrix import MarketMatrix, ffill
+
+# Поля матрицы, доступные в выражении
+SERIES = ('open', 'high', 'low', 'close', 'volume')
+# Свечей истории сверх самого длинного окна: разгон экспоненциальных средних
+WARMUP = 3
+# Календарных дней на одну торговую свечу с запасом на праздники
+CALENDAR_RATIO = 1.6
+MAX_WINDOW = 1000
+# Длина выражения: глубина дерева, а с ней и рекурсии разбора и вычисления, не больше её
+MAX_EXPRESSION = 500
+
+_COMPARE = {ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater, ast.GtE: np.greater_equal,
+            ast.Eq: np.equal, ast.NotEq: np.not_equal}
+_ARITHMETIC = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide}
+
+
+def ema(values, window):
+    # Экспоненциальное среднее с alpha = 2 / (n + 1), цикл по времени, векторно по акциям
+    return _smooth(values, 2.0 / (window + 1))
+
+
+def _smooth(values, alpha):
+    result = np.empty_like(values)
+    current = values[:, 0].copy()
+    for t in range(values.shape[1]):
+        column = values[:, t]
+        current = np.where(np.isnan(current), column, np.where(np.isnan(column), current,
+                                                                current + alpha * (column - current)))
+        result[:, t] = current
+    return result
+
+
+def rsi(close, window):
+    # RSI Уайлдера: сглаживание приростов и падений с alpha = 1 / n
+    delta = np.full_like(close, np.nan)
+    delta[:, 1:] = np.diff(close, axis=1)
+    gain = _smooth(np.where(delta > 0, delta, np.where(np.isnan(delta), np.nan, 0.0)), 1.0 / window)
+    loss = _smooth(np.where(delta < 0, -delta, np.where(np.isnan(delta), np.nan, 0.0)), 1.0 / window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(loss == 0, 100.0, 100.0 - 100.0 / (1.0 + gain / loss))
+
+
+def change(values, window):
+    # Изменение за window свечей в процентах
+    result = np.full_like(values, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result[:, window:] = (values[:, window:] / values[:, :-window] - 1.0) * 100
+    return result
+
+
+def rolling_max(values, window):
+    return _rolling(values, window, np.max)
+
+
+def rolling_min(values, window):
+    return _rolling(values, window, np.min)
+
+
+def rolling_std(values, window):
+    return _rolling(values, window, lambda w, axis: np.std(w, axis=axis, ddof=1))
+
+
+def _rolling(values, window, reducer):
+    result = np.full_like(values, np.nan)
+    if values.shape[1] >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=1)
+        result[:, window - 1:] = reducer(windows, axis=-1)
+    return result
+
+
+# Функция выражения -> (вычисление, поле по умолчанию)
+FUNCTIONS = {
+    'sma': (rolling_mean, 'close'),
+    'ema': (ema, 'close'),
+    'rsi': (rsi, 'close'),
+    'change': (change, 'close'),
+    'max': (rolling_max, 'high'),
+    'min': (rolling_min, 'low'),
+    'std': (rolling_std, 'close'),
+}
+
+
+class Screen:
+    """
+    Фильтр акций, заданный выражением, например
+    rsi(14) < 30 and volume > sma(volume, 20) and close > sma(200)
+    Выражение разбирается один раз в дерево; одинаковые подвыражения вычисляются один раз
+    над всей матрицей (акции x время).
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        if len(expression) > MAX_EXPRESSION:
+            raise ValueError('Ошибка в выражении: длиннее %s символов' % MAX_EXPRESSION)
+        self.lookback = 1
+        # Вызовы функций выводятся в ответе как столбцы
+        self.terms = {}
+        try:
+            self.root = self._compile(ast.parse(expression, mode='eval').body)
+        except SyntaxError as e:
+            raise ValueError('Ошибка в выражении: %s' % e.msg)
+        except RecursionError:
+            raise ValueError('Ошибка в выражении: слишком глубокая вложенность')
+
+    def _compile(self, node):
+        """
+        Привожу узел ast к каноническому кортежу, он же ключ кэша подвыражений
+        """
+        if isinstance(node, ast.BoolOp):
+            op = 'and' if isinstance(node.op, ast.And) else 'or'
+            return (op,) + tuple(self._compile(value) for value in node.values)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return ('not', self._compile(node.operand))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            return ('neg', self._compile(node.operand))
+        if isinstance(node, ast.Compare):
+            # a < b < c -> (a < b) and (b < c)
+            items = [self._compile(node.left)] + [self._compile(value) for value in node.comparators]
+            parts = []
+            for op, left, right in zip(node.ops, items, items[1:]):
+                if type(op) not in _COMPARE:
+                    self._fail('Сравнение %s не поддерживается' % type(op).__name__)
+                parts.append(('cmp', type(op), left, right))
+            return parts[0] if len(parts) == 1 else ('and',) + tuple(parts)
+        if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC:
+            return ('arith', type(node.op), self._compile(node.left), self._compile(node.right))
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return ('const', float(node.value))
+        if isinstance(node, ast.Name):
+            if node.id not in SERIES:
+                self._fail('Неизвестное поле %s, доступны: %s' % (node.id, ', '.join(SERIES)))
+            return ('series', node.id)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            return self._compile_call(node)
+        return self._fail('Недопустимая конструкция: %s' % ast.unparse(node))
+
+    def _compile_call(self, node):
+        name = node.func.id
+        if name not in FUNCTIONS:
+            self._fail('Неизвестная функция %s, доступны: %s' % (name, ', '.join(FUNCTIONS)))
+        args = list(node.args)
+        if len(args) == 1:
+            # sma(20) = sma(close, 20)
+            args.insert(0, ast.Name(id=FUNCTIONS[name][1]))
+        if len(args) != 2 or not isinstance(args[1], ast.Constant) or type(args[1].value) is not int \
+                or not 1 <= args[1].value <= MAX_WINDOW:
+            self._fail('%s: ожидается %s(поле, окно от 1 до %s)' % (name, name, MAX_WINDOW))
+        window = args[1].value
+        operand = self._compile(args[0])
+        # Функции считают по матрице акции x время: число или условие вместо ряда им не подходит
+        if not self._is_series(operand):
+            self._fail('%s: первый аргумент должен быть полем, функцией или арифметикой над ними, а не %s'
+                       % (name, ast.unparse(args[0])))
+        key = ('call', name, operand, window)
+        self.lookback = max(self.lookback, window * (WARMUP if name in ('ema', 'rsi') else 1) + 1)
+        self.terms.setdefault(key, ast.unparse(node))
+        return key
+
+    @classmethod
+    def _is_series(cls, key):
+        kind = key[0]
+        if kind in ('series', 'call'):
+            return True
+        if kind == 'arith':
+            return cls._is_series(key[2]) or cls._is_series(key[3])
+        if kind == 'neg':
+            return cls._is_series(key[1])
+        return False
+
+    @staticmethod
+    def _fail(message):
+        raise ValueError(message)
+
+    def evaluate(self, matrix):
+        """
+        Вычисляю выражение над матрицей
+        :param matrix: MarketMatrix
+        :return: (булев массив по акциям на последней свече, {текст вызова: значения на последней свече})
+        """
+        series = {
+            'volume': np.nan_to_num(matrix['volume']),
+        }
+        for name in ('open', 'high', 'low', 'close'):
+            series[name] = ffill(matrix[name])
+        memo = {}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mask = self._eval(self.root, series, memo)
+            values = {text: memo[key][:, -1] for key, text in self.terms.items()}
+        if np.ndim(mask) == 2:
+            return np.asarray(mask, dtype=bool)[:, -1], values
+        return np.full(matrix.shape[0], bool(mask)), values
+
+    def _eval(self, key, series, memo):
+        if key in memo:
+            return memo[key]
+        kind = key[0]
+        if kind == 'const':
+            result = key[1]
+        elif kind == 'series':
+            result = series[key[1]]
+        elif kind == 'call':
+            fn = FUNCTIONS[key[1]][0]
+            result = fn(self._eval(key[2], series, memo), key[3])
+        elif kind == 'arith':
+            result = _ARITHMETIC[key[1]](self._eval(key[2], series, memo), self._eval(key[3], series, memo))
+        elif kind == 'neg':
+            result = -self._eval(key[1], series, memo)
+        elif kind == 'cmp':
+            result = _COMPARE[key[1]](self._eval(key[2], series, memo), self._eval(key[3], series, memo))
+        elif kind == 'not':
+            result = np.logical_not(self._eval(key[1], series, memo))
+        elif kind == 'and':
+            result = reduce(np.logical_and, [self._eval(part, series, memo) for part in key[1:]])
+        else:
+            result = reduce(np.logical_or, [self._eval(part, series, memo) for part in key[1:]])
+        memo[key] = result
+        return result
+
+
+@lru_cache(maxsize=256)
+def compile_screen(expression):
+    return Screen(expression)
+
+
+def run_screen(expression, date=None, shares=None):
+    """
+    Отбираю акции по выражению на дату
+    :param expression:
+    :param date: дата расчёта, по умолчанию сегодня
+    :param shares: акции (по умолчанию все)
+    :return: (дата последней свечи, список словарей ticker, close и значения вызовов) для прошедших фильтр
+    """
+    screen = compile_screen(expression)
+    date = date or dt.date.today()
+    start = date - dt.timedelta(days=int(screen.lookback * CALENDAR_RATIO) + 10)
+    matrix = MarketMatrix.from_db(shares, start, date)
+    if not matrix.shape[1]:
+        return None, []
+    mask, values = screen.evaluate(matrix)
+    close = ffill(matrix['close'])[:, -1]
+    # Акции без торгов в последний месяц окна не показываю
+    active = np.isfinite(matrix['close'][:, -20:]).any(axis=1)
+    rows = []
+    for i in np.flatnonzero(mask & active):
+        row = {'ticker': matrix.tickers[i], 'close': float(close[i])}
+        row.update({text: None if not np.isfinite(v[i]) else float(v[i]) for text, v in values.items()})
+        rows.append(row)
+    return str(matrix.dates[-1].astype('datetime64[D]')), rows
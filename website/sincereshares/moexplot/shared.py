@@ -0,0 +1,121 @@
+import os
+import secrets
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .matrix import MarketMatrix
+
+PREFIX = 'sincereshares'
+# Подключённые в этом процессе сегменты: имя -> (SharedMemory, MarketMatrix)
+_attached = {}
+
+
+class SharedMatrixHandle:
+    """
+    Всё, что нужно процессу, чтобы подключиться к опубликованной матрице: передаётся воркерам вместо данных
+    """
+
+    def __init__(self, name, tickers, dates, fields, shape):
+        self.name = name
+        self.tickers = tickers
+        self.dates = dates
+        self.fields = fields
+        self.shape = shape
+
+
+def _views(buffer, handle, writeable):
+    data = np.ndarray((len(handle.fields),) + tuple(handle.shape), dtype=np.float64, buffer=buffer)
+    data.flags.writeable = writeable
+    return MarketMatrix(handle.tickers, handle.dates, {field: data[i] for i, field in enumerate(handle.fields)})
+
+
+def _release(shm):
+    try:
+        shm.close()
+    except BufferError:
+        # Снаружи ещё живы представления массивов: отображение закроется вместе с ними
+        pass
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class SharedMatrix:
+    """
+    MarketMatrix, опубликованная один раз в разделяемой памяти одним сегментом (поле x акции x время).
+    Воркеры получают handle и подключаются через attach без копирования: все процессы пула читают одну копию.
+    Сегмент живёт, пока открыт владелец: close(), выход из with или сборка объекта удаляют его.
+
+        with SharedMatrix(matrix) as shared:
+            with ProcessPoolExecutor(initializer=init_worker, initargs=(shared.handle,)) as pool:
+                ...
+    """
+
+    def __init__(self, matrix, fields=None, name=None):
+        """
+        :param matrix: MarketMatrix
+        :param fields: публикуемые поля, по умолчанию все
+        :param name: имя сегмента, по умолчанию уникальное для процесса
+        """
+        fields = list(fields or matrix.fields)
+        name = name or '%s-%s-%s' % (PREFIX, os.getpid(), secrets.token_hex(4))
+        size = len(fields) * matrix.shape[0] * matrix.shape[1] * 8
+        self._shm = shared_memory.SharedMemory(name, create=True, size=max(size, 1))
+        self.handle = SharedMatrixHandle(name, list(matrix.tickers), matrix.dates, fields, matrix.shape)
+        self.matrix = _views(self._shm.buf, self.handle, writeable=True)
+        for field in fields:
+            self.matrix[field][...] = matrix[field]
+        self._finalizer = weakref.finalize(self, _release, self._shm)
+
+    @property
+    def name(self):
+        return self.handle.name
+
+    def close(self):
+        # Представления владельца освобождаю до закрытия отображения
+        self.matrix = None
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(handle):
+    """
+    Подключаюсь к опубликованной матрице; повторный вызов в том же процессе возвращает те же представления
+    :param handle: SharedMatrix.handle
+    :return: MarketMatrix только для чтения поверх разделяемой памяти
+    """
+    attached = _attached.get(handle.name)
+    if attached is None:
+        shm = shared_memory.SharedMemory(handle.name)
+        attached = _attached[handle.name] = shm, _views(shm.buf, handle, writeable=False)
+    return attached[1]
+
+
+def detach(name):
+    attached = _attached.pop(name, None)
+    if attached is not None:
+        shm, _ = attached
+        try:
+            shm.close()
+        except BufferError:
+            pass
+
+
+# Матрица в процессе-воркере пула, см. init_worker
+worker_matrix = None
+
+
+def init_worker(handle):
+    """
+    initializer для ProcessPoolExecutor: матрица доступна воркеру как shared.worker_matrix
+    """
+    global worker_matrix
+    worker_matrix = attach(handle)
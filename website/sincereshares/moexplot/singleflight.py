@@ -0,0 +1,234 @@
+import asyncio
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: склеиваются только запросы внутри процесса
+    fcntl = None
+
+# Сколько секунд отметка ожидающего процесса считается живой
+WAIT_TTL = 600
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Одинаковые одновременные вызовы выполняются один раз, результат получают все.
+    Внутри процесса ожидающие потоки ждут ведущего, между процессами ведущие договариваются
+    через блокировку файла: кто дождался блокировки, берёт результат, записанный после начала своего ожидания.
+    Файлы блокировки и результата живут, только пока вызов кто-то ждёт.
+    Результат общий для всех вызвавших, изменять его нельзя.
+    """
+
+    def __init__(self, name, root=None):
+        self.name = name
+        self._root = root
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._tasks = {}
+        self.calls = 0
+        self.executions = 0
+        self.shared_local = 0
+        self.shared_remote = 0
+
+    def root(self):
+        if self._root is None:
+            try:
+                from django.conf import settings
+                self._root = Path(settings.SINGLEFLIGHT_ROOT)
+            except Exception:
+                self._root = Path(tempfile.gettempdir()) / 'sincereshares-singleflight'
+        return Path(self._root) / self.name
+
+    def _count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Вызываю fn(*args, **kwargs), если такой же вызов с ключом key ещё не выполняется
+        :param key: строка, одинаковая для одинаковых запросов
+        :param fn:
+        :return: результат fn
+        """
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            self._count('shared_local')
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = self._across_processes(key, fn, args, kwargs)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _files(self, key):
+        root = self.root()
+        root.mkdir(parents=True, exist_ok=True)
+        name = hashlib.sha1(key.encode()).hexdigest()
+        waiting = root / ('%s.%s-%s.wait' % (name, os.getpid(), threading.get_ident()))
+        return root, name, root / (name + '.lock'), root / (name + '.result'), waiting
+
+    def _finished(self, path, started):
+        # Вызов в другом процессе завершился, пока мы ждали блокировку
+        try:
+            with open(path, 'rb') as f:
+                finished, result = pickle.load(f)
+            if finished >= started:
+                self._count('shared_remote')
+                return True, result
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+        return False, None
+
+    def _publish(self, root, name, path, result):
+        # Результат пишется на диск, только если его ждут другие процессы
+        if self._waiters(root, name):
+            tmp = path.with_suffix('.%s.tmp' % os.getpid())
+            with open(tmp, 'wb') as f:
+                pickle.dump((time.time(), result), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+
+    def _release(self, root, name, lock_path, path, lock):
+        # Последний из ожидавших убирает за собой результат и файл блокировки
+        if not self._waiters(root, name):
+            path.unlink(missing_ok=True)
+            lock_path.unlink(missing_ok=True)
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        lock.close()
+
+    def _across_processes(self, key, fn, args, kwargs):
+        if fcntl is None:
+            self._count('executions')
+            return fn(*args, **kwargs)
+        started = time.time()
+        root, name, lock_path, path, waiting = self._files(key)
+        lock = self._acquire(lock_path, waiting)
+        try:
+            finished, result = self._finished(path, started)
+            if finished:
+                return result
+            self._count('executions')
+            result = fn(*args, **kwargs)
+            self._publish(root, name, path, result)
+            return result
+        finally:
+            self._release(root, name, lock_path, path, lock)
+
+    async def _across_processes_async(self, key, coro_fn, args, kwargs):
+        if fcntl is None:
+            self._count('executions')
+            return await coro_fn(*args, **kwargs)
+        started = time.time()
+        root, name, lock_path, path, waiting = self._files(key)
+        # Ожидание блокировки в потоке, цикл событий тем временем обслуживает остальные запросы
+        lock = await asyncio.get_running_loop().run_in_executor(None, self._acquire, lock_path, waiting)
+        try:
+            finished, result = self._finished(path, started)
+            if finished:
+                return result
+            self._count('executions')
+            result = await coro_fn(*args, **kwargs)
+            self._publish(root, name, path, result)
+            return result
+        finally:
+            self._release(root, name, lock_path, path, lock)
+
+    @staticmethod
+    def _acquire(lock_path, waiting):
+        """
+        Блокировка файла lock_path. Пока она занята, рядом лежит отметка waiting:
+        по ней владелец видит, что результат кому-то нужен
+        :return: открытый файл блокировки
+        """
+        while True:
+            lock = open(lock_path, 'a+b')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                waiting.touch()
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                finally:
+                    waiting.unlink(missing_ok=True)
+            # Прежний владелец мог удалить файл, пока мы ждали: блокировка удалённого файла ничего не защищает
+            try:
+                if os.stat(lock_path).st_ino == os.fstat(lock.fileno()).st_ino:
+                    return lock
+            except FileNotFoundError:
+                pass
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    @staticmethod
+    def _waiters(root, name):
+        # Отметки упавших процессов старше WAIT_TTL не считаются и удаляются
+        count = 0
+        for marker in root.glob(name + '.*.wait'):
+            try:
+                if time.time() - marker.stat().st_mtime > WAIT_TTL:
+                    marker.unlink()
+                else:
+                    count += 1
+            except FileNotFoundError:
+                pass
+        return count
+
+    async def ado(self, key, coro_fn, *args, **kwargs):
+        """
+        То же для корутин: внутри цикла событий ждут общую задачу, между процессами - та же блокировка файла
+        :param key:
+        :param coro_fn: async-функция
+        :return:
+        """
+        with self._lock:
+            self.calls += 1
+        # Задачи привязаны к своему циклу событий
+        loop_key = (asyncio.get_running_loop(), key)
+        task = self._tasks.get(loop_key)
+        if task is None:
+            task = self._tasks[loop_key] = asyncio.ensure_future(
+                self._across_processes_async(key, coro_fn, args, kwargs))
+            task.add_done_callback(lambda _: self._tasks.pop(loop_key, None))
+        else:
+            self._count('shared_local')
+        # shield: отмена одного ожидающего не отменяет общий запрос
+        return await asyncio.shield(task)
+
+    def stats(self):
+        with self._lock:
+            shared = self.shared_local + self.shared_remote
+            return {
+                'calls': self.calls,
+                'executions': self.executions,
+                'shared_local': self.shared_local,
+                'shared_remote': self.shared_remote,
+                # Доля вызовов, обслуженных чужим запросом
+                'coalescing_ratio': shared / self.calls if self.calls else 0.0,
+            }
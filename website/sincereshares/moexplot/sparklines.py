@@ -0,0 +1,120 @@
+import datetime as dt
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+# Меняется при изменении оформления, чтобы старые картинки не переиспользовались
+STYLE_VERSION = 1
+SPARKLINE_DAYS = 365
+# Размер в пикселях при dpi 100
+WIDTH, HEIGHT = 120, 32
+MANIFEST = 'manifest.json'
+
+
+def sparkline_root():
+    return Path(settings.SPARKLINE_ROOT)
+
+
+def content_name(ticker, closes, fmt):
+    """
+    Имя файла по содержимому: меняется только при изменении свечей или оформления
+    :param ticker:
+    :param closes:
+    :param fmt: png или svg
+    :return:
+    """
+    digest = hashlib.sha1(('%s:%s:%sx%s:' % (STYLE_VERSION, fmt, WIDTH, HEIGHT)).encode())
+    digest.update(np.ascontiguousarray(closes, dtype=np.float64).tobytes())
+    return '%s-%s.%s' % (ticker, digest.hexdigest()[:16], fmt)
+
+
+def read_manifest():
+    """
+    Тикер -> имя файла спарклайна
+    :return:
+    """
+    try:
+        with open(sparkline_root() / MANIFEST, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def load_closes(days=SPARKLINE_DAYS, shares=None):
+    """
+    Цены закрытия за последние days дней по всем акциям одним запросом
+    :param days:
+    :param shares:
+    :return: тикер -> массив цен
+    """
+    from db.loader import load_prices
+    from db.models import Price, Share
+    from .matrix import as_datetime
+
+    if shares is None:
+        shares = Share.objects.all()
+    tickers = dict(shares.values_list('pk', 'ticker'))
+    since = as_datetime(dt.date.today() - dt.timedelta(days=days))
+    columns = load_prices(Price.objects.filter(share_id__in=tickers, date__gte=since), ('price',), with_share=True)
+    bounds = np.flatnonzero(np.diff(columns['share_id'])) + 1
+    return {tickers[int(ids[0])]: closes
+            for ids, closes in zip(np.split(columns['share_id'], bounds), np.split(columns['price'], bounds))
+            if len(closes) > 1}
+
+
+def _render(task):
+    # Выполняется в процессе пула: matplotlib импортируется только здесь
+    path, closes = task
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(WIDTH / 100, HEIGHT / 100), dpi=100)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.axis('off')
+    color = '#2e7d32' if closes[-1] >= closes[0] else '#c62828'
+    ax.plot(closes, color=color, linewidth=1)
+    ax.set_xlim(0, len(closes) - 1)
+    ax.margins(y=0.1)
+    tmp = '%s.%s.tmp' % (path, os.getpid())
+    fig.savefig(tmp, format=Path(path).suffix[1:], transparent=True)
+    plt.close(fig)
+    os.replace(tmp, path)
+    return path
+
+
+def render_all(fmt='png', processes=None, days=SPARKLINE_DAYS, shares=None):
+    """
+    Рисую спарклайны всех акций в пуле процессов; неизменившиеся не перерисовываются
+    :param fmt: png или svg
+    :param processes:
+    :param days:
+    :param shares:
+    :return: (нарисовано, всего)
+    """
+    root = sparkline_root()
+    root.mkdir(parents=True, exist_ok=True)
+    closes = load_closes(days, shares)
+    manifest = {ticker: content_name(ticker, values, fmt) for ticker, values in closes.items()}
+    tasks = [(str(root / name), closes[ticker]) for ticker, name in manifest.items() if not (root / name).exists()]
+    if tasks:
+        with ProcessPoolExecutor(processes) as pool:
+            list(pool.map(_render, tasks, chunksize=max(1, len(tasks) // (4 * (processes or os.cpu_count())))))
+
+    if shares is not None:
+        manifest = dict(read_manifest(), **manifest)
+    tmp = root / (MANIFEST + '.tmp')
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, sort_keys=True), encoding='utf-8')
+    os.replace(tmp, root / MANIFEST)
+
+    # Старые версии картинок больше не нужны
+    current = set(manifest.values())
+    for path in root.iterdir():
+        if path.suffix in ('.png', '.svg') and path.name not in current:
+            path.unlink()
+    return len(tasks), len(manifest)
@@ -0,0 +1,56 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Модули, которые не должны загружаться при старте воркера или manage.py
+HEAVY_MODULES = ('pandas', 'numpy', 'plotly', 'matplotlib', 'apimoex', 'dateutil', 'requests')
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+_PROBE = '''
+import json, sys, time
+t0 = time.perf_counter()
+import django
+django.setup()
+from django.urls import resolve
+resolve('/')
+elapsed = time.perf_counter() - t0
+heavy = sorted(m for m in %r if m in sys.modules)
+print(json.dumps({'elapsed': elapsed, 'heavy': heavy}))
+''' % (HEAVY_MODULES,)
+
+
+def parse_importtime(stderr):
+    """
+    Разбираю вывод python -X importtime
+    :param stderr:
+    :return: список (модуль, self мкс, cumulative мкс)
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Отступ в имени модуля показывает вложенность импорта
+        rows.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure_startup(settings_module='sincereshares.settings'):
+    """
+    Запускаю django.setup() + resolve('/') в чистом интерпретаторе
+    :param settings_module:
+    :return: словарь с временем старта, тяжёлыми модулями и временем импортов
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', _PROBE],
+                          cwd=PROJECT_DIR, env=env, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - started
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['wall'] = wall
+    result['imports'] = parse_importtime(proc.stderr)
+    return result
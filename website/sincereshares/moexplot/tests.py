@@ -1,3 +1,1048 @@
-from django.test import TestCase
+import datetime as dt
+import tempfile
+from pathlib import Path
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from moexplot.startup import measure_startup
+
+# Бюджет на django.setup() + resolve('/') в холодном процессе
+STARTUP_BUDGET_SECONDS = 1.5
+
+
+def seed_share(ticker, closes, start=dt.date(2021, 1, 4), spread=0.01):
+    """
+    Акция с дневными свечами по ценам закрытия, свечи подряд по будним дням
+    :return: db.Share
+    """
+    from db.ingest import ingest_candles
+    from db.models import Share
+
+    share = Share.objects.create(ticker=ticker, name=ticker, slug=ticker.lower(), isin='RU' + ticker.rjust(10, '0'))
+    days, day = [], start
+    while len(days) < len(closes):
+        if day.weekday() < 5:
+            days.append(day)
+        day += dt.timedelta(days=1)
+    ingest_candles(share, [{'begin': str(day), 'open': c, 'high': round(c * (1 + spread), 2),
+                            'low': round(c * (1 - spread), 2), 'close': c, 'volume': 1000}
+                           for day, c in zip(days, closes)])
+    return share
+
+
+def random_walk(n, seed, start=100.0, sigma=0.01):
+    rng = np.random.default_rng(seed)
+    return np.round(start * np.exp(np.cumsum(rng.normal(0.0003, sigma, n))), 2).tolist()
+
+
+class StartupImportTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.result = measure_startup()
+
+    def test_no_heavy_modules_on_startup(self):
+        self.assertEqual(self.result['heavy'], [])
+
+    def test_startup_within_budget(self):
+        self.assertLess(self.result['elapsed'], STARTUP_BUDGET_SECONDS)
+
+
+class PortfolioOptimizerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.mu = np.array([0.05, 0.10, 0.15])
+        self.cov = np.diag([0.01, 0.04, 0.09])
+
+    def test_projection_onto_bounded_simplex(self):
+        from moexplot.portfolio import project
+
+        w = project(np.array([[0.5, 0.5, 0.5], [3.0, -1.0, 0.2]]), 0.0, 0.6)
+        np.testing.assert_allclose(w.sum(axis=1), 1.0)
+        np.testing.assert_allclose(w[0], 1 / 3)
+        self.assertTrue(((w >= 0) & (w <= 0.6 + 1e-12)).all())
+
+    def test_min_variance_of_independent_assets(self):
+        from moexplot.portfolio import min_variance
+
+        # Для некоррелированных активов веса обратно пропорциональны дисперсии
+        expected = 1 / np.diag(self.cov) / (1 / np.diag(self.cov)).sum()
+        np.testing.assert_allclose(min_variance(self.mu, self.cov), expected, atol=1e-4)
+
+    def test_weight_bounds_respected(self):
+        from moexplot.portfolio import efficient_frontier
+
+        _, weights = efficient_frontier(self.mu, self.cov, 10, 0.1, 0.5)
+        np.testing.assert_allclose(weights.sum(axis=1), 1.0)
+        self.assertTrue(((weights >= 0.1 - 1e-9) & (weights <= 0.5 + 1e-9)).all())
+
+    def test_max_sharpe_not_worse_than_frontier(self):
+        from moexplot.portfolio import efficient_frontier, max_sharpe, stats
+
+        frontier = efficient_frontier(self.mu, self.cov, 20)
+        best = stats(max_sharpe(self.mu, self.cov, 0.02, frontier=frontier), self.mu, self.cov, 0.02)[2][0]
+        self.assertGreaterEqual(best + 1e-9, stats(frontier[1], self.mu, self.cov, 0.02)[2].max())
+
+
+class PortfolioViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for i, ticker in enumerate(('AAA', 'BBB', 'CCC')):
+            seed_share(ticker, random_walk(800, i), start=dt.date(2021, 1, 4))
+
+    def test_leap_day_end(self):
+        response = self.client.get('/api/portfolio/?end=2024-02-29')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['start'], '2021-02-28')
+
+    def test_weights_sum_to_one(self):
+        data = self.client.get('/api/portfolio/?end=2024-02-29&max_weight=0.5').json()
+        self.assertAlmostEqual(sum(data['min_variance']['weights'].values()), 1.0, places=4)
+        self.assertLessEqual(max(data['max_sharpe']['weights'].values()), 0.5 + 1e-6)
+
+
+class AdjustmentFactorTests(SimpleTestCase):
+
+    @staticmethod
+    def _rows(start, closes):
+        day = (start - dt.date(1970, 1, 1)).days
+        return np.zeros(len(closes), dtype=np.int64), (day + np.arange(len(closes))) * 86400, np.array(closes)
+
+    def test_dividend_after_t1(self):
+        from moexplot.adjustments import _to_day, cumulative_factors
+
+        share, time, close = self._rows(dt.date(2024, 3, 1), [100.0, 100.0, 100.0, 90.0, 90.0])
+        row, act, ex_day = cumulative_factors(share, time, close, [0], [_to_day(dt.date(2024, 3, 4))], [True], [10.0])
+        np.testing.assert_allclose(row, [0.9, 0.9, 0.9, 1.0, 1.0])
+        np.testing.assert_allclose(act, [0.9])
+        self.assertEqual(ex_day[0], _to_day(dt.date(2024, 3, 4)))
+
+    def test_dividend_before_t1_goes_ex_a_day_earlier(self):
+        from moexplot.adjustments import _to_day, cumulative_factors
+
+        share, time, close = self._rows(dt.date(2022, 3, 1), [100.0, 100.0, 80.0, 80.0])
+        row, _, ex_day = cumulative_factors(share, time, close, [0], [_to_day(dt.date(2022, 3, 4))], [True], [20.0])
+        np.testing.assert_allclose(row, [0.8, 0.8, 1.0, 1.0])
+        self.assertEqual(ex_day[0], _to_day(dt.date(2022, 3, 3)))
+
+    def test_split_and_inapplicable_action(self):
+        from moexplot.adjustments import _to_day, cumulative_factors
+
+        share, time, close = self._rows(dt.date(2024, 3, 1), [1000.0, 1000.0, 100.0])
+        # Сплит 1:10 и дивиденд раньше первой свечи, к которому нет цены накануне
+        row, act, ex_day = cumulative_factors(share, time, close, [0, 0],
+                                              [_to_day(dt.date(2024, 3, 3)), _to_day(dt.date(2024, 2, 1))],
+                                              [False, True], [0.1, 5.0])
+        np.testing.assert_allclose(row, [0.1, 0.1, 1.0])
+        self.assertTrue(np.isnan(act[1]))
+        self.assertEqual(ex_day[1], -1)
+
+    def test_apply_factors(self):
+        from moexplot.adjustments import apply_factors
+
+        dates = np.array(['2024-01-01', '2024-02-01', '2024-03-01'], dtype='datetime64[D]')
+        factors = apply_factors(dates, np.array(['2024-02-01', '2024-03-01'], dtype='datetime64[D]'), [0.5, 0.9])
+        np.testing.assert_allclose(factors, [0.45, 0.9, 1.0])
+
+
+class BacktestTests(SimpleTestCase):
+
+    def test_rolling_mean_skips_windows_with_gaps(self):
+        from moexplot.backtest import rolling_mean
+
+        result = rolling_mean(np.array([[1.0, 2.0, 3.0, np.nan, 5.0, 6.0]]), 2)
+        np.testing.assert_allclose(result[0], [np.nan, 1.5, 2.5, np.nan, np.nan, 5.5])
+
+    def test_buy_and_hold_with_lag_and_commission(self):
+        from moexplot.backtest import run_backtest
+
+        close = np.array([[100.0, 110.0, 121.0, 121.0]])
+        result = run_backtest(close, np.ones_like(close), commission=0.01, lag=1)
+        # Позиция набрана по закрытию первой свечи, комиссия один раз за вход
+        np.testing.assert_allclose(result.returns, [0.0, 0.1 - 0.01, 0.1, 0.0])
+        np.testing.assert_allclose(result.fill_prices[0, 1], 100.0)
+        self.assertEqual(result.metrics()['trades'], 1)
+        # Задержка длиннее истории - позиций нет
+        self.assertEqual(run_backtest(close, np.ones_like(close), lag=5).metrics()['trades'], 0)
+        with self.assertRaises(ValueError):
+            run_backtest(close, np.ones_like(close), lag=0)
+
+    def test_equal_weight_and_crossover(self):
+        from moexplot.backtest import equal_weight, sma_crossover
+
+        np.testing.assert_allclose(equal_weight([[1, 1, 0], [1, 0, 0]]), [[0.5, 1.0, 0.0], [0.5, 0.0, 0.0]])
+        close = np.array([[1.0, 2.0, 3.0, 4.0, 3.0, 2.0, 1.0]])
+        weights = sma_crossover(close, 1, 3)
+        np.testing.assert_allclose(weights[0], [0, 0, 1, 1, 0, 0, 0])
+
+    def test_sweep_matches_single_runs(self):
+        from moexplot.backtest import param_grid, run_backtest, sma_crossover, sweep
+
+        close = np.array([random_walk(300, seed) for seed in range(4)])
+        params = param_grid(fast=[3, 5], slow=[20, 40])
+        table = sweep(close, sma_crossover, params, processes=2)
+        for params in params:
+            row = table[(table['fast'] == params['fast']) & (table['slow'] == params['slow'])].iloc[0]
+            expected = run_backtest(close, sma_crossover(close, **params)).metrics()
+            self.assertAlmostEqual(row['sharpe'], expected['sharpe'])
+
+
+class FromDbTests(TestCase):
+
+    def test_weeks_come_from_rollups(self):
+        from moexplot.timeseries import FinTimeSeries
+
+        closes = random_walk(30, 7)
+        seed_share('AAA', closes, start=dt.date(2024, 1, 1))
+        days = FinTimeSeries.from_db('AAA', 24, dt.date(2024, 1, 1), dt.date(2024, 2, 29))
+        weeks = FinTimeSeries.from_db('AAA', 7, dt.date(2024, 1, 1), dt.date(2024, 2, 29))
+        self.assertEqual(len(days.column('close')), 30)
+        # Шесть полных недель по пять свечей
+        np.testing.assert_allclose(weeks.column('close'), np.array(closes)[4::5])
+        with self.assertRaises(ValueError):
+            FinTimeSeries.from_db('AAA', 60)
+
+
+class SparklineTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.settings = override_settings(SPARKLINE_ROOT=self.root.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        start = dt.date.today() - dt.timedelta(days=60)
+        self.shares = [seed_share(ticker, random_walk(30, i), start=start) for i, ticker in enumerate(('AAA', 'BBB'))]
+
+    def test_content_name(self):
+        from moexplot.sparklines import content_name
+
+        closes = np.array([1.0, 2.0, 3.0])
+        self.assertEqual(content_name('AAA', closes, 'svg'), content_name('AAA', closes.copy(), 'svg'))
+        self.assertNotEqual(content_name('AAA', closes, 'svg'), content_name('AAA', closes + 1, 'svg'))
+        self.assertRegex(content_name('AAA', closes, 'png'), r'^AAA-[0-9a-f]{16}\.png$')
+
+    def test_unchanged_shares_are_not_redrawn(self):
+        from moexplot.sparklines import read_manifest, render_all
+
+        self.assertEqual(render_all('svg', processes=1), (2, 2))
+        self.assertEqual(render_all('svg', processes=1), (0, 2))
+        old = read_manifest()
+        seed_share('CCC', random_walk(30, 5), start=dt.date.today() - dt.timedelta(days=60))
+        self.assertEqual(render_all('svg', processes=1), (1, 3))
+        self.assertEqual({k: v for k, v in read_manifest().items() if k != 'CCC'}, old)
+
+        response = self.client.get('/sparklines/%s' % old['AAA'])
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(self.client.get('/sparklines/AAA-0000000000000000.svg').status_code, 404)
+
+
+class MarketOverviewTests(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        # Обзор рынка кэшируется на минуту, в том числе пустой из других тестов
+        cache.clear()
+
+    def test_overview_values(self):
+        from django.utils import timezone
+        from moexplot.market import market_overview
+
+        seed_share('AAA', [100.0, 110.0], start=timezone.now().date() - dt.timedelta(days=5), spread=0.0)
+        row = market_overview()[0]
+        self.assertEqual((row['ticker'], row['price']), ('AAA', 110.0))
+        self.assertAlmostEqual(row['change'], 10.0)
+        self.assertEqual((row['year_low'], row['year_high']), (100.0, 110.0))
+
+    def test_share_names_are_not_rendered_as_html(self):
+        from db.models import Share
+
+        Share.objects.create(ticker='<b>X', name='<img src=x onerror=alert(1)>', slug='x', isin='RU0000000001')
+        response = self.client.get('/market/')
+        self.assertNotContains(response, '<img src=x')
+        self.assertNotContains(response, 'innerHTML')
+        self.assertContains(response, 'textContent')
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+
+    def test_partitions_merge_and_query(self):
+        from moexplot.archive import partition_path, query, write_candles
+
+        candles = [{'begin': '2022-12-30 10:00', 'open': 1, 'high': 2, 'low': 1, 'close': 2, 'volume': 10},
+                   {'begin': '2023-01-03 10:00', 'open': 2, 'high': 3, 'low': 2, 'close': 3, 'volume': 20}]
+        self.assertEqual(write_candles('1234', 10, candles, self.root.name), 2)
+        self.assertTrue(partition_path(self.root.name, 10, '1234', 2022).exists())
+        # Повтор свечи заменяет её, новая добавляется
+        write_candles('1234', 10, [dict(candles[1], close=4.0),
+                                   {'begin': '2023-01-03 10:10', 'open': 4, 'high': 4, 'low': 4, 'close': 4,
+                                    'volume': 5}], self.root.name)
+        frame = query('SELECT ticker, year, close, volume FROM candles WHERE ticker = ? ORDER BY begin', ['1234'],
+                      root=self.root.name, threads=1)
+        self.assertEqual(frame['ticker'].tolist(), ['1234'] * 3)
+        self.assertEqual(frame['year'].tolist(), [2022, 2023, 2023])
+        self.assertEqual(frame['close'].tolist(), [2.0, 4.0, 4.0])
+        self.assertEqual(frame['volume'].sum(), 35)
+
+    def test_export_prices(self):
+        from moexplot.archive import export_prices, query
+
+        seed_share('AAA', [100.0, 101.0, 102.0])
+        self.assertEqual(export_prices(root=self.root.name), 3)
+        self.assertEqual(export_prices(root=self.root.name), 3)
+        frame = query('SELECT count(*) AS n, max(close) AS close FROM candles WHERE timeframe = 24',
+                      root=self.root.name)
+        self.assertEqual((frame['n'][0], frame['close'][0]), (3, 102.0))
+
+    def test_empty_archive(self):
+        from moexplot.archive import query
+
+        with self.assertRaises(FileNotFoundError):
+            query('SELECT 1', root=self.root.name)
+
+
+class EventStudyCommandTests(TestCase):
+
+    def test_date_options(self):
+        import io
+
+        from django.core.management import call_command
+        from db.mentions import save_videos
+        from db.models import ShareMention
+
+        shares = [seed_share(ticker, random_walk(200, i)) for i, ticker in enumerate(('AAA', 'BBB', 'CCC'))]
+        video = save_videos([{'id': 'v1', 'snippet': {'title': 'AAA', 'publishedAt': '2021-06-01T12:00:00Z'}}])['v1']
+        ShareMention.objects.create(share=shares[0], video=video, count=1)
+        out = io.StringIO()
+        call_command('event_study', '--start', '2021-01-04', '--end', '2021-10-01', '--estimation', '60', stdout=out)
+        self.assertIn('Событий: 1, учтено: 1', out.getvalue())
+
+    def test_no_prices_in_range(self):
+        import io
+
+        from django.core.management import call_command
+        from db.mentions import save_videos
+        from db.models import ShareMention
+
+        share = seed_share('AAA', random_walk(50, 0))
+        video = save_videos([{'id': 'v1', 'snippet': {'title': 'AAA', 'publishedAt': '2021-02-01T12:00:00Z'}}])['v1']
+        ShareMention.objects.create(share=share, video=video, count=1)
+        out = io.StringIO()
+        # Упоминания есть, свечей в интервале нет: событие не учитывается, а не падает
+        call_command('event_study', '--start', '2025-01-01', '--end', '2025-02-01', stdout=out)
+        self.assertIn('Событий: 1, учтено: 0', out.getvalue())
+
+
+class IssStubMixin:
+    """
+    Заглушка ISS из loadtest вместо iss.moex.com
+    """
+
+    def start_iss(self, board=(), page_size=100, trades=None):
+        from loadtest import iss_stub
+        from moexplot.async_moex import AsyncMoexAPI
+        from moexplot.moex import MoexAPI
+
+        server = iss_stub.serve(delay=0)
+        self.addCleanup(server.shutdown)
+        self.iss_url = server.url
+        for name, value in (('board', tuple(board)), ('page_size', page_size), ('requests', 0),
+                            ('trades', trades or {})):
+            self.addCleanup(setattr, iss_stub.Handler, name, getattr(iss_stub.Handler, name))
+            setattr(iss_stub.Handler, name, value)
+        for api in (MoexAPI, AsyncMoexAPI):
+            self.addCleanup(setattr, api, 'ISS_URL', api.ISS_URL)
+            api.ISS_URL = server.url
+        return iss_stub.Handler
+
+
+class BackfillBoardTests(IssStubMixin, TestCase):
+
+    def test_backfill_week(self):
+        import io
+
+        from django.core.management import call_command
+        from db.models import Price, PriceRollup, Share
+
+        handler = self.start_iss(board=('AAA', 'BBB', 'ZZZ'), page_size=2)
+        for ticker in ('AAA', 'BBB'):
+            Share.objects.create(ticker=ticker, name=ticker, slug=ticker.lower(), isin='RU' + ticker.rjust(10, '0'))
+        out = io.StringIO()
+        # 2024-01-01 - понедельник, суббота и воскресенье без торгов
+        call_command('backfill_board', '--start', '2024-01-01', '--end', '2024-01-07', '--workers', '2', stdout=out)
+        self.assertIn('Свечей: 10, акций: 2', out.getvalue())
+        self.assertEqual(Price.objects.filter(share__ticker='AAA').count(), 5)
+        self.assertEqual(PriceRollup.objects.filter(share__ticker='BBB', period=PriceRollup.WEEK).count(), 1)
+        # Будний день - две страницы по history.cursor, выходной - одна
+        self.assertEqual(handler.requests, 5 * 2 + 2)
+        call_command('backfill_board', '--start', '2024-01-02', '--end', '2024-01-02', stdout=io.StringIO())
+        self.assertEqual(Price.objects.count(), 10)
+
+
+def _download_in_process(connection):
+    # Отдельный процесс, как воркер uvicorn: свой цикл событий и свой SingleFlight
+    import asyncio
+
+    from moexplot.async_moex import AsyncMoexAPI
+
+    async def download():
+        try:
+            return await AsyncMoexAPI.download_history_data('SBER', 24, '2024.01.01', '2024.01.07', ('begin', 'close'))
+        finally:
+            await AsyncMoexAPI.close()
+
+    connection.send((asyncio.run(download()), AsyncMoexAPI.history_flight.stats()))
+    connection.close()
+
+
+class AsyncChartTests(IssStubMixin, SimpleTestCase):
+
+    def setUp(self):
+        self.handler = self.start_iss()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.settings = override_settings(ASSET_ROOT=root.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+    async def test_concurrent_downloads_share_one_request(self):
+        import asyncio
+
+        from moexplot.async_moex import AsyncMoexAPI
+
+        try:
+            first, second = await asyncio.gather(*(AsyncMoexAPI.download_history_data(
+                'SBER', 24, '2024.01.01', '2024.01.07', ('begin', 'close')) for _ in range(2)))
+        finally:
+            await AsyncMoexAPI.close()
+        self.assertEqual(first, second)
+        self.assertEqual(len(first), 5)
+        # Страница свечей и пустая страница, по которой клиент понимает, что данных больше нет
+        self.assertEqual(self.handler.requests, 2)
+
+    def test_downloads_shared_between_processes(self):
+        import multiprocessing
+        import time
+
+        from moexplot.async_moex import AsyncMoexAPI
+        from moexplot.singleflight import SingleFlight
+
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.addCleanup(setattr, AsyncMoexAPI, 'history_flight', AsyncMoexAPI.history_flight)
+        AsyncMoexAPI.history_flight = SingleFlight('history', root.name)
+        # Заглушка отвечает медленно: второй процесс приходит, пока первый держит блокировку
+        self.addCleanup(setattr, self.handler, 'delay', self.handler.delay)
+        self.handler.delay = 0.5
+        context = multiprocessing.get_context('fork')
+        directory = Path(root.name) / 'history'
+        processes, connections = [], []
+        for _ in range(2):
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_download_in_process, args=(sender,))
+            process.start()
+            processes.append(process)
+            connections.append(receiver)
+            deadline = time.monotonic() + 5
+            while not list(directory.glob('*.lock')) and time.monotonic() < deadline:
+                time.sleep(0.01)
+        (first, leader), (second, follower) = (connection.recv() for connection in connections)
+        for process in processes:
+            process.join(5)
+        self.assertEqual(len(first), 5)
+        self.assertEqual(first, second)
+        self.assertEqual((leader['executions'], follower['shared_remote']), (1, 1))
+        self.assertEqual(self.handler.requests, 2)
+        self.assertEqual(list(directory.iterdir()), [])
+
+    async def test_index(self):
+        from django.test import AsyncClient
+
+        from moexplot.async_moex import AsyncMoexAPI
+
+        try:
+            response = await AsyncClient().get('/')
+        finally:
+            await AsyncMoexAPI.close()
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response.content.decode(), r'src="/assets/plotly-[0-9a-f]{16}\.min\.js"')
+        self.assertContains(response, 'Plotly.newPlot')
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+
+    def test_nothing_left_on_disk(self):
+        from moexplot.singleflight import SingleFlight
+
+        flight = SingleFlight('test', self.root)
+        self.assertEqual(flight.do('a', lambda: 1), 1)
+        self.assertEqual(flight.do('a', lambda: 2), 2)
+        with self.assertRaises(ZeroDivisionError):
+            flight.do('b', lambda: 1 / 0)
+        self.assertEqual(flight.stats()['executions'], 3)
+        self.assertEqual(list((Path(self.root) / 'test').iterdir()), [])
+
+    def test_result_shared_with_other_process(self):
+        import threading
+        import time
+
+        from moexplot.singleflight import SingleFlight
+
+        # Два экземпляра с общим каталогом ведут себя как два процесса: flock не делится между открытиями файла
+        leader, follower = SingleFlight('test', self.root), SingleFlight('test', self.root)
+        release = threading.Event()
+        results = {}
+
+        def slow():
+            release.wait(5)
+            return [1, 2, 3]
+
+        thread = threading.Thread(target=lambda: results.setdefault('leader', leader.do('k', slow)))
+        thread.start()
+        directory = Path(self.root) / 'test'
+        while not list(directory.glob('*.lock')):
+            time.sleep(0.01)
+        waiter = threading.Thread(target=lambda: results.setdefault('follower', follower.do('k', lambda: None)))
+        waiter.start()
+        while not list(directory.glob('*.wait')):
+            time.sleep(0.01)
+        release.set()
+        thread.join(5)
+        waiter.join(5)
+        self.assertEqual(results, {'leader': [1, 2, 3], 'follower': [1, 2, 3]})
+        self.assertEqual(follower.stats()['shared_remote'], 1)
+        self.assertEqual(list(directory.iterdir()), [])
+
+
+class ScreenerTests(TestCase):
+
+    def test_compiler(self):
+        from moexplot.screener import Screen
+
+        screen = Screen('rsi(14) < 30 and volume > sma(volume, 20) and close > sma(20) and sma(close, 20) > 1')
+        self.assertEqual(set(screen.terms.values()), {'rsi(14)', 'sma(volume, 20)', 'sma(20)'})
+        # Одинаковые вызовы - один узел дерева
+        self.assertEqual(len(screen.terms), 3)
+        self.assertEqual(screen.lookback, 14 * 3 + 1)
+        self.assertEqual(Screen('change(high - low, 5) > 0').lookback, 6)
+
+    def test_malformed_expressions(self):
+        from moexplot.screener import Screen
+
+        for expression in ('sma(5, 3) > 1', 'rsi(5, 14)', 'sma(-1, 3) > 0', 'sma(1 + 2, 3) > 0',
+                           'sma(close > 1, 3)', 'ema(close, 3.5) > 1', 'sma(close, True) > 1', 'sma(close, 0)',
+                           'sma(close, window=3)', 'sma()', 'foo(close, 3)', 'x > 1', 'close +', 'close.real > 1',
+                           '__import__("os")', 'close if close else 1', 'close in (1, 2)', 'close ** 2 > 1'):
+            with self.subTest(expression=expression), self.assertRaises(ValueError) as raised:
+                Screen(expression)
+            self.assertNotIn('numpy', str(raised.exception))
+
+    def test_deep_nesting(self):
+        from moexplot import screener
+
+        # Глубокая вложенность - та же ошибка выражения, а не RecursionError и 500
+        with self.assertRaisesRegex(ValueError, 'длиннее'):
+            screener.Screen('-' * 5000 + 'close > 1')
+        limit = screener.MAX_EXPRESSION
+        screener.MAX_EXPRESSION = 10 ** 6
+        try:
+            for expression in ('-' * 5000 + 'close > 1', 'not ' * 5000 + 'close > 1'):
+                with self.subTest(expression=expression[:10]), self.assertRaisesRegex(ValueError, 'Ошибка в выражении'):
+                    screener.Screen(expression)
+        finally:
+            screener.MAX_EXPRESSION = limit
+        response = self.client.get('/api/screener/', {'q': 'not ' * 5000 + 'close > 1'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_run_screen_and_view(self):
+        from moexplot.screener import run_screen
+
+        seed_share('AAA', [float(c) for c in range(100, 140)], start=dt.date(2024, 1, 1))
+        seed_share('BBB', [float(c) for c in range(140, 100, -1)], start=dt.date(2024, 1, 1))
+        date, rows = run_screen('close > sma(5) and change(1) > 0', dt.date(2024, 2, 23))
+        self.assertEqual(date, '2024-02-23')
+        self.assertEqual([row['ticker'] for row in rows], ['AAA'])
+        self.assertAlmostEqual(rows[0]['sma(5)'], 137.0)
+
+        response = self.client.get('/api/screener/', {'q': 'sma(5, 3) > 1'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('sma', response.json()['error'])
+
+
+class RiskTests(SimpleTestCase):
+
+    def test_var_cvar(self):
+        from moexplot.risk import var_cvar
+
+        var, cvar = var_cvar(-np.arange(100.0), 0.95)
+        self.assertAlmostEqual(var, 94.05)
+        self.assertAlmostEqual(cvar, 97.0)
+
+    def test_horizon_returns(self):
+        from moexplot.risk import horizon_returns
+
+        log_ret = np.log(np.array([[1.01] * 5, [0.99] * 5]))
+        np.testing.assert_allclose(horizon_returns(log_ret, 2), [[1.01 ** 2 - 1] * 4, [0.99 ** 2 - 1] * 4])
+
+    def test_cholesky_of_collinear_shares(self):
+        from moexplot.risk import cholesky
+
+        cov = np.array([[1.0, 2.0], [2.0, 4.0]])
+        factor = cholesky(cov)
+        np.testing.assert_allclose(factor @ factor.T, cov, atol=1e-8)
+
+    def test_monte_carlo_matches_normal_quantile(self):
+        from moexplot.risk import monte_carlo_var
+
+        log_ret = np.random.default_rng(0).normal(0.0, 0.02, (1, 500))
+        var, cvar = monte_carlo_var(log_ret, [1000.0], 0.99, paths=100000, seed=1, processes=1)
+        sigma, mean = log_ret.std(ddof=1), log_ret.mean()
+        self.assertAlmostEqual(var, -1000 * np.expm1(mean - 2.3263 * sigma), delta=1.0)
+        self.assertGreater(cvar, var)
+
+    def test_result_does_not_depend_on_processes(self):
+        from moexplot import risk
+
+        for name, value in (('BLOCK_CELLS', 1000), ('PARALLEL_PATHS', 0)):
+            self.addCleanup(setattr, risk, name, getattr(risk, name))
+            setattr(risk, name, value)
+        log_ret = np.random.default_rng(0).normal(0.0, 0.02, (2, 300))
+        single = risk.monte_carlo_var(log_ret, [1000.0, -500.0], paths=5000, seed=7, processes=1)
+        self.assertEqual(risk.monte_carlo_var(log_ret, [1000.0, -500.0], paths=5000, seed=7, processes=2), single)
+
+
+class RiskViewTests(TestCase):
+
+    def test_portfolio(self):
+        seed_share('AAA', random_walk(300, 1), start=dt.date(2022, 1, 3))
+        seed_share('BBB', random_walk(300, 2, start=50.0), start=dt.date(2022, 1, 3))
+        response = self.client.get('/api/risk/', {'positions': 'aaa:10,BBB:-5', 'date': '2023-03-01', 'paths': 1000})
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(set(result['positions']), {'AAA', 'BBB'})
+        self.assertLess(result['positions']['BBB'], 0)
+        self.assertEqual(result['observations'], 299)
+        self.assertLessEqual(result['historical_var'], result['historical_cvar'])
+
+        for params in ({'positions': 'ZZZ:1'}, {'positions': ''}, {'positions': 'AAA:1', 'confidence': '2'}):
+            self.assertEqual(self.client.get('/api/risk/', params).status_code, 400)
+
+
+def session_trades(n, seed=0, day='2024-03-01'):
+    """
+    Сделки в формате ISS trades.json, по одной в секунду с 10:00
+    """
+    rng = np.random.default_rng(seed)
+    start = dt.datetime.fromisoformat(day + ' 10:00:00')
+    return [{'TRADENO': 1000 + i, 'TRADETIME': (start + dt.timedelta(seconds=i)).strftime('%H:%M:%S'),
+             'SYSTIME': '%s 10:00:00' % day, 'PRICE': round(100 + rng.normal(), 2),
+             'QUANTITY': int(rng.integers(1, 100)), 'BUYSELL': 'B' if i % 2 else 'S'} for i in range(n)]
+
+
+class TickTests(IssStubMixin, SimpleTestCase):
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+
+    def test_aggregate_matches_pandas(self):
+        from moexplot.ticks import aggregate, trades_frame
+
+        ticks = trades_frame(session_trades(1000))
+        # Порядок сделок в пачке не важен
+        candles = aggregate(ticks.iloc[::-1], '1min')
+        frame = ticks.set_index('time')
+        expected = frame['price'].resample('1min').ohlc().dropna()
+        np.testing.assert_array_equal(candles['begin'].to_numpy(), expected.index.to_numpy())
+        np.testing.assert_allclose(candles[['open', 'high', 'low', 'close']].to_numpy(), expected.to_numpy())
+        volume = frame['quantity'].resample('1min').sum()
+        np.testing.assert_array_equal(candles['volume'], volume[volume > 0])
+        value = (frame['price'] * frame['quantity']).resample('1min').sum()
+        np.testing.assert_allclose(candles['vwap'], (value / volume)[volume > 0])
+        self.assertEqual(candles['trades'].sum(), 1000)
+        self.assertTrue(aggregate(ticks.iloc[:0], '5min').empty)
+        with self.assertRaises(ValueError):
+            aggregate(ticks, '0s')
+
+    def test_ingest_read_and_compact(self):
+        from moexplot.ticks import compact, ingest_ticks, last_tradeno, parts, read_ticks
+
+        trades = session_trades(23)
+        self.start_iss(trades={'AAA': trades[:17]})
+        # Страницы по 5 сделок копятся до частей по 10
+        self.assertEqual(ingest_ticks('AAA', self.root, part_size=10, page_size=5), 17)
+        self.assertEqual(len(parts('AAA', root=self.root)), 2)
+        self.assertEqual(last_tradeno('AAA', self.root), 1016)
+        self.start_iss(trades={'AAA': trades})
+        self.assertEqual(ingest_ticks('AAA', self.root, part_size=10, page_size=5), 6)
+
+        day = dt.date(2024, 3, 1)
+        ticks = read_ticks('AAA', day, day, self.root)
+        self.assertEqual(ticks['tradeno'].tolist(), list(range(1000, 1023)))
+        self.assertEqual(compact('AAA', day, self.root), 23)
+        self.assertEqual(len(parts('AAA', root=self.root)), 1)
+        self.assertTrue(read_ticks('AAA', day, day, self.root).equals(ticks))
+        self.assertTrue(read_ticks('AAA', dt.date(2024, 3, 2), root=self.root).empty)
+
+
+def _shared_sum(field):
+    # Задача воркера пула: матрица приходит через shared.init_worker
+    from moexplot import shared
+
+    values = shared.worker_matrix[field]
+    return float(np.nansum(values)), values.flags.writeable
+
+
+class SharedMatrixTests(SimpleTestCase):
+
+    def setUp(self):
+        from moexplot.matrix import MarketMatrix
+
+        rng = np.random.default_rng(0)
+        close = rng.normal(100, 1, (3, 50))
+        close[1, :10] = np.nan
+        self.matrix = MarketMatrix(['AAA', 'BBB', 'CCC'], np.arange(50).astype('datetime64[D]'),
+                                   {'close': close, 'volume': rng.integers(1, 10, (3, 50)).astype(float)})
+
+    def test_workers_read_one_copy(self):
+        from concurrent.futures import ProcessPoolExecutor
+
+        from moexplot.shared import SharedMatrix, init_worker
+
+        with SharedMatrix(self.matrix) as shared:
+            with ProcessPoolExecutor(2, initializer=init_worker, initargs=(shared.handle,)) as pool:
+                results = list(pool.map(_shared_sum, ['close', 'volume']))
+        self.assertAlmostEqual(results[0][0], float(np.nansum(self.matrix['close'])))
+        self.assertEqual(results[1], (float(self.matrix['volume'].sum()), False))
+
+    def test_attach_and_close(self):
+        from moexplot.shared import SharedMatrix, attach, detach
+
+        shared = SharedMatrix(self.matrix, fields=['close'])
+        view = attach(shared.handle)
+        self.assertIs(attach(shared.handle), view)
+        self.assertEqual(view.tickers, ['AAA', 'BBB', 'CCC'])
+        np.testing.assert_array_equal(view['close'], self.matrix['close'])
+        with self.assertRaises(ValueError):
+            view['close'][0, 0] = 0
+        del view
+        detach(shared.name)
+        shared.close()
+        with self.assertRaises(FileNotFoundError):
+            attach(shared.handle)
+
+
+class LoadTestHarnessTests(IssStubMixin, TestCase):
+
+    def test_summarize(self):
+        from loadtest.traffic import summarize
+
+        nan = float('nan')
+        records = [('index', 0, 0.010 * i, 200, 1000, 5.0, 1.0, 2) for i in range(1, 101)]
+        records += [('risk', 0, 1.0, 500, 10, nan, nan, 0), ('risk', 0, 2.0, 0, 0, nan, nan, 0)]
+        result = summarize(records, 10.0)
+        self.assertEqual(set(result), {'index', 'risk', 'total'})
+        index = result['index']
+        self.assertEqual((index['requests'], index['rps'], index['errors']), (100, 10.0, 0.0))
+        self.assertAlmostEqual(index['p50'], 505.0)
+        self.assertAlmostEqual(index['p99'], 990.1)
+        self.assertEqual((index['server_ms'], index['db_ms'], index['queries'], index['bytes']), (5.0, 1.0, 2.0, 1000.0))
+        self.assertEqual(result['risk']['errors'], 1.0)
+        self.assertIsNone(result['risk']['server_ms'])
+        self.assertAlmostEqual(result['total']['errors'], 2 / 102)
+
+    def test_drive_records_every_request(self):
+        import asyncio
+
+        from loadtest.traffic import drive
+
+        # Заглушка ISS отвечает 200 на любой путь
+        handler = self.start_iss()
+        records = asyncio.run(drive(self.iss_url, {'index': 1, 'shares': 1}, ['AAA'], 2, 0.3))
+        self.assertEqual(len(records), handler.requests)
+        self.assertTrue(all(record[3] == 200 and record[4] > 0 for record in records))
+        self.assertEqual({record[0] for record in records}, {'index', 'shares'})
+
+    def test_server_timing_counts_queries(self):
+        from django.core.cache import cache
+        from django.db import connection
+        from loadtest.middleware import _count_queries, _install_wrapper
+
+        cache.clear()
+        _install_wrapper(None, connection)
+        _install_wrapper(None, connection)
+        self.addCleanup(connection.execute_wrappers.remove, _count_queries)
+        self.assertEqual(connection.execute_wrappers.count(_count_queries), 1)
+        seed_share('AAA', [100.0, 101.0], start=dt.date.today() - dt.timedelta(days=5))
+        with self.modify_settings(MIDDLEWARE={'prepend': 'loadtest.middleware.server_timing'}):
+            response = self.client.get('/api/market/')
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="[1-9]\d*"$')
+
+    def test_compare(self):
+        import contextlib
+        import io
+        import json
+
+        from loadtest.__main__ import main
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        files = []
+        for i, rps in enumerate((100.0, 150.0)):
+            path = Path(directory.name) / ('%d.json' % i)
+            path.write_text(json.dumps({'label': None, 'commit': 'abc%d' % i, 'dirty': bool(i),
+                                        'config': {'mix': 'chart'},
+                                        'endpoints': {'index': {'rps': rps, 'p95': 20.0, 'errors': 0.0}}}))
+            files.append(str(path))
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            main(['compare'] + files)
+        self.assertIn('chart@abc0, chart@abc1+', out.getvalue())
+        self.assertIn('150.0 (+50%)', out.getvalue())
+
+
+class AssetTests(TestCase):
+
+    def setUp(self):
+        from moexplot import assets
+
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.settings = override_settings(ASSET_ROOT=root.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        # Имя бандла кэшируется в процессе, а каталог у каждого теста свой
+        assets._names.clear()
+        self.addCleanup(assets._names.clear)
+
+    def test_publish_and_negotiate(self):
+        import gzip
+
+        from moexplot.assets import asset_root, negotiate, publish
+
+        source = Path(self.settings.options['ASSET_ROOT']) / 'source.min.js'
+        source.write_text('var a = 1;')
+        name = publish(source, 'app')
+        self.assertRegex(name, r'^app-[0-9a-f]{16}\.min\.js$')
+        self.assertEqual(publish(source, 'app'), name)
+        self.assertEqual(gzip.decompress((asset_root() / (name + '.gz')).read_bytes()), b'var a = 1;')
+
+        path, encoding, content_type = negotiate(name, 'deflate, gzip;q=0.5')
+        self.assertEqual((path.name, encoding, content_type), (name + '.gz', 'gzip', 'application/javascript; charset=utf-8'))
+        self.assertEqual(negotiate(name, 'gzip;q=0')[1], None)
+        self.assertEqual(negotiate(name, '')[0].name, name)
+
+    def test_asset_view(self):
+        from moexplot.assets import plotly_name
+
+        url = '/assets/%s' % plotly_name()
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        response.close()
+        self.assertFalse(self.client.get(url).has_header('Content-Encoding'))
+        self.assertEqual(self.client.get('/assets/plotly-0000000000000000.min.js').status_code, 404)
+
+    def test_pages_compressed_except_admin(self):
+        self.assertEqual(self.client.get('/market/', HTTP_ACCEPT_ENCODING='gzip')['Content-Encoding'], 'gzip')
+        self.assertFalse(self.client.get('/admin/login/', HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding'))
+
+    def test_build_assets_copy(self):
+        import io
+
+        from django.core.management import call_command
+        from moexplot.assets import plotly_source
+
+        target = tempfile.TemporaryDirectory()
+        self.addCleanup(target.cleanup)
+        call_command('build_assets', '--copy-to', target.name, stdout=io.StringIO())
+        self.assertEqual((Path(target.name) / 'plotly.min.js').read_bytes(), plotly_source().read_bytes())
+
+
+class ThresholdBookTests(SimpleTestCase):
+
+    def setUp(self):
+        from db.models import PriceAlert
+        from moexplot.alerts import ThresholdBook
+
+        self.above, self.below = PriceAlert.ABOVE, PriceAlert.BELOW
+        self.times = np.array(['2024-01-0%d' % d for d in range(1, 6)], dtype='datetime64[s]')
+        self.ends = self.times + np.timedelta64(1, 'D')
+        old = np.datetime64('2023-12-01', 'us')
+        self.book = ThresholdBook()
+        self.book.add(self.above, [103.0, 101.0, 110.0, 102.0], [1, 2, 3, 4], [old] * 4)
+        self.book.add(self.below, [95.0, 99.0, 90.0], [5, 6, 7], [old] * 3)
+
+    def test_first_touch(self):
+        high = np.array([100.5, 101.5, np.nan, 103.5, 100.0])
+        low = np.array([99.5, 98.0, np.nan, 96.0, 94.0])
+        found, taken = self.book.crossings(high, low, self.times, self.ends)
+        self.assertEqual(sorted((i, v, t.day) for i, v, t in found),
+                         [(1, 103.5, 4), (2, 101.5, 2), (4, 103.5, 4), (5, 94.0, 5), (6, 98.0, 2)])
+        # Книга не меняется до discard
+        self.assertEqual(len(self.book), 7)
+        for direction, n, ids in taken:
+            self.book.discard(direction, n, ids)
+        self.assertEqual(self.book.sides[self.above][1].tolist(), [3])
+        self.assertEqual(self.book.sides[self.below][1].tolist(), [7])
+
+    def test_partial_discard_keeps_order(self):
+        high = np.array([105.0] * 5)
+        low = np.array([91.0] * 5)
+        _, taken = self.book.crossings(high, low, self.times, self.ends)
+        taken = dict((direction, (n, ids)) for direction, n, ids in taken)
+        self.assertEqual(sorted(taken[self.above][1]), [1, 2, 4])
+        self.book.discard(self.above, taken[self.above][0], [2, 1])
+        self.book.discard(self.below, taken[self.below][0], [6])
+        self.assertEqual(self.book.sides[self.above][0].tolist(), [102.0, 110.0])
+        self.assertEqual(self.book.sides[self.above][1].tolist(), [4, 3])
+        self.assertEqual(self.book.sides[self.below][0].tolist(), [90.0, 95.0])
+        self.assertEqual(self.book.sides[self.below][1].tolist(), [7, 5])
+
+    def test_candles_before_creation_ignored(self):
+        from moexplot.alerts import ThresholdBook
+
+        book = ThresholdBook()
+        book.add(self.above, [100.0, 100.0], [1, 2],
+                 np.array(['2024-01-03T12:00', '2024-01-06'], dtype='datetime64[us]'))
+        high = np.array([101.0, 102.0, 99.0, 100.5, 99.0])
+        found, _ = book.crossings(high, high, self.times, self.ends)
+        # Свеча 3 января закончилась после создания, но уровня не касалась: первое касание 4 января.
+        # Второе уведомление создано, когда последняя свеча уже закончилась
+        self.assertEqual([(i, v, t.day) for i, v, t in found], [(1, 100.5, 4)])
+
+
+class AlertEngineTests(TestCase):
+
+    def setUp(self):
+        from moexplot import alerts
+
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.settings = override_settings(ALERT_ROOT=root.name, ALERT_SINK='moexplot.alerts.JsonlSink')
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        # Индекс и доставка живут в процессе, каждому тесту свои
+        for name in ('_index', '_sink'):
+            self.addCleanup(setattr, alerts, name, None)
+            setattr(alerts, name, None)
+        self.share = seed_share('AAA', [100.0] * 10)
+
+    def alert(self, created=dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc), **fields):
+        from db.models import PriceAlert
+
+        alert = PriceAlert.objects.create(share=self.share, **fields)
+        PriceAlert.objects.filter(pk=alert.pk).update(created_at=created)
+        return alert
+
+    def ingest(self, day, high, low, close=None):
+        from db.ingest import ingest_candles
+
+        close = (high + low) / 2 if close is None else close
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_candles(self.share, [{'begin': str(day), 'open': close, 'high': high, 'low': low, 'close': close,
+                                         'volume': 1000}])
+
+    def fired(self):
+        from db.models import PriceAlert
+
+        return dict(PriceAlert.objects.filter(active=False).values_list('pk', 'triggered_value'))
+
+    def test_price_and_change_alerts(self):
+        import json
+
+        from django.conf import settings
+        from db.models import PriceAlert
+
+        above = self.alert(threshold=105)
+        below = self.alert(threshold=95, direction=PriceAlert.BELOW)
+        change = self.alert(kind=PriceAlert.CHANGE, threshold=10)
+        self.assertAlmostEqual(change.level, 110.0)
+        self.assertEqual(change.direction, PriceAlert.ABOVE)
+        self.ingest(dt.date(2021, 1, 18), 106, 99)
+        self.assertEqual(self.fired(), {above.pk: 106.0})
+        above.refresh_from_db()
+        self.assertEqual(above.triggered_at, dt.datetime(2021, 1, 18, tzinfo=dt.timezone.utc))
+        self.ingest(dt.date(2021, 1, 19), 111, 94)
+        self.assertEqual(self.fired(), {above.pk: 106.0, below.pk: 94.0, change.pk: 111.0})
+
+        lines = (Path(settings.ALERT_ROOT) / 'triggered.jsonl').read_text(encoding='utf-8').splitlines()
+        self.assertCountEqual([json.loads(line)['alert_id'] for line in lines], [above.pk, below.pk, change.pk])
+        self.assertEqual(json.loads(lines[0])['ticker'], 'AAA')
+
+    def test_candles_before_creation_do_not_fire(self):
+        from moexplot.alerts import alert_index
+
+        # Создано сейчас, а догружается история 2021 года
+        alert = self.alert(threshold=105, created=dt.datetime.now(dt.timezone.utc))
+        self.ingest(dt.date(2021, 1, 18), 200, 99)
+        self.assertEqual(self.fired(), {})
+        self.assertEqual(len(alert_index()), 1)
+        alert.refresh_from_db()
+        self.assertTrue(alert.active)
+
+    def test_alert_created_during_the_day(self):
+        # Уведомление поставлено днём, дневная свеча того же дня грузится после закрытия
+        alert = self.alert(threshold=300, created=dt.datetime(2021, 1, 18, 12, tzinfo=dt.timezone.utc))
+        later = self.alert(threshold=300, created=dt.datetime(2021, 1, 19, 0, 1, tzinfo=dt.timezone.utc))
+        self.ingest(dt.date(2021, 1, 18), 305, 99)
+        self.assertEqual(self.fired(), {alert.pk: 305.0})
+        later.refresh_from_db()
+        self.assertTrue(later.active)
+
+    def test_confirm_failure_keeps_alerts(self):
+        from django.db import DatabaseError
+        from moexplot import alerts
+
+        alert = self.alert(threshold=105)
+
+        def failing(candidates):
+            raise DatabaseError('connection lost')
+
+        confirm = alerts.confirm
+        alerts.confirm = failing
+        try:
+            # Сбой уведомлений не ломает загрузку свечей, только пишется в журнал
+            with self.assertLogs('moexplot.apps', 'ERROR'):
+                self.ingest(dt.date(2021, 1, 18), 106, 99)
+        finally:
+            alerts.confirm = confirm
+        self.assertEqual(len(alerts.alert_index()), 1)
+        self.ingest(dt.date(2021, 1, 19), 107, 99)
+        self.assertEqual(self.fired(), {alert.pk: 107.0})
+        self.assertEqual(len(alerts.alert_index()), 0)
+
+    def test_cancelled_alert_is_dropped(self):
+        from db.models import PriceAlert
+        from moexplot.alerts import alert_index
+
+        alert = self.alert(threshold=105)
+        self.ingest(dt.date(2021, 1, 18), 101, 99)
+        self.assertEqual(len(alert_index()), 1)
+        PriceAlert.objects.filter(pk=alert.pk).update(active=False)
+        self.ingest(dt.date(2021, 1, 19), 106, 99)
+        self.assertEqual(len(alert_index()), 0)
+        alert.refresh_from_db()
+        self.assertIsNone(alert.triggered_at)
+
+    def test_indicator_alert(self):
+        from db.models import PriceAlert
+
+        alert = self.alert(kind=PriceAlert.INDICATOR, indicator='sma', window=3, threshold=109)
+        self.ingest(dt.date(2021, 1, 18), 131, 129, 130)
+        self.assertEqual(self.fired(), {alert.pk: 110.0})
@@ -0,0 +1,194 @@
+import datetime as dt
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .moex import MoexAPI
+
+TICK_COLUMNS = ('tradeno', 'time', 'price', 'quantity', 'side')
+# Сделок ISS на одну страницу и в одном файле-части при загрузке
+PAGE_SIZE = 5000
+PART_SIZE = 500000
+PART_NAME = re.compile(r'part-(\d+)-(\d+)\.parquet$')
+# Возрастающие номера сделок и время хорошо сжимаются разностным кодированием
+ENCODINGS = {'tradeno': 'DELTA_BINARY_PACKED', 'time': 'DELTA_BINARY_PACKED'}
+
+
+def tick_root():
+    return Path(settings.TICK_ROOT)
+
+
+def day_dir(root, ticker, day):
+    return Path(root) / ('ticker=%s' % ticker) / ('date=%s' % day)
+
+
+def trades_frame(trades):
+    """
+    Сделки ISS (TRADENO, TRADETIME, SYSTIME, PRICE, QUANTITY, BUYSELL) в колонки хранилища.
+    Время московское, как у свечей ISS.
+    :param trades: список словарей
+    :return: DataFrame с колонками TICK_COLUMNS
+    """
+    frame = pd.DataFrame(trades)
+    if frame.empty:
+        return pd.DataFrame({name: [] for name in TICK_COLUMNS})
+    return pd.DataFrame({
+        'tradeno': frame['TRADENO'].to_numpy(dtype=np.int64),
+        'time': pd.to_datetime(frame['SYSTIME'].str[:10] + ' ' + frame['TRADETIME']).astype('datetime64[us]'),
+        'price': frame['PRICE'].to_numpy(dtype=np.float64),
+        'quantity': frame['QUANTITY'].to_numpy(dtype=np.int64),
+        'side': np.where(frame['BUYSELL'] == 'B', 1, -1).astype(np.int8),
+    })
+
+
+def _write_part(frame, directory):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    directory.mkdir(parents=True, exist_ok=True)
+    tradeno = frame['tradeno'].to_numpy()
+    path = directory / ('part-%020d-%020d.parquet' % (tradeno[0], tradeno[-1]))
+    tmp = path.with_suffix('.tmp')
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    pq.write_table(table, tmp, compression='zstd', use_dictionary=['price', 'quantity', 'side'],
+                   column_encoding=ENCODINGS, row_group_size=PART_SIZE)
+    # Запрос не должен увидеть недописанный файл
+    os.replace(tmp, path)
+    return path
+
+
+def write_ticks(ticker, ticks, root=None):
+    """
+    Дописываю сделки новыми файлами ticker=/date=/part-<первая>-<последняя>.parquet, старые файлы не меняются
+    :param ticker:
+    :param ticks: DataFrame с колонками TICK_COLUMNS
+    :param root: корень хранилища (по умолчанию settings.TICK_ROOT)
+    :return: число записанных сделок
+    """
+    root = root or tick_root()
+    if ticks.empty:
+        return 0
+    ticks = ticks.sort_values('tradeno', kind='stable')
+    for day, part in ticks.groupby(ticks['time'].dt.date):
+        _write_part(part.reset_index(drop=True), day_dir(root, ticker, day))
+    return len(ticks)
+
+
+def parts(ticker, start=None, end=None, root=None):
+    """
+    Файлы сделок акции за дни с start по end включительно, по порядку
+    :return: список путей
+    """
+    base = Path(root or tick_root()) / ('ticker=%s' % ticker)
+    result = []
+    for directory in sorted(base.glob('date=*')):
+        day = dt.date.fromisoformat(directory.name[5:])
+        if (start is None or day >= start) and (end is None or day <= end):
+            result.extend(sorted(directory.glob('part-*.parquet')))
+    return result
+
+
+def last_tradeno(ticker, root=None):
+    # Номер последней записанной сделки берётся из имён файлов последнего дня, без чтения данных
+    days = sorted((Path(root or tick_root()) / ('ticker=%s' % ticker)).glob('date=*'))
+    numbers = [int(PART_NAME.search(path.name).group(2)) for path in (days[-1].glob('part-*.parquet') if days else ())]
+    return max(numbers, default=None)
+
+
+def read_ticks(ticker, start=None, end=None, root=None):
+    """
+    Сделки акции за дни с start по end включительно
+    :return: DataFrame с колонками TICK_COLUMNS, по возрастанию номера сделки, без повторов
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    files = parts(ticker, start, end, root)
+    if not files:
+        return pd.DataFrame({name: [] for name in TICK_COLUMNS})
+    table = pa.concat_tables([pq.read_table(path, columns=list(TICK_COLUMNS)) for path in files])
+    frame = table.to_pandas()
+    tradeno = frame['tradeno'].to_numpy()
+    if len(tradeno) > 1 and not (np.diff(tradeno) > 0).all():
+        # Части после прерванного сжатия могут пересекаться
+        frame = frame.sort_values('tradeno', kind='stable').drop_duplicates('tradeno').reset_index(drop=True)
+    return frame
+
+
+def compact(ticker, day, root=None):
+    """
+    Объединяю части одного завершённого дня в один файл
+    :return: число сделок за день
+    """
+    directory = day_dir(root or tick_root(), ticker, day)
+    old = sorted(directory.glob('part-*.parquet'))
+    if len(old) < 2:
+        return None
+    frame = read_ticks(ticker, day, day, root)
+    # Сначала новый файл, потом удаление старых: при сбое остаются дубли, которые read_ticks отбрасывает
+    new = _write_part(frame, directory)
+    for path in old:
+        if path != new:
+            path.unlink()
+    return len(frame)
+
+
+def aggregate(ticks, interval):
+    """
+    Свечи произвольного интервала по сделкам одним проходом без группировок pandas
+    :param ticks: DataFrame сделок (read_ticks)
+    :param interval: '30s', '5min', '1h' и т.п.; свечи выровнены по полуночи
+    :return: DataFrame begin, open, high, low, close, volume, value, vwap, trades
+    """
+    step = pd.Timedelta(interval).value // 1000
+    if step <= 0:
+        raise ValueError('Интервал должен быть положительным: %s' % interval)
+    time = ticks['time'].to_numpy().astype('datetime64[us]').view(np.int64)
+    price = ticks['price'].to_numpy(dtype=np.float64)
+    quantity = ticks['quantity'].to_numpy(dtype=np.int64)
+    if len(time) > 1 and (np.diff(time) < 0).any():
+        order = np.argsort(time, kind='stable')
+        time, price, quantity = time[order], price[order], quantity[order]
+    bucket = time // step
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]]) if len(bucket) else np.array([], dtype=np.int64)
+    if not len(starts):
+        return pd.DataFrame(columns=['begin', 'open', 'high', 'low', 'close', 'volume', 'value', 'vwap', 'trades'])
+    ends = np.r_[starts[1:], len(bucket)]
+    volume = np.add.reduceat(quantity, starts)
+    value = np.add.reduceat(price * quantity, starts)
+    return pd.DataFrame({
+        'begin': (bucket[starts] * step).astype('datetime64[us]'),
+        'open': price[starts],
+        'high': np.maximum.reduceat(price, starts),
+        'low': np.minimum.reduceat(price, starts),
+        'close': price[ends - 1],
+        'volume': volume,
+        'value': value,
+        'vwap': np.divide(value, volume, out=np.full(len(volume), np.nan), where=volume > 0),
+        'trades': ends - starts,
+    })
+
+
+def ingest_ticks(ticker, root=None, part_size=PART_SIZE, page_size=PAGE_SIZE):
+    """
+    Догружаю сделки акции из ISS после последней сохранённой, постранично по номеру сделки.
+    Страницы копятся до part_size сделок, чтобы не плодить мелкие файлы.
+    :return: число записанных сделок
+    """
+    after = last_tradeno(ticker, root)
+    buffer = []
+    written = 0
+    while True:
+        page = MoexAPI.trades(ticker, after, page_size)
+        buffer.extend(page)
+        if page:
+            after = page[-1]['TRADENO']
+        if len(buffer) >= part_size or (buffer and len(page) < page_size):
+            written += write_ticks(ticker, trades_frame(buffer), root)
+            buffer = []
+        if len(page) < page_size:
+            return written
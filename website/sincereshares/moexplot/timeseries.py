@@ -0,0 +1,242 @@
+import datetime as dt
+import os
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from . import charts
+from .moex import MoexAPI
+
+
+class FinTimeSeries:
+
+    STD_COLUMNS = ('begin', 'open', 'high', 'low', 'close', 'volume')
+    # Период db.PriceRollup для timeframe; дневные свечи читаются из db.Price
+    DB_ROLLUPS = {24: None, 7: 'w', 31: 'm'}
+
+    def __init__(self, ticker, timeframe, start, end):
+        data = MoexAPI.download_history_data(ticker, timeframe, start, end, self.STD_COLUMNS)
+        self.data = pd.DataFrame(data)
+        self.ticker = ticker
+        self.timeframe = timeframe
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def from_trade_days(cls, ticker, num_last_days, timeframe=24, curr_date=dt.date.today(), include_today=False):
+        start = curr_date - relativedelta(days=num_last_days*2)
+        if include_today:
+            end = curr_date
+        else:
+            yesterday = curr_date - dt.timedelta(days=1)
+            end = yesterday
+        year_tm = cls(ticker, 24, str(start), str(end))
+        year_tm.data = year_tm.data.tail(num_last_days)
+        year_tm.data = year_tm.data.reset_index(drop=True)
+        if timeframe != 24:
+            start = year_tm.data['begin'].iloc[0]
+            end = cls.add_delta(year_tm.data['begin'].iloc[-1], delta_duration=1, delta_mode='d')
+            year_tm = cls(ticker, timeframe, start, end)
+        return year_tm
+
+    @classmethod
+    def from_weeks(cls, ticker, num_weeks, timeframe=24, curr_date=dt.date.today()):
+        start = curr_date - dt.timedelta(weeks=num_weeks)
+        end = curr_date
+        return cls(ticker, timeframe, start, end)
+
+    @classmethod
+    def from_months(cls, ticker, num_months, timeframe=24, curr_date=dt.date.today()):
+        start = curr_date - relativedelta(months=num_months)
+        end = curr_date
+        return cls(ticker, timeframe, start, end)
+
+    @classmethod
+    def from_years(cls, ticker, num_years, timeframe=24, curr_date=dt.date.today()):
+        start = curr_date - relativedelta(years=num_years)
+        end = curr_date
+        return cls(ticker, timeframe, start, end)
+
+    @classmethod
+    def from_frame(cls, ticker, timeframe, start, end, data):
+        ts = cls.__new__(cls)
+        ts.data = data
+        ts.ticker = ticker
+        ts.timeframe = timeframe
+        ts.start = start
+        ts.end = end
+        return ts
+
+    @classmethod
+    def from_db(cls, share, timeframe=24, start=None, end=None):
+        """
+        Котировки из базы без обращения к ISS: дни из db.Price, недели и месяцы - готовые свёртки db.PriceRollup
+        :param share: db.Share или тикер
+        :param timeframe: 24 - дни, 7 - недели, 31 - месяцы
+        :param start: date или datetime
+        :param end: date или datetime
+        :return:
+        """
+        from db.loader import load_prices
+        from db.models import Price, PriceRollup, Share
+        from .matrix import as_datetime
+
+        if timeframe not in cls.DB_ROLLUPS:
+            raise ValueError('В базе хранятся дневные свечи, timeframe %s недоступен' % timeframe)
+        if not isinstance(share, Share):
+            share = Share.objects.get(ticker=share)
+        if cls.DB_ROLLUPS[timeframe] is None:
+            qs = Price.objects.filter(share=share)
+        else:
+            qs = PriceRollup.objects.filter(share=share, period=cls.DB_ROLLUPS[timeframe])
+        if start is not None:
+            qs = qs.filter(date__gte=as_datetime(start))
+        if end is not None:
+            qs = qs.filter(date__lte=as_datetime(end, end=True))
+
+        columns = load_prices(qs)
+        data = pd.DataFrame({'begin': columns['time'], 'open': columns['open'], 'high': columns['high'],
+                             'low': columns['low'], 'close': columns['price'], 'volume': columns['volume']},
+                            copy=False)
+        return cls.from_frame(share.ticker, timeframe, start, end, data)
+
+    @classmethod
+    def from_last(cls, ticker, period_type, period_num, timeframe, curr_date=dt.date.today()):
+        if period_type == 'd':
+            return cls.from_trade_days(ticker, period_num, timeframe, curr_date)
+        elif period_type == 'w':
+            return cls.from_weeks(ticker, period_num, timeframe, curr_date)
+        elif period_type == 'm':
+            return cls.from_months(ticker, period_num, timeframe, curr_date)
+        elif period_type == 'y':
+            return cls.from_years(ticker, period_num, timeframe, curr_date)
+        else:
+            return cls.from_trade_days(ticker, period_num, timeframe, curr_date)
+
+    def column(self, name):
+        return self.data[name]
+
+    def columns(self, column_names):
+        return self.data[column_names]
+
+    def adjust(self):
+        """
+        Корректирую OHLC на дивиденды и сплиты, уже применённые в базе
+        :return:
+        """
+        from db.models import CorporateAction
+        from .adjustments import apply_factors
+
+        actions = (CorporateAction.objects.filter(share__ticker=self.ticker, factor__isnull=False)
+                   .values_list('ex_date', 'factor'))
+        if self.is_empty() or not actions:
+            return
+        ex_dates, factors = zip(*actions)
+        factor = apply_factors(pd.to_datetime(self.data['begin']).values,
+                               pd.to_datetime(list(ex_dates)).values, factors)
+        for column in ('open', 'high', 'low', 'close'):
+            self.data[column] = self.data[column] * factor
+
+    def candle_chart(self, without_slider=True):
+        return charts.candle_chart(self.data, without_slider)
+
+    def line_chart(self, column='close', with_slider=False):
+        fig = charts.line_chart(self.data, column, with_slider)
+        fig.show()
+
+    def mean(self, column='close'):
+        return self.data[column].mean()
+
+    def var(self, column='close'):
+        return self.data[column].var()
+
+    def median(self, column='close'):
+        return self.data[column].median()
+
+    def std(self, column='close'):
+        return self.data[column].std()
+
+    def corr(self, columns=STD_COLUMNS):
+        if len(columns) == 2:
+            df_column1 = self.data[columns[0]]
+            df_column2 = self.data[columns[1]]
+            return df_column1.corr(df_column2)
+        elif len(columns) > 2:
+            df = self.data[list(columns)]
+            return df.corr()
+        else:
+            return None
+
+    def export_csv(self):
+        project_dir = os.path.dirname(os.path.dirname(__file__))
+        filename = "out_"+dt.datetime.now().strftime("%d.%m.%Y_%H.%M.%S")+'.csv'
+        path = os.path.join(project_dir, 'data', 'export', filename)
+        self.data.to_csv(path, index=False)
+        return path
+
+    def export_xlsx(self):
+        project_dir = os.path.dirname(os.path.dirname(__file__))
+        filename = "out_"+dt.datetime.now().strftime("%d.%m.%Y_%H.%M.%S")+'.xlsx'
+        path = os.path.join(project_dir, 'data', 'export', filename)
+        self.data.to_excel(path, index=False)
+        return path
+
+    def has_nulls(self):
+        return self.nulls_count() > 0
+
+    def nulls_count(self, by_columns=False):
+        if by_columns:
+            return dict(self.data.isna().sum())
+        else:
+            return self.data.isna().sum().sum()
+
+    def fill_na(self, method='bfill'):
+        self.data.fillna(method=method, inplace=True)
+
+    def drop_na(self):
+        self.data.dropna(inplace=True)
+
+    def is_empty(self):
+        return self.data.empty
+
+    @staticmethod
+    def add_delta(date: str, delta_duration, delta_mode='d', sub=False):
+        if delta_mode == 'd':
+            delta = dt.timedelta(days=delta_duration)
+        elif delta_mode == 'w':
+            delta = dt.timedelta(weeks=delta_duration)
+        elif delta_mode == 'm':
+            delta = relativedelta(months=delta_duration)
+        elif delta_mode == 'y':
+            delta = relativedelta(years=delta_duration)
+        else:
+            delta = dt.timedelta(days=delta_duration)
+        dt_date = dt.date.fromisoformat(date.split(' ')[0])
+        if not sub:
+            date = dt_date + delta
+        else:
+            date = dt_date - delta
+        return str(date)
+
+    @staticmethod
+    def transform_timeframe_for_api(timeframe):
+        if timeframe == 'd':
+            return 24
+        elif timeframe == 'w':
+            return 7
+        elif timeframe == 'm':
+            return 31
+        elif timeframe == 'h':
+            return 60
+        elif timeframe == '10min':
+            return 10
+        elif timeframe == '1min':
+            return 1
+        else:
+            return 24
+
+    def __str__(self):
+        return self.data.to_string()
+
+    def __len__(self):
+        return len(self.data['begin'])
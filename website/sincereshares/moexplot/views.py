@@ -1,234 +1,221 @@
-import urllib
+import asyncio
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
 
+from django.core.cache import cache
+from django.http import FileResponse, Http404, JsonResponse
 from django.shortcuts import render
-import matplotlib.pyplot as plt
-import io
-from io import BytesIO
-import base64
-import numpy as np
-import pandas as pd
-import requests
-import plotly.graph_objects as go
-import plotly.express as px
-import datetime as dt
-import os
-from dateutil.relativedelta import relativedelta
-import apimoex
-import logging
-
-class MoexAPI:
-    ISS_URL = 'https://iss.moex.com/iss/'
-
-    @staticmethod
-    def download_history_data(ticker, timeframe, start, end, columns, market='shares', engine='stock'):
-        with requests.Session() as session:
-            try:
-                data = apimoex.get_market_candles(session, ticker, timeframe, start, end,
-                                                  columns, market, engine)
-            except Exception as e:
-                data = []
-                logging.exception(e)
-        return data
-
-    @classmethod
-    def query(cls, request_url: str, arguments=None):
-        if arguments is None:
-            arguments = {}
-        with requests.Session() as session:
-            try:
-                iss = apimoex.ISSClient(session, cls.ISS_URL + request_url, arguments)
-                response = iss.get()
-            except Exception as e:
-                data = []
-                logging.exception(e)
-        return response
-
-
-class FinTimeSeries:
-
-    STD_COLUMNS = ('begin', 'open', 'high', 'low', 'close', 'volume')
-
-    def __init__(self, ticker, timeframe, start, end):
-        data = MoexAPI.download_history_data(ticker, timeframe, start, end, self.STD_COLUMNS)
-        self.data = pd.DataFrame(data)
-        self.ticker = ticker
-        self.timeframe = timeframe
-        self.start = start
-        self.end = end
-
-    @classmethod
-    def from_trade_days(cls, ticker, num_last_days, timeframe=24, curr_date=dt.date.today(), include_today=False):
-        start = curr_date - relativedelta(days=num_last_days*2)
-        if include_today:
-            end = curr_date
-        else:
-            yesterday = curr_date - dt.timedelta(days=1)
-            end = yesterday
-        year_tm = cls(ticker, 24, str(start), str(end))
-        year_tm.data = year_tm.data.tail(num_last_days)
-        year_tm.data = year_tm.data.reset_index(drop=True)
-        if timeframe != 24:
-            start = year_tm.data['begin'].iloc[0]
-            end = cls.add_delta(year_tm.data['begin'].iloc[-1], delta_duration=1, delta_mode='d')
-            year_tm = cls(ticker, timeframe, start, end)
-        return year_tm
-
-    @classmethod
-    def from_weeks(cls, ticker, num_weeks, timeframe=24, curr_date=dt.date.today()):
-        start = curr_date - dt.timedelta(weeks=num_weeks)
-        end = curr_date
-        return cls(ticker, timeframe, start, end)
-
-    @classmethod
-    def from_months(cls, ticker, num_months, timeframe=24, curr_date=dt.date.today()):
-        start = curr_date - relativedelta(months=num_months)
-        end = curr_date
-        return cls(ticker, timeframe, start, end)
-
-    @classmethod
-    def from_years(cls, ticker, num_years, timeframe=24, curr_date=dt.date.today()):
-        start = curr_date - relativedelta(years=num_years)
-        end = curr_date
-        return cls(ticker, timeframe, start, end)
-
-    @classmethod
-    def from_last(cls, ticker, period_type, period_num, timeframe, curr_date=dt.date.today()):
-        if period_type == 'd':
-            return cls.from_trade_days(ticker, period_num, timeframe, curr_date)
-        elif period_type == 'w':
-            return cls.from_weeks(ticker, period_num, timeframe, curr_date)
-        elif period_type == 'm':
-            return cls.from_months(ticker, period_num, timeframe, curr_date)
-        elif period_type == 'y':
-            return cls.from_years(ticker, period_num, timeframe, curr_date)
-        else:
-            return cls.from_trade_days(ticker, period_num, timeframe, curr_date)
-
-    def column(self, name):
-        return self.data[name]
-
-    def columns(self, column_names):
-        return self.data[column_names]
-
-    def candle_chart(self, without_slider=True):
-        fig = go.Figure(data=[go.Candlestick(x=self.data['begin'],
-                                             open=self.data['open'],
-                                             high=self.data['high'],
-                                             low=self.data['low'],
-                                             close=self.data['close'])])
-        if without_slider:
-            fig.update_layout(xaxis_rangeslider_visible=False)
-        # fig.show()
-        return fig
-
-    def line_chart(self, column='close', with_slider=False):
-        fig = px.line(self.data, x='begin', y=column)
-        if with_slider:
-            fig.update_xaxes(rangeslider_visible=True)
-        fig.show()
-
-    def mean(self, column='close'):
-        return self.data[column].mean()
-
-    def var(self, column='close'):
-        return self.data[column].var()
-
-    def median(self, column='close'):
-        return self.data[column].median()
-
-    def std(self, column='close'):
-        return self.data[column].std()
-
-    def corr(self, columns=STD_COLUMNS):
-        if len(columns) == 2:
-            df_column1 = self.data[columns[0]]
-            df_column2 = self.data[columns[1]]
-            return df_column1.corr(df_column2)
-        elif len(columns) > 2:
-            df = self.data[list(columns)]
-            return df.corr()
-        else:
-            return None
-
-    def export_csv(self):
-        project_dir = os.path.dirname(os.path.dirname(__file__))
-        filename = "out_"+dt.datetime.now().strftime("%d.%m.%Y_%H.%M.%S")+'.csv'
-        path = os.path.join(project_dir, 'data', 'export', filename)
-        self.data.to_csv(path, index=False)
-        return path
-
-    def export_xlsx(self):
-        project_dir = os.path.dirname(os.path.dirname(__file__))
-        filename = "out_"+dt.datetime.now().strftime("%d.%m.%Y_%H.%M.%S")+'.xlsx'
-        path = os.path.join(project_dir, 'data', 'export', filename)
-        self.data.to_excel(path, index=False)
-        return path
-
-    def has_nulls(self):
-        return self.nulls_count() > 0
-
-    def nulls_count(self, by_columns=False):
-        if by_columns:
-            return dict(self.data.isna().sum())
-        else:
-            return self.data.isna().sum().sum()
-
-    def fill_na(self, method='bfill'):
-        self.data.fillna(method=method, inplace=True)
-
-    def drop_na(self):
-        self.data.dropna(inplace=True)
-
-    def is_empty(self):
-        return self.data.empty
-
-    @staticmethod
-    def add_delta(date: str, delta_duration, delta_mode='d', sub=False):
-        if delta_mode == 'd':
-            delta = dt.timedelta(days=delta_duration)
-        elif delta_mode == 'w':
-            delta = dt.timedelta(weeks=delta_duration)
-        elif delta_mode == 'm':
-            delta = relativedelta(months=delta_duration)
-        elif delta_mode == 'y':
-            delta = relativedelta(years=delta_duration)
-        else:
-            delta = dt.timedelta(days=delta_duration)
-        dt_date = dt.date.fromisoformat(date.split(' ')[0])
-        if not sub:
-            date = dt_date + delta
-        else:
-            date = dt_date - delta
-        return str(date)
-
-    @staticmethod
-    def transform_timeframe_for_api(timeframe):
-        if timeframe == 'd':
-            return 24
-        elif timeframe == 'w':
-            return 7
-        elif timeframe == 'm':
-            return 31
-        elif timeframe == 'h':
-            return 60
-        elif timeframe == '10min':
-            return 10
-        elif timeframe == '1min':
-            return 1
-        else:
-            return 24
-
-    def __str__(self):
-        return self.data.to_string()
-
-    def __len__(self):
-        return len(self.data['begin'])
-
-
-def index(request):
-    ts = FinTimeSeries('SBER', 24, '2021.05.01', '2021.06.30')
-    fig = ts.candle_chart()
-    chart = fig.to_html()
-
-    context = {'chart': chart}
+
+# Имена спарклайнов и статики содержат хеш содержимого, поэтому их можно кэшировать навсегда
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+# Сколько лет истории брать для оценки портфеля по умолчанию
+PORTFOLIO_YEARS = 3
+# Минимум свечей с торгами, чтобы акция попала в портфель
+PORTFOLIO_MIN_HISTORY = 60
+
+# Сценариев Монте-Карло для VaR по умолчанию и максимум на один запрос
+RISK_PATHS = 100000
+RISK_MAX_PATHS = 1000000
+
+# Сериализация Plotly нагружает процессор, она идёт в отдельных потоках, не блокируя цикл событий
+CHART_WORKERS = 4
+_chart_executor = None
+
+
+def __getattr__(name):
+    # Старый путь импорта moexplot.views.FinTimeSeries / MoexAPI,
+    # модуль при этом не тянет pandas и apimoex при загрузке urls
+    if name == 'FinTimeSeries':
+        from .timeseries import FinTimeSeries
+        return FinTimeSeries
+    if name == 'MoexAPI':
+        from .moex import MoexAPI
+        return MoexAPI
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _chart_html(ticker, timeframe, start, end, data):
+    import pandas as pd
+    from .assets import plotly_name
+    from .timeseries import FinTimeSeries
+
+    ts = FinTimeSeries.from_frame(ticker, timeframe, start, end, pd.DataFrame(data))
+    # Только div с данными графика, plotly.js страница грузит отдельным кэшируемым файлом
+    return ts.candle_chart().to_html(full_html=False, include_plotlyjs=False), plotly_name()
+
+
+async def index(request):
+    from .async_moex import AsyncMoexAPI
+    from .timeseries import FinTimeSeries
+
+    global _chart_executor
+    if _chart_executor is None:
+        _chart_executor = ThreadPoolExecutor(CHART_WORKERS, thread_name_prefix='chart')
+    ticker, timeframe, start, end = 'SBER', 24, '2021.05.01', '2021.06.30'
+    data = await AsyncMoexAPI.download_history_data(ticker, timeframe, start, end, FinTimeSeries.STD_COLUMNS)
+    chart, plotly = await asyncio.get_running_loop().run_in_executor(
+        _chart_executor, _chart_html, ticker, timeframe, start, end, data)
+
+    context = {'chart': chart, 'plotly': plotly}
     return render(request, 'index.html', context)
+
+
+def shares(request):
+    from db.models import Share
+    from .sparklines import read_manifest
+
+    manifest = read_manifest()
+    rows = [{'ticker': ticker, 'name': name, 'sparkline': manifest.get(ticker)}
+            for ticker, name in Share.objects.order_by('ticker').values_list('ticker', 'name')]
+    return render(request, 'shares.html', {'shares': rows})
+
+
+def sparkline(request, name):
+    from .sparklines import sparkline_root
+
+    try:
+        f = open(sparkline_root() / name, 'rb')
+    except FileNotFoundError:
+        raise Http404(name)
+    response = FileResponse(f, content_type='image/svg+xml' if name.endswith('.svg') else 'image/png')
+    response['Cache-Control'] = IMMUTABLE_CACHE
+    return response
+
+
+def asset(request, name):
+    from .assets import negotiate
+
+    path, encoding, content_type = negotiate(name, request.headers.get('Accept-Encoding', ''))
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        raise Http404(name)
+    response = FileResponse(f, content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = IMMUTABLE_CACHE
+    return response
+
+
+def market(request):
+    from .market import market_overview
+
+    return render(request, 'market.html', {'shares': market_overview()})
+
+
+def market_api(request):
+    from .market import market_overview
+
+    return JsonResponse({'shares': market_overview()})
+
+
+def screener(request):
+    from .screener import run_screen
+
+    expression = request.GET.get('q', '').strip()
+    if not expression:
+        return JsonResponse({'error': 'Пустое выражение'}, status=400)
+    try:
+        date = dt.date.fromisoformat(request.GET['date']) if 'date' in request.GET else None
+        date, rows = run_screen(expression, date)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'expression': expression, 'date': date, 'shares': rows})
+
+
+def risk(request):
+    from .risk import portfolio_risk
+
+    try:
+        positions = {}
+        for item in request.GET.get('positions', '').upper().split(','):
+            if item:
+                ticker, _, quantity = item.partition(':')
+                positions[ticker] = float(quantity)
+        if not positions:
+            raise ValueError('Пустой портфель: positions=SBER:10,GAZP:100')
+        date = dt.date.fromisoformat(request.GET['date']) if 'date' in request.GET else None
+        confidence = float(request.GET.get('confidence', 0.99))
+        horizon = int(request.GET.get('horizon', 1))
+        paths = min(int(request.GET.get('paths', RISK_PATHS)), RISK_MAX_PATHS)
+        if not 0.5 <= confidence < 1 or horizon < 1 or paths < 100:
+            raise ValueError('Недопустимые confidence, horizon или paths')
+        # Пул процессов из веб-воркера не запускаю
+        result = portfolio_risk(positions, date, confidence, horizon, paths, processes=1)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(result)
+
+
+def _portfolio_point(weights, tickers, mu, cov, risk_free):
+    from . import portfolio as optimizer
+
+    ret, vol, sharpe = optimizer.stats(weights, mu, cov, risk_free)
+    return {
+        'return': float(ret[0]),
+        'volatility': float(vol[0]),
+        'sharpe': float(sharpe[0]),
+        'weights': {ticker: round(float(w), 6) for ticker, w in zip(tickers, weights) if w > 1e-6},
+    }
+
+
+def _portfolio_estimate(tickers, start, end):
+    import numpy as np
+    from db.models import Share
+    from . import portfolio as optimizer
+    from .matrix import MarketMatrix
+
+    key = 'portfolio:%s:%s:%s' % (','.join(sorted(tickers)), start, end)
+    estimate = cache.get(key)
+    if estimate is None:
+        shares = Share.objects.all()
+        if tickers:
+            shares = shares.filter(ticker__in=tickers)
+        matrix = MarketMatrix.from_db(shares.order_by('ticker'), start, end)
+        returns = matrix.returns()
+        # Свечи до начала торгов акцией не считаются нулевой доходностью
+        returns[np.isnan(matrix['close'])] = np.nan
+        enough = np.isfinite(returns).sum(axis=1) >= PORTFOLIO_MIN_HISTORY
+        mu, cov = optimizer.estimate(returns[enough])
+        estimate = ([t for t, ok in zip(matrix.tickers, enough) if ok], mu, cov)
+        cache.set(key, estimate, 600)
+    return estimate
+
+
+def portfolio(request):
+    from dateutil.relativedelta import relativedelta
+    from . import portfolio as optimizer
+
+    try:
+        tickers = [t for t in request.GET.get('tickers', '').upper().split(',') if t]
+        end = dt.date.fromisoformat(request.GET['end']) if 'end' in request.GET else dt.date.today()
+        start = (dt.date.fromisoformat(request.GET['start']) if 'start' in request.GET
+                 else end - relativedelta(years=PORTFOLIO_YEARS))
+        lower = float(request.GET.get('min_weight', 0.0))
+        upper = float(request.GET.get('max_weight', 1.0))
+        risk_free = float(request.GET.get('risk_free', 0.0))
+        points = min(int(request.GET.get('points', 30)), 100)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    tickers, mu, cov = _portfolio_estimate(tickers, start, end)
+    if not tickers:
+        return JsonResponse({'error': 'Недостаточно истории котировок'}, status=404)
+    if not (len(tickers) * lower <= 1.0 <= len(tickers) * upper) or points < 2:
+        return JsonResponse({'error': 'Ограничения на веса невыполнимы'}, status=400)
+
+    frontier = optimizer.efficient_frontier(mu, cov, points, lower, upper)
+    min_variance = optimizer.min_variance(mu, cov, lower, upper)
+    max_sharpe = optimizer.max_sharpe(mu, cov, risk_free, lower, upper, frontier)
+    ret, vol, sharpe = optimizer.stats(frontier[1], mu, cov, risk_free)
+    return JsonResponse({
+        'tickers': tickers,
+        'start': str(start),
+        'end': str(end),
+        'min_variance': _portfolio_point(min_variance, tickers, mu, cov, risk_free),
+        'max_sharpe': _portfolio_point(max_sharpe, tickers, mu, cov, risk_free),
+        'frontier': [{'return': float(r), 'volatility': float(v), 'sharpe': float(s)}
+                     for r, v, s in zip(ret, vol, sharpe)],
+    })
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'moexplot.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -131,6 +132,25 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Статика с хешем в имени и её сжатые варианты, например бандл plotly.js, см. manage.py build_assets
+ASSET_ROOT = BASE_DIR / 'data' / 'assets'
+
+# Спарклайны акций, см. manage.py render_sparklines
+SPARKLINE_ROOT = BASE_DIR / 'data' / 'sparklines'
+
+# Parquet-архив свечей для аналитических запросов, см. manage.py export_archive
+ARCHIVE_ROOT = BASE_DIR / 'data' / 'archive'
+
+# Хранилище сделок по дням, см. manage.py load_ticks
+TICK_ROOT = BASE_DIR / 'data' / 'ticks'
+
+# Сработавшие уведомления о ценах и их доставка: класс, экземпляр вызывается со списком moexplot.alerts.Trigger
+ALERT_ROOT = BASE_DIR / 'data' / 'alerts'
+ALERT_SINK = 'moexplot.alerts.JsonlSink'
+
+# Блокировки и результаты склеенных запросов к ISS, общие для процессов-воркеров
+SINGLEFLIGHT_ROOT = BASE_DIR / 'data' / 'singleflight'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -14,7 +14,7 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import path, re_path
 
 from moexplot import views
 
@@ -22,4 +22,12 @@ from moexplot import views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.index, name='home'),
+    path('api/portfolio/', views.portfolio, name='portfolio'),
+    path('shares/', views.shares, name='shares'),
+    path('market/', views.market, name='market'),
+    path('api/market/', views.market_api, name='market_api'),
+    path('api/screener/', views.screener, name='screener'),
+    path('api/risk/', views.risk, name='risk'),
+    re_path(r'^sparklines/(?P<name>[\w.-]+-[0-9a-f]{16}\.(?:png|svg))$', views.sparkline, name='sparkline'),
+    re_path(r'^assets/(?P<name>[\w.-]+-[0-9a-f]{16}\.min\.(?:js|css))$', views.asset, name='asset'),
 ]